@@ -1,15 +1,15 @@
 """
 Orders Application - Backend Package
 """
-from flask import Flask
+from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from config import config
-import logging
+from app.routing import RoutingSession
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
 
 def create_app(config_name='default'):
@@ -20,18 +20,64 @@ def create_app(config_name='default'):
     app.config.from_object(config[config_name])
     
     # Initialize extensions
+    from app.database import prepare_engine_options, init_engine_events
+    prepare_engine_options(app)
     db.init_app(app)
+    init_engine_events(app)
+    
+    # Configure logging (queued, optionally JSON, with per-request ids)
+    from app.logs import configure_logging, init_request_logging
+    configure_logging(app)
+    init_request_logging(app)
+    
+    # Request, query and pool metrics (registered first so every request is counted)
+    from app.prometheus import init_prometheus
+    from app.querytrace import init_query_tracing
+    init_prometheus(app)
+    init_query_tracing(app)
+    
+    from app.profiling import init_profiling
+    init_profiling(app)
+    
+    # Shed low-priority requests under overload (shed requests are still logged and counted)
+    from app.middleware.load_shedding import init_load_shedding
+    init_load_shedding(app)
+    
+    from app.routing import init_replica_routing
+    from app.sharding import init_sharding
+    init_replica_routing(app)
+    init_sharding(app)
     jwt.init_app(app)
     CORS(app)
     
-    # Configure logging
-    logging.basicConfig(
-        level=app.config['LOG_LEVEL'],
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
+    # Initialize services
+    from app.services.cart_store import init_cart_store
+    from app.services.inventory import init_inventory
+    from app.services.admission import init_admission
+    init_cart_store(app)
+    init_inventory(app)
+    init_admission(app)
+    
+    from app.readiness import init_readiness
+    init_readiness(app)
+    
+    # HTTP caching policy and response compression
+    from app.middleware.conditional import init_cache_control
+    from app.middleware.compression import init_compression
+    from app.middleware.coalescing import init_coalescing
+    init_cache_control(app)
+    init_compression(app)
+    init_coalescing(app)
+    
+    # Sparse fieldset errors (``?fields=``) are client errors
+    from app.serializers import InvalidFields
+    
+    @app.errorhandler(InvalidFields)
+    def handle_invalid_fields(e):
+        return jsonify({'error': e.description}), 400
     
     # Register blueprints
-    from app.routes import auth, products, cart, orders, admin, health
+    from app.routes import auth, products, cart, orders, admin, health, batch
     
     app.register_blueprint(auth.bp)
     app.register_blueprint(products.bp)
@@ -39,5 +85,6 @@ def create_app(config_name='default'):
     app.register_blueprint(orders.bp)
     app.register_blueprint(admin.bp)
     app.register_blueprint(health.bp)
+    app.register_blueprint(batch.bp)
     
     return app
@@ -0,0 +1,98 @@
+"""
+Database engine setup - Pool options and SQLite connection pragmas
+
+``SQLALCHEMY_ENGINE_OPTIONS`` carries the pool settings from the environment.
+Every SQLite engine additionally gets a connect hook that applies
+``SQLITE_PRAGMAS`` (WAL journal, ``synchronous=NORMAL``, ``busy_timeout``,
+cache and mmap sizes) so concurrent writers wait instead of failing with
+"database is locked" and commits do not fsync on every transaction. SQLite
+replica binds are also opened with ``query_only``.
+"""
+import re
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from app import db
+from app.prometheus import DB_POOL_WAIT
+from app.routing import REPLICA_BIND_PREFIX
+
+# Only valid for QueuePool; in-memory SQLite uses a single static connection
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+_PRAGMA_VALUE = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+
+def _is_memory_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout takes (waiting for or opening a connection)"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def prepare_engine_options(app):
+    """
+    Drop pool options the configured database cannot use and time pool
+    checkouts on pooled engines (call before ``db.init_app``)
+    """
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if _is_memory_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        for name in QUEUE_POOL_OPTIONS:
+            options.pop(name, None)
+    else:
+        options.setdefault('poolclass', TimedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """Run ``PRAGMA name=value`` for every configured pragma on a raw connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            if value in (None, ''):
+                continue
+            value = str(value)
+            if not _PRAGMA_VALUE.match(value):
+                raise ValueError(f"Invalid value for SQLite pragma {name}: {value!r}")
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def init_engine_events(app):
+    """Register the SQLite pragma hook on the app's SQLite engines (call after ``db.init_app``)"""
+    pragmas = {
+        name: value for name, value in app.config.get('SQLITE_PRAGMAS', {}).items()
+        if value not in (None, '')
+    }
+    if not pragmas:
+        return
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            _listen_pragmas(engine, _engine_pragmas(key, pragmas))
+
+
+def _engine_pragmas(bind_key, pragmas):
+    # Replicas must never be written to; make a routing mistake fail loudly
+    if bind_key is not None and bind_key.startswith(REPLICA_BIND_PREFIX):
+        return {**pragmas, 'query_only': 'ON'}
+    return pragmas
+
+
+def _listen_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
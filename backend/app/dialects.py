@@ -0,0 +1,115 @@
+"""
+Dialect fast paths - PostgreSQL-specific implementations with portable fallbacks
+
+SQLite stays the default for development and tests; on PostgreSQL these
+helpers use ``COPY`` for bulk loads and keep serial sequences ahead of
+explicitly assigned ids. ``FOR UPDATE SKIP LOCKED`` and server-side cursors
+are expressed through SQLAlchemy (``with_for_update(skip_locked=True)``,
+``stream_results``) and are simply not rendered on SQLite.
+"""
+import csv
+import io
+from contextlib import contextmanager
+
+# NULL marker used in COPY ... CSV data (an empty unquoted field would be ambiguous)
+COPY_NULL = r'\N'
+
+
+def is_postgresql(bind):
+    """True if ``bind`` (engine, connection or session bind) talks to PostgreSQL"""
+    return bind.dialect.name == 'postgresql'
+
+
+def _with_defaults(table, rows):
+    """Fill Python-side column defaults that an INSERT would apply but COPY does not"""
+    columns = list(rows[0])
+    defaults = {}
+    for column in table.columns:
+        if column.name in columns or column.default is None or column.server_default is not None:
+            continue
+        if column.default.is_scalar:
+            defaults[column.name] = column.default.arg
+        elif column.default.is_callable:
+            defaults[column.name] = column.default.arg(None)
+    if not defaults:
+        return columns, rows
+    return columns + list(defaults), [{**row, **defaults} for row in rows]
+
+
+def _copy_value(value):
+    return COPY_NULL if value is None else value
+
+
+def _copy_rows(connection, table, rows):
+    columns, rows = _with_defaults(table, rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row.get(column)) for column in columns])
+    buffer.seek(0)
+
+    preparer = connection.dialect.identifier_preparer
+    statement = "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '{}')".format(
+        preparer.format_table(table), ', '.join(preparer.quote(column) for column in columns), COPY_NULL
+    )
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+
+
+def sync_sequence(connection, table, column='id'):
+    """Move a PostgreSQL serial sequence past ids that were inserted explicitly"""
+    if not is_postgresql(connection):
+        return
+    sequence = connection.exec_driver_sql(
+        "SELECT pg_get_serial_sequence(%(table)s, %(column)s)", {'table': table.name, 'column': column}
+    ).scalar()
+    if sequence:
+        preparer = connection.dialect.identifier_preparer
+        connection.exec_driver_sql(
+            f"SELECT setval(%(sequence)s, GREATEST((SELECT COALESCE(MAX({preparer.quote(column)}), 1) "
+            f"FROM {preparer.format_table(table)}), (SELECT last_value FROM {sequence})))",
+            {'sequence': sequence}
+        )
+
+
+def bulk_insert(connection, table, rows):
+    """
+    Insert many rows (dicts with the same keys) on ``connection``.
+
+    Uses ``COPY ... FROM STDIN`` on PostgreSQL and an executemany INSERT
+    elsewhere. Returns the number of rows inserted.
+    """
+    if not rows:
+        return 0
+
+    if is_postgresql(connection):
+        _copy_rows(connection, table, rows)
+        if 'id' in rows[0]:
+            sync_sequence(connection, table)
+    else:
+        connection.execute(table.insert(), rows)
+    return len(rows)
+
+
+@contextmanager
+def advisory_lock(engine, key):
+    """
+    Hold a PostgreSQL session advisory lock while the block runs.
+
+    Serializes one-shot tasks (e.g. schema creation) across processes and
+    pods. A no-op on other databases.
+    """
+    if not is_postgresql(engine):
+        yield
+        return
+
+    with engine.connect() as connection:
+        connection.exec_driver_sql("SELECT pg_advisory_lock(%(key)s)", {'key': key})
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql("SELECT pg_advisory_unlock(%(key)s)", {'key': key})
+            connection.commit()
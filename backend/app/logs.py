@@ -0,0 +1,204 @@
+"""
+Logging pipeline - Non-blocking, structured, sampled
+
+Request threads only put records on a bounded queue; a ``QueueListener``
+thread formats and writes them. When the queue is full records are dropped
+and counted (``log_records_dropped_total``) instead of blocking the request.
+Records are formatted on the listener thread, so ``logger.info("... %s",
+value)`` arguments are only rendered if the record is actually written.
+
+With ``LOG_FORMAT=json`` every record is one JSON object carrying the
+request id (``X-Request-ID``, generated if the client sends none), user id,
+endpoint and method; the per-request summary record (``app.requests``) adds
+status, latency and SQL query count. ``LOG_SAMPLE_RATES`` keeps only a
+fraction of the INFO records of chatty loggers (cart changes, logins);
+warnings and errors are never sampled.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+
+from app.prometheus import registry
+from app.querytrace import current_recorder
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+LOG_RECORDS_DROPPED = registry.counter('log_records_dropped', 'Log records dropped because the log queue was full')
+
+request_logger = logging.getLogger('app.requests')
+
+# LogRecord attributes that are not user-supplied ``extra`` fields
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def _current_identity():
+    # Only set once the view verified a token; never verifies one itself
+    try:
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request's id, user, endpoint and method to records"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.user_id = _current_identity()
+            record.endpoint = request.endpoint
+            record.method = request.method
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a ``rate`` fraction of INFO-and-below records from the configured loggers"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        name = record.name
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return random.random() < rate
+            name = name.rpartition('.')[0]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, context and ``extra`` fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Stopping waits for room instead of failing on a full queue
+        self.queue.put(self._sentinel)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks: records are dropped (and counted) when
+    the queue is full. Owns the listener thread and restarts it after a fork.
+    """
+
+    def __init__(self, handlers, maxsize=10000):
+        self.maxsize = maxsize
+        self.handlers = handlers
+        self.dropped = 0
+        self._listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+        super().__init__(queue.Queue(maxsize))
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            if self._listener_pid is not None:
+                # Forked: the parent's queue and listener thread are not ours
+                self.queue = queue.Queue(self.maxsize)
+            self._listener = _Listener(self.queue, *self.handlers, respect_handler_level=True)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread; the record is not pickled
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+    def stop(self):
+        """Flush queued records and stop the listener (this process only)"""
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener_pid = None
+
+
+def configure_logging(app):
+    """Route the root logger through the queue pipeline (replaces any earlier setup by this function)"""
+    stream = logging.StreamHandler(sys.stdout)
+    if app.config['LOG_FORMAT'] == 'json':
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    handler = DroppingQueueHandler([stream], maxsize=app.config['LOG_QUEUE_SIZE'])
+    handler.addFilter(SamplingFilter(app.config['LOG_SAMPLE_RATES']))
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for previous in [h for h in root.handlers if isinstance(h, DroppingQueueHandler)]:
+        root.removeHandler(previous)
+        previous.stop()
+    root.addHandler(handler)
+    root.setLevel(app.config['LOG_LEVEL'])
+    atexit.register(handler.stop)
+    return handler
+
+
+def init_request_logging(app):
+    """Assign request ids and log one summary record per request"""
+    log_requests = app.config['LOG_REQUESTS']
+
+    @app.before_request
+    def assign_request_id():
+        g.request_start = time.perf_counter()
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+
+    @app.after_request
+    def log_request(response):
+        request_id = g.get('request_id')
+        if request_id is None:
+            return response
+        response.headers[REQUEST_ID_HEADER] = request_id
+
+        if log_requests and request_logger.isEnabledFor(logging.INFO):
+            recorder = current_recorder()
+            request_logger.info(
+                "%s %s %s", request.method, request.path, response.status_code,
+                extra={
+                    'status': response.status_code,
+                    'latency_ms': round((time.perf_counter() - g.request_start) * 1000, 3),
+                    'queries': recorder.count if recorder is not None else None
+                }
+            )
+        return response
@@ -2,18 +2,52 @@
 Authentication Middleware
 """
 from functools import wraps
-from flask import jsonify
+from flask import g, jsonify, request
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
 from app.models.user import User
 from app import db
 
+# ``g`` attributes where flask_jwt_extended keeps the request's verified token
+JWT_CONTEXT = ('_jwt_extended_jwt', '_jwt_extended_jwt_header', '_jwt_extended_jwt_user', '_jwt_extended_jwt_location')
+
+# WSGI environ key marking an in-process sub-request whose token was verified by its parent (batch items)
+VERIFIED_TOKEN = 'orders.verified_token'
+
+
+def verified_token():
+    """The current request's verified token and user, to hand to in-process sub-requests (None without one)"""
+    if not g.get('_jwt_extended_jwt'):
+        return None
+    return {name: g.get(name) for name in JWT_CONTEXT}, db.session.get(User, get_jwt_identity())
+
+
+def use_verified_token(token):
+    """Run the current sub-request (its environ has ``VERIFIED_TOKEN``) as the ``verified_token()`` user"""
+    context, user = token
+    for name, value in context.items():
+        setattr(g, name, value)
+    # Attached to this request's session without a query
+    g.verified_user = db.session.merge(user, load=False) if user is not None else None
+
+
+def verify_token():
+    """``verify_jwt_in_request()``, unless the parent request already verified this sub-request's token"""
+    if not request.environ.get(VERIFIED_TOKEN):
+        verify_jwt_in_request()
+
+
+def _load_user():
+    if request.environ.get(VERIFIED_TOKEN):
+        return g.verified_user
+    return db.session.get(User, get_jwt_identity())
+
 
 def token_required(fn):
     """Decorator to require valid JWT token"""
     @wraps(fn)
     def wrapper(*args, **kwargs):
         try:
-            verify_jwt_in_request()
+            verify_token()
             return fn(*args, **kwargs)
         except Exception as e:
             return jsonify({'error': 'Invalid or missing token', 'message': str(e)}), 401
@@ -25,9 +59,8 @@ def admin_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
         try:
-            verify_jwt_in_request()
-            user_id = get_jwt_identity()
-            user = db.session.get(User, user_id)
+            verify_token()
+            user = _load_user()
             
             if not user:
                 return jsonify({'error': 'User not found'}), 404
@@ -44,8 +77,7 @@ def admin_required(fn):
 def get_current_user():
     """Get current authenticated user"""
     try:
-        verify_jwt_in_request()
-        user_id = get_jwt_identity()
-        return db.session.get(User, user_id)
+        verify_token()
+        return _load_user()
     except:
         return None
@@ -0,0 +1,128 @@
+"""
+Request Coalescing - Single-flight execution of identical concurrent reads
+
+When a burst of identical GETs misses the response cache (first request after
+a catalog change, an evicted entry), each would run the same query and
+serialization. Views decorated with ``@conditional(..., coalesce=True)`` run
+through a ``SingleFlight`` keyed by the response's ETag instead: the first
+request (the leader) runs the view and the others wait for it and share its
+status, body bytes and mimetype. An exception raised by the leader is raised
+in every waiter as well.
+
+A waiter gives up after ``COALESCE_TIMEOUT`` seconds and runs the view
+itself, so a stuck leader delays requests but never fails them. Counts per
+request path are kept for the last ``COALESCE_STATS_KEYS`` paths
+(``GET /api/admin/metrics``) and in ``request_coalescing_total``.
+"""
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from app.prometheus import registry
+
+COALESCED_REQUESTS = registry.counter(
+    'request_coalescing', 'Coalesced read requests by role', ('result',))
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """At most one in-flight call per key; concurrent callers of the same key share its outcome"""
+
+    def __init__(self, timeout=5.0, max_stats_keys=256):
+        self.timeout = timeout
+        self.max_stats_keys = max_stats_keys
+        self._calls = {}
+        self._stats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, label, result, amount=1):
+        # Called with the lock held
+        stats = self._stats.get(label)
+        if stats is None:
+            stats = self._stats[label] = {'leaders': 0, 'followers': 0, 'timeouts': 0, 'errors': 0, 'max_waiters': 0}
+            while len(self._stats) > self.max_stats_keys:
+                self._stats.popitem(last=False)
+        self._stats.move_to_end(label)
+        stats[result] += amount
+        return stats
+
+    def do(self, key, fn, label=None):
+        """Return ``fn()``, sharing one execution among concurrent callers with the same ``key``"""
+        label = label or key
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._count(label, 'leaders')
+            else:
+                call.waiters += 1
+                stats = self._count(label, 'followers')
+                stats['max_waiters'] = max(stats['max_waiters'], call.waiters)
+        COALESCED_REQUESTS.inc(result='leader' if leader else 'follower')
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self._count(label, 'errors')
+                COALESCED_REQUESTS.inc(result='error')
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(self.timeout):
+            with self._lock:
+                self._count(label, 'timeouts')
+            COALESCED_REQUESTS.inc(result='timeout')
+            return fn()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    @property
+    def in_flight(self):
+        return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            keys = {label: dict(stats) for label, stats in self._stats.items()}
+        return {
+            'in_flight': self.in_flight,
+            'timeout': self.timeout,
+            'leaders': sum(stats['leaders'] for stats in keys.values()),
+            'followers': sum(stats['followers'] for stats in keys.values()),
+            'timeouts': sum(stats['timeouts'] for stats in keys.values()),
+            'errors': sum(stats['errors'] for stats in keys.values()),
+            'keys': keys
+        }
+
+
+def init_coalescing(app):
+    """Register the single-flight group used by ``@conditional(..., coalesce=True)`` views"""
+    flight = None
+    if app.config['REQUEST_COALESCING']:
+        flight = SingleFlight(timeout=app.config['COALESCE_TIMEOUT'],
+                              max_stats_keys=app.config['COALESCE_STATS_KEYS'])
+    app.extensions['single_flight'] = flight
+    return flight
+
+
+def get_single_flight():
+    """Return the single-flight group for the current app (None when coalescing is off)"""
+    return current_app.extensions.get('single_flight')
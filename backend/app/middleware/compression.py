@@ -0,0 +1,191 @@
+"""
+Compression Middleware - Negotiated gzip / brotli response compression
+
+Responses with a compressible mimetype and a body of at least
+``COMPRESSION_MIN_SIZE`` bytes are compressed with the best encoding the
+client accepts (brotli when the ``brotli`` package is installed, else gzip).
+Streamed responses are compressed chunk by chunk.
+
+Responses held in the ``ResponseCache`` (keyed by their ETag) keep one
+compressed copy per encoding, so repeated hits on hot catalog pages are
+served without compressing again. Compression time is recorded in the
+``compression_seconds`` histogram on ``GET /metrics``.
+"""
+import gzip
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from flask import request
+from app.prometheus import CACHE_REQUESTS, COMPRESSION_TIME
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+def available_encodings():
+    """Encodings this process can produce, in order of preference"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, level):
+    """Compress a whole body"""
+    start = time.perf_counter()
+    if encoding == 'br':
+        data = brotli.compress(data, quality=level)
+    else:
+        data = gzip.compress(data, compresslevel=level, mtime=0)
+    COMPRESSION_TIME.observe(time.perf_counter() - start, encoding=encoding, streamed='false')
+    return data
+
+
+def compress_stream(chunks, encoding, level):
+    """Compress an iterable of chunks incrementally"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+
+    elapsed = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            start = time.perf_counter()
+            data = process(chunk)
+            elapsed += time.perf_counter() - start
+            if data:
+                yield data
+        start = time.perf_counter()
+        data = finish()
+        elapsed += time.perf_counter() - start
+        yield data
+    finally:
+        COMPRESSION_TIME.observe(elapsed, encoding=encoding, streamed='true')
+
+
+class CachedResponse:
+    """A cached response body plus its compressed variants"""
+
+    __slots__ = ('body', 'mimetype', 'variants')
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.variants = {}
+
+
+class ResponseCache:
+    """Bounded LRU of response bodies keyed by ETag"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                CACHE_REQUESTS.inc(result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_REQUESTS.inc(result='hit')
+            return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def peek(self, key):
+        """Look up an entry without touching LRU order or hit counters"""
+        return self._entries.get(key)
+
+    def put(self, key, body, mimetype):
+        if self.max_entries <= 0:
+            return None
+        entry = CachedResponse(body, mimetype)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def variant(self, entry, encoding, level):
+        """The entry's body compressed with ``encoding``, compressing it on first use"""
+        data = entry.variants.get(encoding)
+        if data is None:
+            data = entry.variants[encoding] = compress(entry.body, encoding, level)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def init_compression(app):
+    """Register the response cache and the compression hook on the app"""
+    cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'])
+    app.extensions['response_cache'] = cache
+
+    if not app.config['COMPRESSION_ENABLED']:
+        return cache
+
+    min_size = app.config['COMPRESSION_MIN_SIZE']
+    mimetypes = {value.strip() for value in app.config['COMPRESSION_MIMETYPES'].split(',') if value.strip()}
+    levels = {'gzip': app.config['COMPRESSION_LEVEL'], 'br': app.config['COMPRESSION_BROTLI_QUALITY']}
+    encodings = available_encodings()
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in mimetypes):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, levels[encoding])
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = encoding
+            return response
+
+        etag, _ = response.get_etag()
+        entry = cache.peek(etag) if etag else None
+        if entry is not None:
+            if len(entry.body) < min_size:
+                return response
+            data = cache.variant(entry, encoding, levels[encoding])
+        else:
+            body = response.get_data()
+            if len(body) < min_size:
+                return response
+            data = compress(body, encoding, levels[encoding])
+
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    return cache
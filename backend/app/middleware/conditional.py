@@ -0,0 +1,142 @@
+"""
+Conditional GET Middleware - ETag / Last-Modified validators and Cache-Control
+
+Read endpoints declare a cheap *validator*: a function returning a version
+tuple built from aggregates such as ``count(*)`` and ``max(updated_at)``, plus
+the resource's last modification time. The ETag is derived from that version,
+never from the response body, so a matching ``If-None-Match`` is answered
+with ``304 Not Modified`` before the view queries or serializes anything.
+"""
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, request, make_response
+from flask_jwt_extended import get_jwt_identity
+from app import db
+from app.middleware.coalescing import get_single_flight
+
+
+def aggregate_version(model, *criteria):
+    """``(count, max(updated_at))`` over the rows of ``model`` matching ``criteria``"""
+    return tuple(db.session.execute(
+        db.select(db.func.count(model.id), db.func.max(model.updated_at)).where(*criteria)
+    ).one())
+
+
+def compute_etag(version):
+    """Weak ETag for a validator version, scoped to the endpoint, arguments and user"""
+    try:
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+
+    key = repr((
+        request.endpoint,
+        sorted(request.view_args.items()) if request.view_args else (),
+        sorted(request.args.items(multi=True)),
+        identity,
+        version
+    ))
+    return hashlib.sha1(key.encode()).hexdigest()[:32]
+
+
+def _http_datetime(value):
+    """Naive UTC datetime from the DB -> aware datetime truncated to HTTP-date precision"""
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _render_shared(fn, args, kwargs, etag, response_cache):
+    """Run the view once for every coalesced request: ``(status, body, mimetype)``"""
+    # A flight that finished just before this one started may have cached the body already
+    entry = response_cache.peek(etag) if response_cache is not None else None
+    if entry is not None:
+        return 200, entry.body, entry.mimetype
+
+    response = make_response(fn(*args, **kwargs))
+    body = response.get_data()
+    if response.status_code == 200 and response_cache is not None:
+        response_cache.put(etag, body, response.mimetype)
+    return response.status_code, body, response.mimetype
+
+
+def conditional(validator, cache=False, coalesce=False):
+    """
+    Decorator adding ETag / Last-Modified handling to a GET view.
+
+    ``validator`` is called with the view arguments and returns
+    ``(version, last_modified)`` or None to skip validation (e.g. not found).
+    With ``cache=True`` the response body is kept in the response cache under
+    its ETag and later requests for the same version skip the view entirely.
+    With ``coalesce=True`` concurrent requests for the same ETag run the view
+    once and share its body (see ``app.middleware.coalescing``); the view must
+    not stream.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            state = validator(*args, **kwargs)
+            if state is None:
+                return fn(*args, **kwargs)
+
+            version, last_modified = state
+            etag = compute_etag(version)
+            last_modified = _http_datetime(last_modified)
+
+            response_cache = current_app.extensions['response_cache'] if cache else None
+            entry = response_cache.get(etag) if response_cache is not None else None
+
+            if _not_modified(etag, last_modified):
+                response = make_response('', 304)
+            elif entry is not None:
+                response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+            elif coalesce and get_single_flight() is not None:
+                status, body, mimetype = get_single_flight().do(
+                    etag, lambda: _render_shared(fn, args, kwargs, etag, response_cache),
+                    label=request.full_path.rstrip('?')
+                )
+                response = current_app.response_class(body, status=status, mimetype=mimetype)
+                if status != 200:
+                    return response
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if response_cache is not None and not response.is_streamed:
+                    response_cache.put(etag, response.get_data(), response.mimetype)
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
+
+
+def init_cache_control(app):
+    """Apply the per-blueprint ``CACHE_CONTROL`` policy to GET responses"""
+    policies = app.config['CACHE_CONTROL']
+
+    @app.after_request
+    def apply_cache_control(response):
+        if request.method not in ('GET', 'HEAD') or response.status_code not in (200, 304):
+            return response
+        if 'Cache-Control' in response.headers:
+            return response
+
+        policy = policies.get(request.blueprint)
+        if policy:
+            response.headers['Cache-Control'] = policy
+            if 'private' in policy or 'no-store' in policy:
+                response.vary.add('Authorization')
+        return response
@@ -0,0 +1,190 @@
+"""
+Load Shedding Middleware - Reject low-priority work early when overloaded
+
+Every request is classified before its view runs:
+
+- ``critical`` (checkout, health probes, ``/metrics``) is never shed here;
+  checkout has its own admission control (``app.services.admission``)
+- ``low`` (catalog browsing, admin exports; GET only) is shed first, once
+  in-flight requests reach ``SHED_LOW_PRIORITY_SHARE`` of the current limit
+  or the request waited in the proxy longer than ``SHED_QUEUE_TIME_MS``
+- ``normal`` (everything else) is shed at the full limit or twice the queue time
+
+The limit adapts to latency (AIMD): each request slower than
+``SHED_LATENCY_TARGET_MS`` shrinks it by 10% down to ``SHED_MIN_IN_FLIGHT``,
+each faster one grows it back towards ``SHED_MAX_IN_FLIGHT``. Queue time is
+read from nginx's ``X-Request-Start: t=<seconds>`` header; with gunicorn's
+gthread workers requests queue before the app sees them, so this is the
+signal that catches a backlog there.
+
+Independently of load, one client (JWT identity, else client IP) may have
+at most ``SHED_USER_MAX_IN_FLIGHT`` non-critical requests in flight.
+Rejections are ``503`` with ``Retry-After`` and counted in
+``requests_shed_total``.
+"""
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from app.prometheus import registry
+
+REQUEST_START_HEADER = 'X-Request-Start'
+
+REQUESTS_SHED = registry.counter(
+    'requests_shed', 'Requests rejected by load shedding', ('priority', 'reason'))
+
+
+def _parse_rules(value):
+    """``"products,admin.export_orders"`` -> set of blueprint or endpoint names"""
+    return {part.strip() for part in value.split(',') if part.strip()}
+
+
+def _matches(rules):
+    return request.endpoint in rules or request.blueprint in rules
+
+
+def queue_time():
+    """Seconds since the proxy received the request, or None without ``X-Request-Start``"""
+    value = request.headers.get(REQUEST_START_HEADER)
+    if not value:
+        return None
+    try:
+        started = float(value.removeprefix('t='))
+    except ValueError:
+        return None
+    return max(time.time() - started, 0.0)
+
+
+def _client_key():
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    if identity is not None:
+        return f'user:{identity}'
+    return f"ip:{request.headers.get('X-Real-IP') or request.remote_addr}"
+
+
+class LoadShedder:
+    """Tracks in-flight requests per process and per client and decides what to shed"""
+
+    def __init__(self, max_in_flight=64, min_in_flight=4, latency_target_ms=500.0, queue_time_ms=1000.0,
+                 low_priority_share=0.5, user_max_in_flight=8, retry_after=1):
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min(min_in_flight, max_in_flight)
+        self.latency_target = latency_target_ms / 1000
+        self.queue_time_target = queue_time_ms / 1000
+        self.low_priority_share = low_priority_share
+        self.user_max_in_flight = user_max_in_flight
+        self.retry_after = retry_after
+        self.limit = float(max_in_flight)
+        self.in_flight = 0
+        self.shed = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _overloaded(self, priority, waited):
+        if priority == 'low':
+            threshold, queue_limit = self.limit * self.low_priority_share, self.queue_time_target
+        else:
+            threshold, queue_limit = self.limit, self.queue_time_target * 2
+        if self.max_in_flight > 0 and self.in_flight >= threshold:
+            return 'concurrency'
+        if waited is not None and self.queue_time_target > 0 and waited > queue_limit:
+            return 'queue_time'
+        return None
+
+    def admit(self, priority, client, waited=None):
+        """Count the request in, or return the reason it is shed"""
+        with self._lock:
+            if priority != 'critical':
+                reason = self._overloaded(priority, waited)
+                if reason is None and self.user_max_in_flight > 0 \
+                        and self._clients.get(client, 0) >= self.user_max_in_flight:
+                    reason = 'user_limit'
+                if reason is not None:
+                    key = f'{priority}:{reason}'
+                    self.shed[key] = self.shed.get(key, 0) + 1
+                    return reason
+                self._clients[client] = self._clients.get(client, 0) + 1
+            self.in_flight += 1
+        return None
+
+    def release(self, priority, client, latency):
+        """Count the request out and adapt the limit to its latency"""
+        with self._lock:
+            self.in_flight -= 1
+            # Critical requests may wait on their own gates (checkout admission); not a latency signal
+            if priority == 'critical':
+                return
+            remaining = self._clients.pop(client, 1) - 1
+            if remaining > 0:
+                self._clients[client] = remaining
+            if self.max_in_flight <= 0:
+                return
+            if latency > self.latency_target:
+                self.limit = max(self.min_in_flight, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_in_flight, self.limit + 1 / self.limit)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'limit': round(self.limit, 2),
+                'max_in_flight': self.max_in_flight,
+                'clients': len(self._clients),
+                'shed': dict(self.shed)
+            }
+
+
+def init_load_shedding(app):
+    """Register the load shedder; runs before the views, after request metrics and logging"""
+    shedder = LoadShedder(
+        max_in_flight=app.config['SHED_MAX_IN_FLIGHT'],
+        min_in_flight=app.config['SHED_MIN_IN_FLIGHT'],
+        latency_target_ms=app.config['SHED_LATENCY_TARGET_MS'],
+        queue_time_ms=app.config['SHED_QUEUE_TIME_MS'],
+        low_priority_share=app.config['SHED_LOW_PRIORITY_SHARE'],
+        user_max_in_flight=app.config['SHED_USER_MAX_IN_FLIGHT'],
+        retry_after=app.config['SHED_RETRY_AFTER']
+    )
+    critical = _parse_rules(app.config['SHED_CRITICAL'])
+    low_priority = _parse_rules(app.config['SHED_LOW_PRIORITY'])
+    app.extensions['load_shedder'] = shedder
+
+    def classify():
+        if request.endpoint is None or _matches(critical):
+            return 'critical'
+        if request.method in ('GET', 'HEAD') and _matches(low_priority):
+            return 'low'
+        return 'normal'
+
+    @app.before_request
+    def shed_load():
+        shedder = get_load_shedder()
+        priority = classify()
+        client = _client_key() if priority != 'critical' else None
+        reason = shedder.admit(priority, client, queue_time())
+        if reason is not None:
+            REQUESTS_SHED.inc(priority=priority, reason=reason)
+            response = jsonify({'error': 'Server is busy, please retry', 'reason': reason})
+            return response, 503, {'Retry-After': str(shedder.retry_after)}
+        g.load_shedding = (priority, client, time.perf_counter())
+
+    @app.teardown_request
+    def release_load(exc):
+        admitted = g.pop('load_shedding', None)
+        if admitted is not None:
+            priority, client, start = admitted
+            get_load_shedder().release(priority, client, time.perf_counter() - start)
+
+    return shedder
+
+
+def get_load_shedder():
+    """Return the load shedder for the current app"""
+    return current_app.extensions['load_shedder']
@@ -3,6 +3,11 @@ Cart Model - Manages shopping cart items
 """
 from datetime import datetime
 from app import db
+from app.models.product import Product
+
+
+# Product fields the cart page actually renders (see frontend/cart.html)
+SLIM_PRODUCT_FIELDS = ('id', 'name', 'price', 'image_url', 'stock_quantity')
 
 
 class CartItem(db.Model):
@@ -29,5 +34,60 @@ class CartItem(db.Model):
             'created_at': self.created_at.isoformat()
         }
     
+    @classmethod
+    def get_cart_view(cls, user_id, product_fields=None):
+        """
+        Build the cart response for a user with a single joined query.
+
+        Line subtotals and the grand total are computed in SQL (the total via a
+        window function), so no Product objects are loaded per line. Only the
+        ``product_fields`` asked for (default: all) are selected for each product.
+        """
+        sql_fields = Product.sql_fields()
+        product_fields = product_fields or tuple(sql_fields)
+        subtotal = db.func.coalesce(Product.price * cls.quantity, 0)
+        
+        rows = db.session.execute(
+            db.select(
+                cls.id,
+                cls.user_id,
+                cls.product_id,
+                cls.quantity,
+                cls.created_at,
+                subtotal.label('subtotal'),
+                db.func.sum(subtotal).over().label('total'),
+                Product.id.label('found_product_id'),
+                *[sql_fields[field].label(f'p_{field}') for field in product_fields]
+            )
+            .outerjoin(Product, Product.id == cls.product_id)
+            .where(cls.user_id == user_id)
+            .order_by(cls.id)
+        ).all()
+        
+        cart_items = []
+        for row in rows:
+            data = row._mapping
+            product = None
+            if row.found_product_id is not None:
+                product = {field: data[f'p_{field}'] for field in product_fields}
+                for field in ('created_at', 'updated_at'):
+                    if product.get(field) is not None:
+                        product[field] = product[field].isoformat()
+            cart_items.append({
+                'id': row.id,
+                'user_id': row.user_id,
+                'product_id': row.product_id,
+                'product': product,
+                'quantity': row.quantity,
+                'subtotal': row.subtotal,
+                'created_at': row.created_at.isoformat()
+            })
+        
+        return {
+            'cart_items': cart_items,
+            'total': rows[0].total if rows else 0,
+            'count': len(cart_items)
+        }
+    
     def __repr__(self):
         return f'<CartItem User:{self.user_id} Product:{self.product_id}>'
@@ -15,6 +15,8 @@ class Product(db.Model):
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     stock_quantity = db.Column(db.Integer, default=0)
+    reserved_quantity = db.Column(db.Integer, default=0, nullable=False)  # Held by active cart reservations
+    stock_shard_count = db.Column(db.Integer, default=0, nullable=False)  # >0: stock lives in ProductStockShard rows
     category = db.Column(db.String(50))
     image_url = db.Column(db.String(500))
     is_active = db.Column(db.Boolean, default=True)
@@ -24,6 +26,74 @@ class Product(db.Model):
     # Relationships
     cart_items = db.relationship('CartItem', backref='product', lazy=True)
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
+    stock_shards = db.relationship('ProductStockShard', lazy=True, cascade='all, delete-orphan',
+                                   order_by='ProductStockShard.shard_index')
+    
+    @property
+    def is_sharded(self):
+        """Whether stock is split across shard counter rows"""
+        return (self.stock_shard_count or 0) > 0
+    
+    @property
+    def total_stock(self):
+        """Stock on hand, summed over the shards for sharded products"""
+        if self.is_sharded:
+            return sum(shard.quantity for shard in self.stock_shards)
+        return self.stock_quantity or 0
+    
+    @property
+    def total_reserved(self):
+        """Stock held by cart reservations, summed over the shards for sharded products"""
+        if self.is_sharded:
+            return sum(shard.reserved_quantity for shard in self.stock_shards)
+        return self.reserved_quantity or 0
+    
+    @property
+    def available_quantity(self):
+        """Stock that is neither sold nor held by a cart reservation"""
+        return max(self.total_stock - self.total_reserved, 0)
+    
+    @classmethod
+    def sql_fields(cls):
+        """SQL expression for each ``to_dict()`` field, for queries that skip the ORM"""
+        shard_stock = db.select(db.func.coalesce(db.func.sum(ProductStockShard.quantity), 0)).where(
+            ProductStockShard.product_id == cls.id
+        ).scalar_subquery()
+        shard_available = db.select(
+            db.func.coalesce(db.func.sum(ProductStockShard.quantity - ProductStockShard.reserved_quantity), 0)
+        ).where(ProductStockShard.product_id == cls.id).scalar_subquery()
+        
+        stock = db.case((cls.stock_shard_count > 0, shard_stock), else_=cls.stock_quantity)
+        available = db.case(
+            (cls.stock_shard_count > 0, shard_available),
+            else_=cls.stock_quantity - cls.reserved_quantity
+        )
+        
+        return {
+            'id': cls.id,
+            'name': cls.name,
+            'description': cls.description,
+            'price': cls.price,
+            'stock_quantity': stock,
+            'available_quantity': db.case((available > 0, available), else_=0),
+            'category': cls.category,
+            'image_url': cls.image_url,
+            'is_active': cls.is_active,
+            'created_at': cls.created_at,
+            'updated_at': cls.updated_at
+        }
+    
+    @classmethod
+    def catalog_version(cls):
+        """
+        Cheap version of the whole catalog: product count plus the latest
+        product and stock shard modification times. Used for HTTP validators.
+        """
+        return db.session.execute(db.select(
+            db.select(db.func.count(cls.id)).scalar_subquery(),
+            db.select(db.func.max(cls.updated_at)).scalar_subquery(),
+            db.select(db.func.max(ProductStockShard.updated_at)).scalar_subquery()
+        )).one()
     
     def to_dict(self):
         """Convert product object to dictionary"""
@@ -32,7 +102,8 @@ class Product(db.Model):
             'name': self.name,
             'description': self.description,
             'price': self.price,
-            'stock_quantity': self.stock_quantity,
+            'stock_quantity': self.total_stock,
+            'available_quantity': self.available_quantity,
             'category': self.category,
             'image_url': self.image_url,
             'is_active': self.is_active,
@@ -42,3 +113,31 @@ class Product(db.Model):
     
     def __repr__(self):
         return f'<Product {self.name}>'
+
+
+class ProductStockShard(db.Model):
+    """One of N stock counter rows for a product with sharded inventory"""
+    
+    __tablename__ = 'product_stock_shards'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'shard_index', name='uq_product_stock_shards_product_shard'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
+    shard_index = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, default=0, nullable=False)
+    reserved_quantity = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert stock shard to dictionary"""
+        return {
+            'product_id': self.product_id,
+            'shard_index': self.shard_index,
+            'quantity': self.quantity,
+            'reserved_quantity': self.reserved_quantity
+        }
+    
+    def __repr__(self):
+        return f'<ProductStockShard Product:{self.product_id} #{self.shard_index}>'
@@ -0,0 +1,37 @@
+"""
+Stock Reservation Model - Stock held for cart lines until checkout or expiry
+"""
+from datetime import datetime
+from app import db
+
+
+class StockReservation(db.Model):
+    """Stock held for a user's cart line for a limited time"""
+    
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'product_id', name='uq_stock_reservations_user_product'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    shard_index = db.Column(db.Integer)  # Stock shard holding the reservation (sharded products only)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert reservation to dictionary"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'product_id': self.product_id,
+            'quantity': self.quantity,
+            'expires_at': self.expires_at.isoformat(),
+            'created_at': self.created_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<StockReservation User:{self.user_id} Product:{self.product_id} x{self.quantity}>'
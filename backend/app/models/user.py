@@ -2,6 +2,7 @@
 User Model - Handles user authentication and profile
 """
 from datetime import datetime
+from flask import current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
 
@@ -27,7 +28,7 @@ class User(db.Model):
     
     def set_password(self, password):
         """Hash and set user password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, current_app.config['PASSWORD_HASH_METHOD'])
     
     def check_password(self, password):
         """Verify password against hash"""
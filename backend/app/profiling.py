@@ -0,0 +1,251 @@
+"""
+Request profiling - cProfile on demand, stack sampling for slow requests
+
+Three triggers, all writing into a bounded on-disk ring buffer
+(``PROFILE_DIR``, newest ``PROFILE_MAX_FILES`` kept) that admins list and
+download through ``/api/admin/profiles``:
+
+* an admin sends ``X-Profile: 1``: the request runs under cProfile and the
+  response carries ``X-Profile-Id`` (a ``.pstats`` file);
+* ``PROFILE_SAMPLE_RATE``: that fraction of all requests runs under cProfile;
+* ``PROFILE_SLOW_MS``: a background thread samples the stacks of requests
+  that have been running for a quarter of the threshold, every
+  ``PROFILE_SAMPLE_INTERVAL_MS``; requests that end up slower than the
+  threshold are saved as collapsed stacks (``.collapsed``, flamegraph input).
+
+Untriggered requests only pay for a dict insert and delete; the sampler
+thread does not touch any stack until a request passes the grace period.
+Stacks are per OS thread, so sampling does not see individual greenlets
+under gevent workers.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+PROFILE_KINDS = ('pstats', 'collapsed')
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class ProfileStore:
+    """Profiles in a directory, pruned to the newest ``max_files``"""
+
+    def __init__(self, directory, max_files=50):
+        self.directory = directory
+        self.max_files = max_files
+        os.makedirs(directory, exist_ok=True)
+
+    def _new_path(self, endpoint, seconds, kind):
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        label = _SAFE_NAME.sub('_', endpoint or 'unmatched')
+        return os.path.join(
+            self.directory, f'{stamp}-{label}-{int(seconds * 1000)}ms-{uuid.uuid4().hex[:8]}.{kind}'
+        )
+
+    def save_pstats(self, profiler, endpoint, seconds):
+        path = self._new_path(endpoint, seconds, 'pstats')
+        pstats.Stats(profiler).dump_stats(path)
+        self._prune()
+        return os.path.basename(path)
+
+    def save_collapsed(self, stacks, endpoint, seconds):
+        path = self._new_path(endpoint, seconds, 'collapsed')
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        self._prune()
+        return os.path.basename(path)
+
+    def list(self):
+        """Saved profiles, newest first"""
+        profiles = []
+        for name in os.listdir(self.directory):
+            kind = name.rsplit('.', 1)[-1]
+            if kind not in PROFILE_KINDS:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue  # pruned by another worker
+            profiles.append({
+                'name': name,
+                'kind': kind,
+                'size': stat.st_size,
+                'created_at': datetime.utcfromtimestamp(stat.st_mtime).isoformat()
+            })
+        return sorted(profiles, key=lambda profile: profile['name'], reverse=True)
+
+    def path(self, name):
+        """Path of a listed profile, or None (names never resolve outside the directory)"""
+        if name != os.path.basename(name) or name.rsplit('.', 1)[-1] not in PROFILE_KINDS:
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def _prune(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.rsplit('.', 1)[-1] in PROFILE_KINDS)
+        for name in names[:max(0, len(names) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Periodically collects the stacks of tracked request threads that run past ``grace`` seconds"""
+
+    def __init__(self, interval, grace):
+        self.interval = interval
+        self.grace = grace
+        self._requests = {}
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def track(self, thread_id):
+        self._ensure_thread()
+        self._requests[thread_id] = (time.perf_counter(), Counter())
+
+    def untrack(self, thread_id):
+        """Stop tracking a thread and return its sampled stacks"""
+        entry = self._requests.pop(thread_id, None)
+        return entry[1] if entry else Counter()
+
+    def _ensure_thread(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='stack-sampler', daemon=True).start()
+
+    def sample(self):
+        """Take one sample of every tracked thread past the grace period"""
+        now = time.perf_counter()
+        due = [(thread_id, stacks) for thread_id, (start, stacks) in list(self._requests.items())
+               if now - start >= self.grace]
+        if not due:
+            return
+        frames = sys._current_frames()
+        for thread_id, stacks in due:
+            frame = frames.get(thread_id)
+            if frame is not None:
+                stacks[_collapse(frame)] += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error("Stack sampler error: %s", e)
+
+
+class RequestProfiler:
+    """Profiling settings, the profile store and the optional stack sampler"""
+
+    def __init__(self, store, slow_seconds=0.0, sample_rate=0.0, sample_interval=0.01):
+        self.store = store
+        self.slow_seconds = slow_seconds
+        self.sample_rate = sample_rate
+        # Fast requests are never sampled: only those past a quarter of the threshold
+        self.sampler = StackSampler(sample_interval, slow_seconds / 4) if slow_seconds > 0 else None
+
+
+def _admin_requested():
+    """True if the request asks for a profile and comes from an admin"""
+    if not request.headers.get(PROFILE_HEADER):
+        return False
+
+    from app import db
+    from app.models.user import User
+    try:
+        verify_jwt_in_request()
+        user = db.session.get(User, get_jwt_identity())
+    except Exception:
+        return False
+    return user is not None and user.role == 'admin'
+
+
+def init_profiling(app):
+    """Register the profiling hooks and the profile store"""
+    profiler = RequestProfiler(
+        ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_MAX_FILES']),
+        slow_seconds=app.config['PROFILE_SLOW_MS'] / 1000,
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        sample_interval=app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000
+    )
+    app.extensions['profiler'] = profiler
+
+    @app.before_request
+    def start_profile():
+        g.profile_start = time.perf_counter()
+        if _admin_requested() or (profiler.sample_rate and random.random() < profiler.sample_rate):
+            g.profile = cProfile.Profile()
+            g.profile.enable()
+        elif profiler.sampler is not None:
+            profiler.sampler.track(threading.get_ident())
+            g.profile_sampled = True
+
+    @app.after_request
+    def save_profile(response):
+        start = g.get('profile_start')
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+
+        try:
+            profile = g.pop('profile', None)
+            if profile is not None:
+                profile.disable()
+                response.headers['X-Profile-Id'] = profiler.store.save_pstats(profile, request.endpoint, elapsed)
+            elif g.pop('profile_sampled', False):
+                stacks = profiler.sampler.untrack(threading.get_ident())
+                if elapsed >= profiler.slow_seconds and stacks:
+                    name = profiler.store.save_collapsed(stacks, request.endpoint, elapsed)
+                    logger.info("Slow request profiled: %s %.0f ms -> %s", request.endpoint, elapsed * 1000, name)
+        except OSError as e:
+            logger.error("Saving profile failed: %s", e)
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # Requests that failed before after_request ran
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.disable()
+        if g.pop('profile_sampled', False):
+            profiler.sampler.untrack(threading.get_ident())
+
+    return profiler
+
+
+def get_profiler():
+    """Return the request profiler for the current app"""
+    return current_app.extensions['profiler']
@@ -0,0 +1,389 @@
+"""
+Prometheus metrics - Counters, gauges and histograms in text exposition format
+
+A dependency-free subset of the Prometheus client: metrics are declared at
+import time and labelled per call (``REQUESTS.inc(endpoint=..., status=...)``).
+``GET /metrics`` renders every sample in the text exposition format.
+
+Values live in a process-local dict by default. With ``METRICS_MULTIPROC_DIR``
+set (``PROMETHEUS_MULTIPROC_DIR`` in the environment) every process writes its
+values to memory-mapped files in that directory instead, and a scrape of any
+worker sums the files of all workers. Gauge files of exited workers are
+removed by ``mark_process_dead`` (gunicorn ``child_exit``); counter and
+histogram files are kept so totals never go backwards.
+
+Collected here: request count/latency per endpoint, method and status;
+in-flight requests; DB queries and query time per request; connection pool
+checkout wait; response cache hits and misses; response compression time.
+"""
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from flask import Response, g, request
+
+from app.querytrace import current_recorder
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets for per-request query counts
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# Buckets for compressing one response body (seconds)
+COMPRESSION_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MmapDict:
+    """
+    Append-only ``key -> float`` map stored in a memory-mapped file.
+
+    Layout: a 4-byte used-size header, then entries of a 4-byte key length,
+    the UTF-8 key padded to 8-byte alignment and an 8-byte double. Only the
+    owning process writes; other processes read the file directly.
+    """
+
+    INITIAL_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(self.INITIAL_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._positions = {}
+
+        self._used = struct.unpack_from('i', self._map, 0)[0]
+        if self._used == 0:
+            self._used = 8
+            struct.pack_into('i', self._map, 0, self._used)
+        else:
+            for key, _, position in self._entries(self._map, self._used):
+                self._positions[key] = position
+
+    @staticmethod
+    def _entries(data, used):
+        position = 8
+        while position < used:
+            length = struct.unpack_from('i', data, position)[0]
+            key_end = position + 4 + length
+            value_position = key_end + (8 - key_end % 8) if key_end % 8 else key_end + 8
+            key = bytes(data[position + 4:key_end]).decode()
+            yield key, struct.unpack_from('d', data, value_position)[0], value_position
+            position = value_position + 8
+
+    @classmethod
+    def read_all(cls, path):
+        """``(key, value)`` pairs of a file written by any process"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < 8:
+            return []
+        used = struct.unpack_from('i', data, 0)[0]
+        return [(key, value) for key, value, _ in cls._entries(data, used)]
+
+    def _append(self, key):
+        encoded = key.encode()
+        key_end = self._used + 4 + len(encoded)
+        padding = 8 - key_end % 8 if key_end % 8 else 8
+        entry = struct.pack(f'=i{len(encoded) + padding}sd', len(encoded), encoded, 0.0)
+
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+
+        self._map[self._used:self._used + len(entry)] = entry
+        self._positions[key] = self._used + len(entry) - 8
+        self._used += len(entry)
+        # Publish the entry only once it is fully written
+        struct.pack_into('i', self._map, 0, self._used)
+
+    def get(self, key):
+        position = self._positions.get(key)
+        return struct.unpack_from('d', self._map, position)[0] if position is not None else 0.0
+
+    def set(self, key, value):
+        if key not in self._positions:
+            self._append(key)
+        struct.pack_into('d', self._map, self._positions[key], value)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class LocalValues:
+    """Metric values kept in this process only"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, kind, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, kind, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def collect(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class MultiprocessValues:
+    """
+    Metric values in per-process mmap files (``<kind>_<pid>.db``), summed on collect.
+
+    Files are reopened after a fork, so values recorded in a preloading
+    master stay in the master's files.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._files = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _file(self, kind):
+        if self._pid != os.getpid():
+            # Forked: the inherited maps belong to the parent
+            self._files = {}
+            self._pid = os.getpid()
+        values = self._files.get(kind)
+        if values is None:
+            values = self._files[kind] = MmapDict(os.path.join(self.directory, f'{kind}_{self._pid}.db'))
+        return values
+
+    def inc(self, kind, key, amount):
+        with self._lock:
+            values = self._file(kind)
+            values.set(key, values.get(key) + amount)
+
+    def set(self, kind, key, value):
+        with self._lock:
+            self._file(kind).set(key, value)
+
+    def collect(self):
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, '*.db')):
+            try:
+                entries = MmapDict.read_all(path)
+            except OSError:
+                continue  # removed by mark_process_dead while scraping
+            for key, value in entries:
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+
+def mark_process_dead(pid, directory):
+    """Drop the gauge values of an exited worker process"""
+    for path in glob.glob(os.path.join(directory, f'gauge_{pid}.db')):
+        os.remove(path)
+
+
+def _sample_key(metric, sample, labels):
+    return json.dumps([metric, sample, sorted(labels.items())], separators=(',', ':'))
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+class _Metric:
+    kind = 'counter'
+    type_name = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return {name: str(value) for name, value in labels.items()}
+
+
+class Counter(_Metric):
+    """Monotonic total"""
+
+    def inc(self, amount=1, **labels):
+        self.registry.values.inc(self.kind, _sample_key(self.name, self.name + '_total', self._labels(labels)), amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; summed over live processes"""
+
+    kind = 'gauge'
+    type_name = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self.registry.values.inc(self.kind, _sample_key(self.name, self.name, self._labels(labels)), amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative ``le`` buckets, plus their sum and count"""
+
+    type_name = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        values = self.registry.values
+        # Buckets are stored cumulatively so files from several processes simply add up
+        for bound in self.buckets:
+            if value <= bound:
+                values.inc(self.kind, _sample_key(self.name, self.name + '_bucket',
+                                                  {**labels, 'le': _format_value(bound)}), 1)
+        values.inc(self.kind, _sample_key(self.name, self.name + '_sum', labels), value)
+        values.inc(self.kind, _sample_key(self.name, self.name + '_count', labels), 1)
+
+
+class PrometheusRegistry:
+    """Declared metrics plus the value store they write to"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.values = LocalValues()
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return Counter(self, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return Gauge(self, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return Histogram(self, name, documentation, labelnames, buckets)
+
+    def configure(self, multiproc_dir=None):
+        """Switch to the mmap backend in ``multiproc_dir`` (or back to process-local values)"""
+        if multiproc_dir:
+            os.makedirs(multiproc_dir, exist_ok=True)
+            if getattr(self.values, 'directory', None) != multiproc_dir:
+                self.values = MultiprocessValues(multiproc_dir)
+        elif not isinstance(self.values, LocalValues):
+            self.values = LocalValues()
+
+    def render(self):
+        """All samples in the Prometheus text exposition format"""
+        samples = {}
+        for key, value in self.values.collect().items():
+            metric, sample, labels = json.loads(key)
+            samples.setdefault(metric, []).append((sample, labels, value))
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+            # Labels in declaration order, ``le`` last
+            position = {label: index for index, label in enumerate(metric.labelnames)}
+            for sample, labels, value in sorted(samples.get(name, ()), key=_sample_order):
+                labels = sorted(labels, key=lambda pair: position.get(pair[0], len(position)))
+                label_text = ','.join(f'{label}="{_escape(text)}"' for label, text in labels)
+                lines.append(f"{sample}{{{label_text}}} {_format_value(value)}" if labels
+                             else f"{sample} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _sample_order(entry):
+    sample, labels, _ = entry
+    series = [(label, text) for label, text in labels if label != 'le']
+    bound = next((float(text) for label, text in labels if label == 'le'), 0.0)
+    return series, sample, bound
+
+
+registry = PrometheusRegistry()
+
+REQUESTS = registry.counter(
+    'http_requests', 'HTTP requests handled', ('endpoint', 'method', 'status'))
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Time to produce the response', ('endpoint', 'method', 'status'))
+IN_FLIGHT = registry.gauge(
+    'http_requests_in_flight', 'Requests currently being handled')
+DB_QUERIES = registry.histogram(
+    'db_queries_per_request', 'SQL statements executed per request', ('endpoint',), QUERY_COUNT_BUCKETS)
+DB_QUERY_TIME = registry.histogram(
+    'db_query_seconds_per_request', 'Time spent executing SQL per request', ('endpoint',))
+DB_POOL_WAIT = registry.histogram(
+    'db_pool_checkout_seconds', 'Time to check a connection out of the pool (waiting or connecting)')
+CACHE_REQUESTS = registry.counter(
+    'response_cache_requests', 'Response cache lookups', ('result',))
+COMPRESSION_TIME = registry.histogram(
+    'compression_seconds', 'Time spent compressing response bodies', ('encoding', 'streamed'), COMPRESSION_BUCKETS)
+
+
+def _endpoint():
+    # Unmatched URLs share one label value so scanners cannot create unbounded series
+    return request.endpoint or 'unmatched'
+
+
+def init_prometheus(app):
+    """Register the request instrumentation and ``GET /metrics`` (query counts come from query tracing)"""
+    registry.configure(app.config.get('METRICS_MULTIPROC_DIR'))
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_in_flight = True
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+
+        endpoint = _endpoint()
+        labels = {'endpoint': endpoint, 'method': request.method, 'status': response.status_code}
+        REQUESTS.inc(**labels)
+        REQUEST_LATENCY.observe(time.perf_counter() - start, **labels)
+        recorder = current_recorder()
+        if recorder is not None:
+            DB_QUERIES.observe(recorder.count, endpoint=endpoint)
+            DB_QUERY_TIME.observe(recorder.seconds, endpoint=endpoint)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if g.pop('metrics_in_flight', False):
+            IN_FLIGHT.dec()
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        """Prometheus scrape endpoint (not routed through the public proxy)"""
+        return Response(registry.render(), mimetype=CONTENT_TYPE)
+
+    return registry
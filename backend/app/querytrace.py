@@ -0,0 +1,147 @@
+"""
+Query tracing - Per-request SQL recording and N+1 detection
+
+Every statement run on the app's engines is recorded, with its duration, by
+the active ``QueryRecorder``s: one per request plus any opened with
+``record_queries()`` (the ``query_budget`` test fixture). Statements are
+normalized to their shape (literals and ``IN`` lists collapsed), and a shape
+run ``N_PLUS_ONE_THRESHOLD`` or more times in one request is reported as an
+N+1 candidate, e.g. a lazy relationship loaded once per row.
+
+Reports are surfaced as ``X-Query-*`` response headers when
+``QUERY_TRACE_HEADERS`` is on (debug) and as a warning record with the
+report as structured fields for requests with N+1 candidates.
+"""
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Recorders receiving statements in the current context (request, test block)
+_active = ContextVar('query_recorders', default=())
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|%s)(?:\s*,\s*(?:\?|%\(\w+\)s|%s))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(statement):
+    """Shape of a SQL statement: literals replaced and parameter lists collapsed"""
+    shape = _STRING.sub('?', statement)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PARAM_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryRecorder:
+    """Statements (shape, seconds) executed while the recorder is active"""
+
+    def __init__(self):
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.statements.append((normalize(statement), seconds))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def seconds(self):
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated(self, threshold):
+        """``{shape: count}`` for shapes run at least ``threshold`` times"""
+        counts = {}
+        for shape, _ in self.statements:
+            counts[shape] = counts.get(shape, 0) + 1
+        return {shape: count for shape, count in counts.items() if count >= threshold}
+
+    def report(self, threshold):
+        return {
+            'queries': self.count,
+            'query_ms': round(self.seconds * 1000, 3),
+            'n_plus_one': [{'count': count, 'sql': shape} for shape, count in self.repeated(threshold).items()]
+        }
+
+
+@contextmanager
+def record_queries():
+    """Record the statements run in the enclosed block"""
+    recorder = QueryRecorder()
+    token = _active.set(_active.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _active.reset(token)
+
+
+def current_recorder():
+    """The current request's recorder, or None outside a traced request"""
+    return g.get('query_recorder')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorders = _active.get()
+    starts = conn.info.get('query_start')
+    if not recorders or not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    for recorder in recorders:
+        recorder.record(statement, seconds)
+
+
+def listen_engine(engine):
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_query_tracing(app):
+    """Hook statement recording into the app's engines and requests"""
+    from app import db
+
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    headers = app.config['QUERY_TRACE_HEADERS']
+
+    with app.app_context():
+        for engine in db.engines.values():
+            listen_engine(engine)
+
+    @app.before_request
+    def start_query_recorder():
+        recorder = g.query_recorder = QueryRecorder()
+        g.query_recorder_token = _active.set(_active.get() + (recorder,))
+
+    @app.after_request
+    def report_queries(response):
+        recorder = current_recorder()
+        if recorder is None:
+            return response
+
+        report = recorder.report(threshold)
+        if headers:
+            response.headers['X-Query-Count'] = str(report['queries'])
+            response.headers['X-Query-Time-Ms'] = str(report['query_ms'])
+            response.headers['X-Query-Repeated'] = str(len(report['n_plus_one']))
+        if report['n_plus_one']:
+            logger.warning("N+1 query candidates on %s", request.endpoint, extra=report)
+        return response
+
+    @app.teardown_request
+    def stop_query_recorder(exc):
+        token = g.pop('query_recorder_token', None)
+        if token is not None:
+            _active.reset(token)
+        g.pop('query_recorder', None)
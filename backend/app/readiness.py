@@ -0,0 +1,184 @@
+"""
+Readiness - Background-refreshed health status for probes
+
+A daemon thread per worker process re-checks every ``HEALTH_CHECK_INTERVAL``
+seconds: database round trip per bind, connection pool saturation, checkout
+admission and log queue depth, pending write-behind carts and the state of
+the response cache. ``/readyz`` and ``/health`` only read the last result, so
+a probe costs a dict copy whatever the load; ``/livez`` does no work at all.
+
+A worker is ready while every required check is within its threshold and
+the last refresh is recent (a checker stuck on an exhausted pool makes the
+status stale, which counts as not ready). Read replicas are reported but not
+required, since every worker shares them. ``HEALTH_CHECK_INTERVAL=0`` runs
+the checks on every probe instead (tests).
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# A status older than this many intervals means the checker is stuck
+STALE_INTERVALS = 3
+
+
+class ReadinessMonitor:
+    """Runs the readiness checks periodically and keeps the latest result"""
+
+    def __init__(self, app, interval=5.0, db_latency_ms=500.0, pool_saturation=0.9, queue_depth=100,
+                 require_warm_cache=False):
+        self.app = app
+        self.interval = interval
+        self.db_latency_ms = db_latency_ms
+        self.pool_saturation = pool_saturation
+        self.queue_depth = queue_depth
+        self.require_warm_cache = require_warm_cache
+        self._status = None
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def _ensure_thread(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._thread_pid == os.getpid() or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='readiness-monitor', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Readiness check error: %s", e)
+            time.sleep(self.interval)
+
+    def _check_databases(self, checks):
+        from app import db
+        from app.routing import REPLICA_BIND_PREFIX
+
+        for key, engine in db.engines.items():
+            name = 'database' if key is None else key
+            required = not (key or '').startswith(REPLICA_BIND_PREFIX)
+            start = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.exec_driver_sql('SELECT 1')
+            except Exception as e:
+                checks[name] = {'ok': False, 'required': required, 'error': str(e)}
+                continue
+            latency = (time.perf_counter() - start) * 1000
+            checks[name] = {
+                'ok': latency <= self.db_latency_ms, 'required': required,
+                'latency_ms': round(latency, 3), 'threshold_ms': self.db_latency_ms
+            }
+
+    def _check_pool(self, checks):
+        from app import db
+
+        pool = db.engine.pool
+        if not hasattr(pool, 'checkedout') or not hasattr(pool, 'size'):
+            return  # e.g. the single connection of in-memory SQLite
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        saturation = pool.checkedout() / capacity if capacity else 0.0
+        checks['pool'] = {
+            'ok': saturation < self.pool_saturation, 'required': True,
+            'checked_out': pool.checkedout(), 'capacity': capacity,
+            'saturation': round(saturation, 3), 'threshold': self.pool_saturation
+        }
+
+    def _check_queues(self, checks):
+        from app.logs import DroppingQueueHandler
+
+        admission = self.app.extensions.get('admission')
+        if admission is not None:
+            depth = admission.stats()['queue_depth']
+            checks['admission_queue'] = {
+                'ok': depth < self.queue_depth, 'required': True, 'depth': depth, 'threshold': self.queue_depth
+            }
+
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, DroppingQueueHandler):
+                depth = handler.queue.qsize()
+                checks['log_queue'] = {
+                    'ok': depth < handler.maxsize * self.pool_saturation, 'required': False,
+                    'depth': depth, 'capacity': handler.maxsize, 'dropped': handler.dropped
+                }
+
+        store = self.app.extensions.get('cart_store')
+        if hasattr(store, 'pending'):
+            checks['cart_writes'] = {'ok': True, 'required': False, 'pending': store.pending}
+
+    def _check_cache(self, checks):
+        cache = self.app.extensions.get('response_cache')
+        entries = len(cache) if cache is not None else 0
+        warmed_up = self.app.extensions.get('warmed_up', False)
+        checks['cache'] = {
+            'ok': warmed_up or entries > 0, 'required': self.require_warm_cache,
+            'entries': entries, 'warmed_up': warmed_up
+        }
+
+    def refresh(self):
+        """Run every check now and store the result"""
+        checks = {}
+        with self.app.app_context():
+            self._check_databases(checks)
+            self._check_pool(checks)
+            self._check_queues(checks)
+            self._check_cache(checks)
+
+        failing = sorted(name for name, check in checks.items() if check['required'] and not check['ok'])
+        self._status = {
+            'ready': not failing,
+            'failing': failing,
+            'checks': checks,
+            'checked_at': datetime.utcnow().isoformat(),
+            'monotonic': time.monotonic()
+        }
+        return self._status
+
+    def status(self):
+        """The last result, marked not ready if it is stale"""
+        self._ensure_thread()
+        if self.interval <= 0:
+            status = self.refresh()
+        else:
+            status = self._status
+        if status is None:
+            # First probe of this process, before the thread's first round finished
+            with self._lock:
+                status = self._status or self.refresh()
+
+        age = time.monotonic() - status['monotonic']
+        result = {key: value for key, value in status.items() if key != 'monotonic'}
+        result['age_seconds'] = round(age, 3)
+        if self.interval > 0 and age > self.interval * STALE_INTERVALS:
+            result['ready'] = False
+            result['failing'] = status['failing'] + ['stale']
+        return result
+
+
+def init_readiness(app):
+    """Register the readiness monitor (its thread starts with the first probe in each process)"""
+    monitor = ReadinessMonitor(
+        app,
+        interval=app.config['HEALTH_CHECK_INTERVAL'],
+        db_latency_ms=app.config['HEALTH_DB_LATENCY_MS'],
+        pool_saturation=app.config['HEALTH_POOL_SATURATION'],
+        queue_depth=app.config['HEALTH_QUEUE_DEPTH'],
+        require_warm_cache=app.config['HEALTH_REQUIRE_WARM_CACHE']
+    )
+    app.extensions['readiness'] = monitor
+    return monitor
+
+
+def get_readiness_monitor():
+    """Return the readiness monitor for the current app"""
+    return current_app.extensions['readiness']
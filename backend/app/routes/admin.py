@@ -1,39 +1,76 @@
 """
 Admin Routes - Admin dashboard and management
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, stream_with_context
 from app import db
 from app.models.user import User
 from app.models.product import Product
 from app.models.order import Order
 from app.models.payment import Payment
 from app.middleware.auth import admin_required
+from app.middleware.coalescing import get_single_flight
+from app.middleware.conditional import conditional
+from app.middleware.load_shedding import get_load_shedder
+from app.services import inventory
+from app.services.admission import get_admission_controller
+from app.sharding import get_shard_router, locate, merge_sorted, scatter, use_shard
+from app.profiling import get_profiler
+from app.routes.orders import orders_validator
+from app.serializers import (
+    order_serializer, user_serializer, payment_serializer, ORDER_SUMMARY_FIELDS, load_orders, load_rows
+)
 from sqlalchemy import func
+import csv
+import io
 import logging
 
 bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 logger = logging.getLogger(__name__)
 
+# Rows fetched per round trip when streaming exports through a server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+
+def _newest_first(loader, *args, fields, limit=None, **kwargs):
+    """Run ``loader`` on every user shard and merge its rows by ``created_at``, newest first"""
+    sort_fields = tuple(fields) if 'created_at' in fields else (*fields, 'created_at')
+    if limit is not None:
+        kwargs['limit'] = limit
+    rows = merge_sorted(
+        scatter(loader, *args, fields=sort_fields, **kwargs),
+        key=lambda row: row['created_at'], reverse=True, limit=limit
+    )
+    if 'created_at' not in fields:
+        for row in rows:
+            del row['created_at']
+    return rows
+
+
+def _order_statistics():
+    return (
+        Order.query.count(),
+        db.session.query(func.sum(Order.total_amount)).filter(
+            Order.status.in_(['processing', 'shipped', 'delivered'])
+        ).scalar() or 0,
+        Order.query.filter_by(status='pending').count()
+    )
+
 
 @bp.route('/dashboard', methods=['GET'])
 @admin_required
 def get_dashboard():
     """Get admin dashboard statistics"""
+    fields = order_serializer.requested_fields(default=ORDER_SUMMARY_FIELDS)
     try:
         # Get statistics
         total_users = User.query.filter_by(role='user').count()
         total_products = Product.query.filter_by(is_active=True).count()
-        total_orders = Order.query.count()
-        
-        # Revenue statistics
-        total_revenue = db.session.query(func.sum(Order.total_amount)).filter(
-            Order.status.in_(['processing', 'shipped', 'delivered'])
-        ).scalar() or 0
         
-        pending_orders = Order.query.filter_by(status='pending').count()
+        # Order and revenue statistics, summed over the user shards
+        total_orders, total_revenue, pending_orders = (sum(values) for values in zip(*scatter(_order_statistics)))
         
         # Recent orders
-        recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
+        recent_orders = _newest_first(load_orders, fields=fields, limit=10)
         
         return jsonify({
             'statistics': {
@@ -43,46 +80,89 @@ def get_dashboard():
                 'total_revenue': total_revenue,
                 'pending_orders': pending_orders
             },
-            'recent_orders': [order.to_dict(include_items=False) for order in recent_orders]
+            'recent_orders': recent_orders
         }), 200
         
     except Exception as e:
-        logger.error(f"Dashboard error: {str(e)}")
+        logger.error("Dashboard error: %s", e)
         return jsonify({'error': 'Failed to get dashboard data', 'message': str(e)}), 500
 
 
+def _all_orders_validator():
+    status = request.args.get('status')
+    return orders_validator(*([Order.status == status] if status else []), all_shards=True)
+
+
 @bp.route('/orders', methods=['GET'])
 @admin_required
+@conditional(_all_orders_validator)
 def get_all_orders():
     """Get all orders (admin view)"""
+    fields = order_serializer.requested_fields()
     try:
         status = request.args.get('status')
         
-        query = Order.query
-        
-        if status:
-            query = query.filter_by(status=status)
-        
-        orders = query.order_by(Order.created_at.desc()).all()
+        criteria = [Order.status == status] if status else []
+        orders = _newest_first(load_orders, *criteria, fields=fields)
         
         return jsonify({
-            'orders': [order.to_dict() for order in orders],
+            'orders': orders,
             'count': len(orders)
         }), 200
         
     except Exception as e:
-        logger.error(f"Get all orders error: {str(e)}")
+        logger.error("Get all orders error: %s", e)
         return jsonify({'error': 'Failed to get orders', 'message': str(e)}), 500
 
 
+@bp.route('/orders/export', methods=['GET'])
+@admin_required
+def export_orders():
+    """
+    Stream orders as CSV.
+    
+    Rows are read through a server-side cursor (PostgreSQL) in batches of
+    ``EXPORT_BATCH_SIZE``, so memory use does not grow with the table. User
+    shards are exported one after another.
+    """
+    fields = order_serializer.requested_fields(default=ORDER_SUMMARY_FIELDS)
+    compiled = order_serializer.compile([name for name in fields if name in ORDER_SUMMARY_FIELDS])
+    status = request.args.get('status')
+    criteria = [Order.status == status] if status else []
+    statement = compiled.select().where(*criteria).order_by(Order.id).execution_options(
+        stream_results=True, yield_per=EXPORT_BATCH_SIZE
+    )
+    shard_count = get_shard_router().shard_count
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(compiled.fields)
+        yield buffer.getvalue()
+        
+        for shard in range(shard_count):
+            with use_shard(shard):
+                for rows in db.session.execute(statement).partitions():
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(compiled.from_row(row).values() for row in rows)
+                    yield buffer.getvalue()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=orders.csv'}
+    )
+
+
 @bp.route('/orders/<int:order_id>/status', methods=['PUT'])
 @admin_required
 def update_order_status(order_id):
     """Update order status (admin only)"""
     try:
-        order = db.session.get(Order, order_id)
+        shard = locate(Order, order_id)
         
-        if not order:
+        if shard is None:
             return jsonify({'error': 'Order not found'}), 404
         
         data = request.get_json()
@@ -91,19 +171,22 @@ def update_order_status(order_id):
         if new_status not in ['pending', 'processing', 'shipped', 'delivered', 'cancelled']:
             return jsonify({'error': 'Invalid status'}), 400
         
-        order.status = new_status
-        db.session.commit()
+        with use_shard(shard):
+            order = db.session.get(Order, order_id)
+            order.status = new_status
+            db.session.commit()
+            order_data = order.to_dict()
         
-        logger.info(f"Order status updated: {order_id} -> {new_status}")
+        logger.info("Order status updated: %s -> %s", order_id, new_status)
         
         return jsonify({
             'message': 'Order status updated',
-            'order': order.to_dict()
+            'order': order_data
         }), 200
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Update order status error: {str(e)}")
+        logger.error("Update order status error: %s", e)
         return jsonify({'error': 'Failed to update order status', 'message': str(e)}), 500
 
 
@@ -111,16 +194,17 @@ def update_order_status(order_id):
 @admin_required
 def get_all_users():
     """Get all users (admin view)"""
+    fields = user_serializer.requested_fields()
     try:
-        users = User.query.all()
+        users = load_rows(user_serializer, fields=fields, order_by=User.id)
         
         return jsonify({
-            'users': [user.to_dict() for user in users],
+            'users': users,
             'count': len(users)
         }), 200
         
     except Exception as e:
-        logger.error(f"Get all users error: {str(e)}")
+        logger.error("Get all users error: %s", e)
         return jsonify({'error': 'Failed to get users', 'message': str(e)}), 500
 
 
@@ -140,7 +224,7 @@ def toggle_user_status(user_id):
         user.is_active = not user.is_active
         db.session.commit()
         
-        logger.info(f"User status toggled: {user_id} -> {user.is_active}")
+        logger.info("User status toggled: %s -> %s", user_id, user.is_active)
         
         return jsonify({
             'message': 'User status updated',
@@ -149,7 +233,7 @@ def toggle_user_status(user_id):
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Toggle user status error: {str(e)}")
+        logger.error("Toggle user status error: %s", e)
         return jsonify({'error': 'Failed to update user status', 'message': str(e)}), 500
 
 
@@ -157,14 +241,125 @@ def toggle_user_status(user_id):
 @admin_required
 def get_all_payments():
     """Get all payments (admin view)"""
+    fields = payment_serializer.requested_fields()
     try:
-        payments = Payment.query.order_by(Payment.created_at.desc()).all()
+        payments = _newest_first(load_rows, payment_serializer, fields=fields, order_by=Payment.created_at.desc())
         
         return jsonify({
-            'payments': [payment.to_dict() for payment in payments],
+            'payments': payments,
             'count': len(payments)
         }), 200
         
     except Exception as e:
-        logger.error(f"Get all payments error: {str(e)}")
+        logger.error("Get all payments error: %s", e)
         return jsonify({'error': 'Failed to get payments', 'message': str(e)}), 500
+
+
+@bp.route('/products/<int:product_id>/stock-shards', methods=['PUT'])
+@admin_required
+def set_stock_shards(product_id):
+    """Enable, resize or disable (``shards: 0``) sharded stock counters for a product"""
+    try:
+        product = db.session.get(Product, product_id)
+        
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+        
+        data = request.get_json()
+        shards = data.get('shards')
+        
+        if not isinstance(shards, int) or shards < 0:
+            return jsonify({'error': 'shards must be a non-negative integer'}), 400
+        
+        inventory.shard_product(product, shards)
+        db.session.commit()
+        
+        logger.info("Product stock shards set: %s -> %s", product_id, shards)
+        
+        return jsonify({
+            'message': 'Stock shards updated',
+            'product': product.to_dict(),
+            'shards': [shard.to_dict() for shard in product.stock_shards]
+        }), 200
+        
+    except inventory.StockBelowReserved as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Set stock shards error: %s", e)
+        return jsonify({'error': 'Failed to update stock shards', 'message': str(e)}), 500
+
+
+@bp.route('/products/<int:product_id>/stock-shards/rebalance', methods=['POST'])
+@admin_required
+def rebalance_stock_shards(product_id):
+    """Even out free stock across a product's shards"""
+    try:
+        product = db.session.get(Product, product_id)
+        
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+        
+        if not product.is_sharded:
+            return jsonify({'error': 'Product stock is not sharded'}), 400
+        
+        inventory.rebalance(product_id)
+        db.session.commit()
+        
+        logger.info("Product stock shards rebalanced: %s", product_id)
+        
+        return jsonify({
+            'message': 'Stock shards rebalanced',
+            'product': product.to_dict(),
+            'shards': [shard.to_dict() for shard in product.stock_shards]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Rebalance stock shards error: %s", e)
+        return jsonify({'error': 'Failed to rebalance stock shards', 'message': str(e)}), 500
+
+
+@bp.route('/admission', methods=['GET'])
+@admin_required
+def get_admission_stats():
+    """Get checkout admission control queue depth and counters, and load shedding state"""
+    return jsonify({
+        **get_admission_controller().stats(),
+        'load_shedding': get_load_shedder().stats()
+    }), 200
+
+
+@bp.route('/metrics', methods=['GET'])
+@admin_required
+def get_metrics():
+    """Get this worker's response cache and coalescing stats (timings are on ``GET /metrics``)"""
+    flight = get_single_flight()
+    return jsonify({
+        'response_cache': current_app.extensions['response_cache'].stats(),
+        'single_flight': flight.stats() if flight is not None else None
+    }), 200
+
+
+@bp.route('/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    """List saved request profiles (``.pstats`` from cProfile, ``.collapsed`` stack samples), newest first"""
+    profiles = get_profiler().store.list()
+    return jsonify({'profiles': profiles, 'count': len(profiles)}), 200
+
+
+@bp.route('/profiles/<name>', methods=['GET'])
+@admin_required
+def download_profile(name):
+    """Download a saved profile (load ``.pstats`` with ``pstats``/snakeviz, ``.collapsed`` with flamegraph.pl/speedscope)"""
+    path = get_profiler().store.path(name)
+    
+    if not path:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    mimetype = 'text/plain' if name.endswith('.collapsed') else 'application/octet-stream'
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=name)
+
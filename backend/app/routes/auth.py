@@ -6,6 +6,8 @@ from flask_jwt_extended import create_access_token, get_jwt_identity
 from app import db
 from app.models.user import User
 from app.middleware.auth import token_required, get_current_user
+from app.middleware.conditional import conditional, aggregate_version
+from app.serializers import user_serializer
 import logging
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -40,7 +42,7 @@ def register():
         db.session.add(user)
         db.session.commit()
         
-        logger.info(f"New user registered: {user.email}")
+        logger.info("New user registered: %s", user.email)
         
         return jsonify({
             'message': 'User registered successfully',
@@ -49,7 +51,7 @@ def register():
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Registration error: {str(e)}")
+        logger.error("Registration error: %s", e)
         return jsonify({'error': 'Registration failed', 'message': str(e)}), 500
 
 
@@ -75,7 +77,7 @@ def login():
         # Create access token
         access_token = create_access_token(identity=user.id)
         
-        logger.info(f"User logged in: {user.email}")
+        logger.info("User logged in: %s", user.email)
         
         return jsonify({
             'message': 'Login successful',
@@ -84,24 +86,31 @@ def login():
         }), 200
         
     except Exception as e:
-        logger.error(f"Login error: {str(e)}")
+        logger.error("Login error: %s", e)
         return jsonify({'error': 'Login failed', 'message': str(e)}), 500
 
 
+def _profile_validator():
+    count, last_modified = aggregate_version(User, User.id == get_jwt_identity())
+    return ((count, last_modified), last_modified) if count else None
+
+
 @bp.route('/profile', methods=['GET'])
 @token_required
+@conditional(_profile_validator)
 def get_profile():
     """Get current user profile"""
+    serializer = user_serializer.compile(user_serializer.requested_fields())
     try:
         user = get_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify({'user': user.to_dict()}), 200
+        return jsonify({'user': serializer.from_object(user)}), 200
         
     except Exception as e:
-        logger.error(f"Get profile error: {str(e)}")
+        logger.error("Get profile error: %s", e)
         return jsonify({'error': 'Failed to get profile', 'message': str(e)}), 500
 
 
@@ -126,7 +135,7 @@ def update_profile():
         
         db.session.commit()
         
-        logger.info(f"Profile updated: {user.email}")
+        logger.info("Profile updated: %s", user.email)
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -135,5 +144,5 @@ def update_profile():
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Update profile error: {str(e)}")
+        logger.error("Update profile error: %s", e)
         return jsonify({'error': 'Failed to update profile', 'message': str(e)}), 500
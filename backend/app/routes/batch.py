@@ -0,0 +1,179 @@
+"""
+Batch Routes - Several API calls in one round trip
+
+``POST /api/batch`` runs a list of sub-requests in-process against the
+registered views. The batch passes the request middleware (auth check,
+metrics, logging, load shedding, compression) once; each item only runs its
+view. The batch's token is verified and its user loaded once; every item
+runs as that user without verifying the token again. Items run in order and
+share the batch's database session, so rows loaded by one item (e.g. the
+cart's products) come from the session's identity map in the next.
+
+With ``"parallel": true`` consecutive GET items run concurrently on a thread
+pool (``BATCH_WORKERS``), each in its own app context and session. Any other
+item waits for the items before it and holds back the ones after it, so
+writes and the reads that follow them keep their order.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import Blueprint, current_app, g, request, jsonify
+from flask_jwt_extended import verify_jwt_in_request
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+from app import db
+from app.middleware.auth import VERIFIED_TOKEN, use_verified_token, verified_token
+from app.routing import READ_METHODS, pin_after_write, read_only, route_request
+
+bp = Blueprint('batch', __name__, url_prefix='/api')
+logger = logging.getLogger(__name__)
+
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+# Request headers every item inherits from the batch
+FORWARDED_HEADERS = ('Authorization', 'Accept', 'Accept-Language', 'X-Real-IP', 'X-Request-ID')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch')
+    return _executor
+
+
+def _validate(data, limit):
+    """Error message for a malformed batch, or None"""
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+        return 'Body must be an object with a "requests" list'
+    items = data['requests']
+    if not items:
+        return 'No requests'
+    if len(items) > limit:
+        return f'At most {limit} requests per batch'
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            return f'Request {index}: "path" is required'
+        if not item['path'].startswith('/api/') or item['path'].split('?')[0].rstrip('/') == '/api/batch':
+            return f'Request {index}: path must be an API path other than /api/batch'
+        if str(item.get('method', 'GET')).upper() not in METHODS:
+            return f'Request {index}: unsupported method'
+    return None
+
+
+@contextmanager
+def _own_globals():
+    # The batch's per-request state (metrics, profiling, load shedding) must not be
+    # seen or released by an item's teardown hooks
+    state = vars(g._get_current_object())
+    saved = dict(state)
+    state.clear()
+    try:
+        yield
+    finally:
+        state.clear()
+        state.update(saved)
+
+
+def _response_item(index, item, response):
+    body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+    return {
+        'id': item.get('id', index),
+        'status': response.status_code,
+        'headers': {name: value for name, value in response.headers.items() if name != 'Content-Length'},
+        'body': body
+    }
+
+
+def _dispatch(app, index, item, headers, environ_base, token):
+    """Run one item's view in its own request context and return its result"""
+    method = str(item.get('method', 'GET')).upper()
+    builder = EnvironBuilder(
+        path=item['path'], method=method, headers=headers, environ_base=environ_base, json=item.get('body')
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+
+    router = app.extensions['replica_router']
+    with _own_globals(), app.request_context(environ):
+        if token is not None:
+            use_verified_token(token)
+        try:
+            if request.routing_exception is not None:
+                raise request.routing_exception
+            route_request(router)
+            rv = app.view_functions[request.endpoint](**request.view_args)
+        except HTTPException as e:
+            rv = jsonify({'error': e.description}), e.code
+        except Exception as e:
+            try:
+                rv = app.handle_user_exception(e)
+            except Exception:
+                db.session.rollback()
+                logger.error("Batch item %s %s failed: %s", method, item['path'], e)
+                rv = jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+
+        response = app.make_response(rv)
+        pin_after_write(router, response)
+        try:
+            return _response_item(index, item, response)
+        finally:
+            response.close()
+
+
+def _dispatch_reads(app, entries, headers, environ_base, token, workers):
+    """Run a group of GET items, concurrently if there is more than one"""
+    if len(entries) == 1:
+        return [_dispatch(app, *entries[0], headers, environ_base, token)]
+
+    def run(entry):
+        with app.app_context():
+            return _dispatch(app, *entry, headers, environ_base, token)
+
+    return list(_get_executor(workers).map(run, entries))
+
+
+@bp.route('/batch', methods=['POST'])
+@read_only
+def batch():
+    """Run several API requests and return all of their responses"""
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception as e:
+        return jsonify({'error': 'Invalid or missing token', 'message': str(e)}), 401
+
+    data = request.get_json(silent=True)
+    error = _validate(data, current_app.config['BATCH_MAX_REQUESTS'])
+    if error:
+        return jsonify({'error': error}), 400
+
+    app = current_app._get_current_object()
+    workers = current_app.config['BATCH_WORKERS']
+    parallel = bool(data.get('parallel')) and workers > 0
+    headers = [(name, request.headers[name]) for name in FORWARDED_HEADERS if name in request.headers]
+    token = verified_token()
+    environ_base = {'REMOTE_ADDR': request.remote_addr, VERIFIED_TOKEN: token is not None}
+
+    results = []
+    reads = []
+    for index, item in enumerate(data['requests']):
+        if parallel and str(item.get('method', 'GET')).upper() in READ_METHODS:
+            reads.append((index, item))
+            continue
+        if reads:
+            results += _dispatch_reads(app, reads, headers, environ_base, token, workers)
+            reads = []
+        results.append(_dispatch(app, index, item, headers, environ_base, token))
+    if reads:
+        results += _dispatch_reads(app, reads, headers, environ_base, token, workers)
+
+    return jsonify({'responses': results}), 200
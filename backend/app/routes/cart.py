@@ -3,9 +3,12 @@ Cart Routes - Shopping cart management
 """
 from flask import Blueprint, request, jsonify
 from app import db
-from app.models.cart import CartItem
+from app.models.cart import SLIM_PRODUCT_FIELDS
 from app.models.product import Product
 from app.middleware.auth import token_required, get_current_user
+from app.services import inventory
+from app.services.cart_store import get_cart_store
+from app.serializers import product_serializer
 import logging
 
 bp = Blueprint('cart', __name__, url_prefix='/api/cart')
@@ -15,21 +18,16 @@ logger = logging.getLogger(__name__)
 @bp.route('', methods=['GET'])
 @token_required
 def get_cart():
-    """Get user's cart items"""
+    """Get user's cart items (``?view=slim`` returns only the product fields the cart UI uses)"""
+    default = SLIM_PRODUCT_FIELDS if request.args.get('view') == 'slim' else None
+    product_fields = product_serializer.requested_fields(default=default)
     try:
         user = get_current_user()
-        cart_items = CartItem.query.filter_by(user_id=user.id).all()
         
-        total = sum(item.product.price * item.quantity for item in cart_items if item.product)
-        
-        return jsonify({
-            'cart_items': [item.to_dict() for item in cart_items],
-            'total': total,
-            'count': len(cart_items)
-        }), 200
+        return jsonify(get_cart_store().get_view(user.id, product_fields=product_fields)), 200
         
     except Exception as e:
-        logger.error(f"Get cart error: {str(e)}")
+        logger.error("Get cart error: %s", e)
         return jsonify({'error': 'Failed to get cart', 'message': str(e)}), 500
 
 
@@ -52,31 +50,16 @@ def add_to_cart():
         if not product or not product.is_active:
             return jsonify({'error': 'Product not found'}), 404
         
-        # Check stock
-        if product.stock_quantity < quantity:
+        # Reserve stock for the cart line
+        if not inventory.reserve(user.id, product_id, quantity):
+            db.session.rollback()
             return jsonify({'error': 'Insufficient stock'}), 400
         
-        # Check if item already in cart
-        cart_item = CartItem.query.filter_by(
-            user_id=user.id,
-            product_id=product_id
-        ).first()
-        
-        if cart_item:
-            # Update quantity
-            cart_item.quantity += quantity
-        else:
-            # Create new cart item
-            cart_item = CartItem(
-                user_id=user.id,
-                product_id=product_id,
-                quantity=quantity
-            )
-            db.session.add(cart_item)
-        
+        # Add to cart (merges with an existing line for the product)
+        cart_item = get_cart_store().add(user.id, product_id, quantity)
         db.session.commit()
         
-        logger.info(f"Item added to cart: User {user.id}, Product {product_id}")
+        logger.info("Item added to cart: User %s, Product %s", user.id, product_id)
         
         return jsonify({
             'message': 'Item added to cart',
@@ -85,7 +68,7 @@ def add_to_cart():
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Add to cart error: {str(e)}")
+        logger.error("Add to cart error: %s", e)
         return jsonify({'error': 'Failed to add to cart', 'message': str(e)}), 500
 
 
@@ -95,10 +78,8 @@ def update_cart_item(cart_item_id):
     """Update cart item quantity"""
     try:
         user = get_current_user()
-        cart_item = CartItem.query.filter_by(
-            id=cart_item_id,
-            user_id=user.id
-        ).first()
+        store = get_cart_store()
+        cart_item = store.get_line(user.id, cart_item_id)
         
         if not cart_item:
             return jsonify({'error': 'Cart item not found'}), 404
@@ -106,14 +87,15 @@ def update_cart_item(cart_item_id):
         data = request.get_json()
         quantity = data.get('quantity', 1)
         
-        # Check stock
-        if cart_item.product.stock_quantity < quantity:
+        # Resize the stock reservation for the line
+        if not inventory.set_reservation(user.id, cart_item.product_id, quantity):
+            db.session.rollback()
             return jsonify({'error': 'Insufficient stock'}), 400
         
-        cart_item.quantity = quantity
+        cart_item = store.set_quantity(user.id, cart_item_id, quantity)
         db.session.commit()
         
-        logger.info(f"Cart item updated: {cart_item_id}")
+        logger.info("Cart item updated: %s", cart_item_id)
         
         return jsonify({
             'message': 'Cart item updated',
@@ -122,7 +104,7 @@ def update_cart_item(cart_item_id):
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Update cart error: {str(e)}")
+        logger.error("Update cart error: %s", e)
         return jsonify({'error': 'Failed to update cart', 'message': str(e)}), 500
 
 
@@ -132,24 +114,23 @@ def remove_from_cart(cart_item_id):
     """Remove item from cart"""
     try:
         user = get_current_user()
-        cart_item = CartItem.query.filter_by(
-            id=cart_item_id,
-            user_id=user.id
-        ).first()
+        store = get_cart_store()
+        cart_item = store.get_line(user.id, cart_item_id)
         
         if not cart_item:
             return jsonify({'error': 'Cart item not found'}), 404
         
-        db.session.delete(cart_item)
+        inventory.release(user.id, cart_item.product_id)
+        store.remove(user.id, cart_item_id)
         db.session.commit()
         
-        logger.info(f"Cart item removed: {cart_item_id}")
+        logger.info("Cart item removed: %s", cart_item_id)
         
         return jsonify({'message': 'Item removed from cart'}), 200
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Remove from cart error: {str(e)}")
+        logger.error("Remove from cart error: %s", e)
         return jsonify({'error': 'Failed to remove from cart', 'message': str(e)}), 500
 
 
@@ -159,14 +140,15 @@ def clear_cart():
     """Clear all items from cart"""
     try:
         user = get_current_user()
-        CartItem.query.filter_by(user_id=user.id).delete()
+        inventory.release(user.id)
+        get_cart_store().clear(user.id)
         db.session.commit()
         
-        logger.info(f"Cart cleared for user: {user.id}")
+        logger.info("Cart cleared for user: %s", user.id)
         
         return jsonify({'message': 'Cart cleared'}), 200
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Clear cart error: {str(e)}")
+        logger.error("Clear cart error: %s", e)
         return jsonify({'error': 'Failed to clear cart', 'message': str(e)}), 500
@@ -2,33 +2,41 @@
 Health Check Routes - For monitoring and DevOps
 """
 from flask import Blueprint, jsonify
-from app import db
+from app.readiness import get_readiness_monitor
 import logging
 
 bp = Blueprint('health', __name__)
 logger = logging.getLogger(__name__)
 
 
+@bp.route('/livez', methods=['GET'])
+def liveness():
+    """Liveness probe: the process is serving requests (no I/O)"""
+    return jsonify({'status': 'alive'}), 200
+
+
+@bp.route('/readyz', methods=['GET'])
+def readiness():
+    """Readiness probe: the last background health check (see app.readiness)"""
+    status = get_readiness_monitor().status()
+    return jsonify({**status, 'status': 'ready' if status['ready'] else 'not_ready'}), \
+        200 if status['ready'] else 503
+
+
 @bp.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint for load balancers and monitoring"""
-    try:
-        # Check database connection
-        db.session.execute(db.text('SELECT 1'))
-        
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'service': 'orders-api'
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return jsonify({
-            'status': 'unhealthy',
-            'database': 'disconnected',
-            'error': str(e)
-        }), 503
+    """Health check endpoint for load balancers and monitoring (served from the readiness status)"""
+    status = get_readiness_monitor().status()
+    database = status['checks'].get('database', {})
+    body = {
+        'status': 'healthy' if status['ready'] else 'unhealthy',
+        'database': 'connected' if 'latency_ms' in database else 'disconnected',
+        'service': 'orders-api'
+    }
+    if not status['ready']:
+        body['failing'] = status['failing']
+        return jsonify(body), 503
+    return jsonify(body), 200
 
 
 @bp.route('/api/status', methods=['GET'])
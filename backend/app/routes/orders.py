@@ -2,52 +2,95 @@
 Order Routes - Order management and processing
 """
 from flask import Blueprint, request, jsonify
+from flask_jwt_extended import get_jwt_identity
 from app import db
 from app.models.order import Order, OrderItem
-from app.models.cart import CartItem
 from app.models.product import Product
 from app.models.payment import Payment
 from app.middleware.auth import token_required, admin_required, get_current_user
+from app.middleware.conditional import conditional, aggregate_version
+from app.services import inventory
+from app.services.admission import get_admission_controller, AdmissionRejected, SoldOut
+from app.services.cart_store import get_cart_store
+from app.serializers import order_serializer, load_orders
+from app.sharding import is_sharded, scatter
 import logging
 import uuid
+from datetime import datetime
 
 bp = Blueprint('orders', __name__, url_prefix='/api/orders')
 logger = logging.getLogger(__name__)
 
+CANCELLABLE_STATUSES = ('pending', 'processing')
+
+
+def orders_validator(*criteria, all_shards=False):
+    """
+    Validator for order responses: count and latest update of the matching
+    orders, plus the catalog version when items (with their products) are included.
+    With ``all_shards`` the orders of every user shard are counted.
+    """
+    if all_shards:
+        versions = scatter(aggregate_version, Order, *criteria)
+        count = sum(shard_count for shard_count, _ in versions)
+        last_modified = max((updated for _, updated in versions if updated is not None), default=None)
+    else:
+        count, last_modified = aggregate_version(Order, *criteria)
+    if not count:
+        return (count, last_modified), None
+    
+    version = (count, last_modified)
+    if 'items' in order_serializer.requested_fields():
+        version += tuple(Product.catalog_version())
+    return version, last_modified
+
+
+def _user_orders_validator():
+    return orders_validator(Order.user_id == get_jwt_identity())
+
+
+def _user_order_validator(order_id):
+    state = orders_validator(Order.id == order_id, Order.user_id == get_jwt_identity())
+    return state if state[1] else None
+
 
 @bp.route('', methods=['GET'])
 @token_required
+@conditional(_user_orders_validator)
 def get_orders():
     """Get user's orders"""
+    fields = order_serializer.requested_fields()
     try:
         user = get_current_user()
-        orders = Order.query.filter_by(user_id=user.id).order_by(Order.created_at.desc()).all()
+        orders = load_orders(Order.user_id == user.id, fields=fields)
         
         return jsonify({
-            'orders': [order.to_dict() for order in orders],
+            'orders': orders,
             'count': len(orders)
         }), 200
         
     except Exception as e:
-        logger.error(f"Get orders error: {str(e)}")
+        logger.error("Get orders error: %s", e)
         return jsonify({'error': 'Failed to get orders', 'message': str(e)}), 500
 
 
 @bp.route('/<int:order_id>', methods=['GET'])
 @token_required
+@conditional(_user_order_validator)
 def get_order(order_id):
     """Get single order details"""
+    fields = order_serializer.requested_fields()
     try:
         user = get_current_user()
-        order = Order.query.filter_by(id=order_id, user_id=user.id).first()
+        orders = load_orders(Order.id == order_id, Order.user_id == user.id, fields=fields)
         
-        if not order:
+        if not orders:
             return jsonify({'error': 'Order not found'}), 404
         
-        return jsonify({'order': order.to_dict()}), 200
+        return jsonify({'order': orders[0]}), 200
         
     except Exception as e:
-        logger.error(f"Get order error: {str(e)}")
+        logger.error("Get order error: %s", e)
         return jsonify({'error': 'Failed to get order', 'message': str(e)}), 500
 
 
@@ -59,75 +102,173 @@ def checkout():
         user = get_current_user()
         data = request.get_json()
         
-        # Get cart items
-        cart_items = CartItem.query.filter_by(user_id=user.id).all()
+        # Get a consistent snapshot of the cart
+        store = get_cart_store()
+        cart = store.snapshot(user.id)
         
-        if not cart_items:
+        if not cart.lines:
             return jsonify({'error': 'Cart is empty'}), 400
         
-        # Calculate total and validate stock
-        total_amount = 0
-        for item in cart_items:
-            if not item.product or not item.product.is_active:
-                return jsonify({'error': f'Product {item.product_id} not available'}), 400
-            
-            if item.product.stock_quantity < item.quantity:
-                return jsonify({'error': f'Insufficient stock for {item.product.name}'}), 400
-            
-            total_amount += item.product.price * item.quantity
-        
-        # Create order
-        order = Order(
-            user_id=user.id,
-            total_amount=total_amount,
-            status='pending',
-            shipping_address=data.get('shipping_address', '')
-        )
-        db.session.add(order)
-        db.session.flush()  # Get order ID
-        
-        # Create order items and update stock
-        for item in cart_items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price_at_purchase=item.product.price
-            )
-            db.session.add(order_item)
-            
-            # Update product stock
-            item.product.stock_quantity -= item.quantity
+        # Bound concurrent checkouts per product before touching the database
+        with get_admission_controller().admit({item.product_id for item in cart.lines}):
+            return _place_order(user, data, store, cart)
         
-        # Create payment record
-        payment = Payment(
-            order_id=order.id,
-            amount=total_amount,
-            payment_method=data.get('payment_method', 'credit_card'),
-            payment_status='completed',  # Simulated payment
-            transaction_id=str(uuid.uuid4())
-        )
-        db.session.add(payment)
+    except SoldOut as e:
+        return jsonify({'error': str(e), 'reason': 'sold_out', 'product_id': e.product_id}), 503, {
+            'Retry-After': str(e.retry_after)
+        }
         
-        # Update order status
-        order.status = 'processing'
+    except AdmissionRejected as e:
+        logger.warning("Checkout rejected by admission control: %s", e.reason)
+        return jsonify({'error': 'Checkout is busy, please retry', 'reason': e.reason}), 503, {
+            'Retry-After': str(e.retry_after)
+        }
         
-        # Clear cart
-        CartItem.query.filter_by(user_id=user.id).delete()
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Checkout error: %s", e)
+        return jsonify({'error': 'Failed to create order', 'message': str(e)}), 500
+
+
+def _place_order(user, data, store, cart):
+    """Create the order, items and payment for a cart snapshot and take its stock"""
+    cart_items = cart.lines
+    products = {
+        product.id: product
+        for product in Product.query.filter(Product.id.in_({item.product_id for item in cart_items}))
+    }
+    
+    # Calculate total and validate products
+    total_amount = 0
+    for item in cart_items:
+        product = products.get(item.product_id)
+        if not product or not product.is_active:
+            return jsonify({'error': f'Product {item.product_id} not available'}), 400
         
+        total_amount += product.price * item.quantity
+    
+    # Create order
+    order = Order(
+        user_id=user.id,
+        total_amount=total_amount,
+        status='pending',
+        shipping_address=data.get('shipping_address', '')
+    )
+    db.session.add(order)
+    db.session.flush()  # Get order ID
+    
+    # Create order items
+    for item in cart_items:
+        db.session.add(OrderItem(
+            order_id=order.id,
+            product_id=item.product_id,
+            quantity=item.quantity,
+            price_at_purchase=products[item.product_id].price
+        ))
+    
+    # Create payment record
+    payment = Payment(
+        order_id=order.id,
+        amount=total_amount,
+        payment_method=data.get('payment_method', 'credit_card'),
+        payment_status='completed',  # Simulated payment
+        transaction_id=str(uuid.uuid4())
+    )
+    db.session.add(payment)
+    
+    # The order's shard and the stock are separate databases and one commit is not
+    # atomic across them: write the order first and the stock second, so a failed
+    # commit never leaves stock taken without an order. Each commit below writes to
+    # one database only
+    order_id = order.id
+    sharded = is_sharded()
+    if sharded:
+        try:
+            _commit()
+        except Exception:
+            # The shard may have committed before the default database failed
+            _discard_order(order_id)
+            raise
+    
+    # Take stock, converting the user's reservations
+    for item in cart_items:
+        if not inventory.consume(user.id, item.product_id, item.quantity):
+            db.session.rollback()
+            if sharded:
+                _discard_order(order_id)
+            product = products[item.product_id]
+            if product.total_stock <= 0:
+                get_admission_controller().mark_sold_out(product.id)
+            return jsonify({'error': f'Insufficient stock for {product.name}'}), 400
+    
+    if sharded:
+        try:
+            _commit()
+        except Exception:
+            _discard_order(order_id)
+            raise
+    
+    # Update order status (a failure here leaves a pending order holding its stock)
+    order.status = 'processing'
+    
+    # Clear cart
+    store.stage_checkout(user.id, cart)
+    
+    _commit()
+    store.finish_checkout(user.id, cart)
+    
+    logger.info("Order created: %s for user %s", order.id, user.id)
+    
+    return jsonify({
+        'message': 'Order placed successfully',
+        'order': order.to_dict()
+    }), 201
+
+
+def _commit():
+    """
+    Commit the session, discarding it if the commit fails.
+
+    A commit spanning the order's shard and the default database that fails
+    on one of them leaves no transaction to roll back on the other: close the
+    session instead, which returns its connections to the pool (rolling back
+    whatever is still open) and starts the next statement in a fresh one.
+    """
+    try:
         db.session.commit()
-        
-        logger.info(f"Order created: {order.id} for user {user.id}")
-        
-        return jsonify({
-            'message': 'Order placed successfully',
-            'order': order.to_dict()
-        }), 201
-        
+    except Exception:
+        db.session().invalidate()
+        raise
+
+
+def _discard_order(order_id):
+    """Delete an order committed ahead of its stock once taking the stock failed"""
+    try:
+        order = db.session.get(Order, order_id)
+        if order is not None:
+            db.session.delete(order)
+            db.session.commit()
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Checkout error: {str(e)}")
-        return jsonify({'error': 'Failed to create order', 'message': str(e)}), 500
+        logger.error("Could not discard order %s without stock: %s", order_id, e)
+
+
+def _revert_cancel(order_id, status, payment_status):
+    """Put back a committed cancellation whose stock could not be returned, so it can be retried"""
+    try:
+        db.session.execute(
+            db.update(Order)
+            .where(Order.id == order_id, Order.status == 'cancelled')
+            .values(status=status, updated_at=datetime.utcnow())
+        )
+        if payment_status is not None:
+            db.session.execute(
+                db.update(Payment).where(Payment.order_id == order_id).values(payment_status=payment_status)
+            )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Could not restore order %s after failing to return its stock: %s", order_id, e)
 
 
 @bp.route('/<int:order_id>/cancel', methods=['POST'])
@@ -141,26 +282,51 @@ def cancel_order(order_id):
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
-        if order.status not in ['pending', 'processing']:
+        if order.status not in CANCELLABLE_STATUSES:
             return jsonify({'error': 'Order cannot be cancelled'}), 400
         
-        # Restore stock
-        for item in order.order_items:
-            if item.product:
-                item.product.stock_quantity += item.quantity
+        # Claim the cancellation atomically: of two concurrent cancels only one
+        # matches the status, so stock is restored once
+        previous_status = order.status
+        claimed = db.session.execute(
+            db.update(Order)
+            .where(Order.id == order.id, Order.status.in_(CANCELLABLE_STATUSES))
+            .values(status='cancelled', updated_at=datetime.utcnow())
+            .execution_options(synchronize_session='fetch')
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return jsonify({'error': 'Order cannot be cancelled'}), 400
         
-        # Update order and payment status
-        order.status = 'cancelled'
+        previous_payment_status = None
         if order.payment:
+            previous_payment_status = order.payment.payment_status
             order.payment.payment_status = 'refunded'
+        lines = [(item.product_id, item.quantity) for item in order.order_items if item.product]
         
-        db.session.commit()
+        # As in checkout, the order and the stock may be on different databases:
+        # commit the cancellation first and put it back if the stock cannot be
+        # returned, so a failed cancel can simply be retried
+        sharded = is_sharded()
+        try:
+            if sharded:
+                _commit()
+            
+            # Restore stock
+            for product_id, quantity in lines:
+                inventory.restock(product_id, quantity)
+            _commit()
+        except Exception:
+            db.session.rollback()
+            if sharded:
+                _revert_cancel(order_id, previous_status, previous_payment_status)
+            raise
         
-        logger.info(f"Order cancelled: {order_id}")
+        logger.info("Order cancelled: %s", order_id)
         
         return jsonify({'message': 'Order cancelled successfully'}), 200
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Cancel order error: {str(e)}")
+        logger.error("Cancel order error: %s", e)
         return jsonify({'error': 'Failed to cancel order', 'message': str(e)}), 500
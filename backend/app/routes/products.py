@@ -3,55 +3,84 @@ Product Routes - Product catalog and management
 """
 from flask import Blueprint, request, jsonify
 from app import db
-from app.models.product import Product
+from app.models.product import Product, ProductStockShard
 from app.middleware.auth import token_required, admin_required
+from app.middleware.conditional import conditional
+from app.services import inventory
+from app.serializers import product_serializer
 import logging
 
 bp = Blueprint('products', __name__, url_prefix='/api/products')
 logger = logging.getLogger(__name__)
 
 
+def _catalog_validator(*args, **kwargs):
+    """Validator for catalog-wide responses (product list, categories)"""
+    version = Product.catalog_version()
+    return tuple(version), max(filter(None, version[1:]), default=None)
+
+
+def _product_validator(product_id):
+    """Validator for a single product: its own and its stock shards' modification times"""
+    row = db.session.execute(db.select(
+        Product.updated_at,
+        db.select(db.func.max(ProductStockShard.updated_at)).where(
+            ProductStockShard.product_id == product_id
+        ).scalar_subquery()
+    ).where(Product.id == product_id)).first()
+    
+    if not row:
+        return None
+    return tuple(row), max(filter(None, row), default=None)
+
+
 @bp.route('', methods=['GET'])
+@conditional(_catalog_validator, cache=True, coalesce=True)
 def get_products():
     """Get all active products (public endpoint)"""
+    serializer = product_serializer.compile(product_serializer.requested_fields())
     try:
         # Get query parameters for filtering
         category = request.args.get('category')
         search = request.args.get('search')
         
-        query = Product.query.filter_by(is_active=True)
+        query = serializer.select().where(Product.is_active.is_(True))
         
         if category:
-            query = query.filter_by(category=category)
+            query = query.where(Product.category == category)
         
         if search:
-            query = query.filter(Product.name.ilike(f'%{search}%'))
+            query = query.where(Product.name.ilike(f'%{search}%'))
         
-        products = query.all()
+        products = [serializer.from_row(row) for row in db.session.execute(query)]
         
         return jsonify({
-            'products': [product.to_dict() for product in products],
+            'products': products,
             'count': len(products)
         }), 200
         
     except Exception as e:
-        logger.error(f"Get products error: {str(e)}")
+        logger.error("Get products error: %s", e)
         return jsonify({'error': 'Failed to get products', 'message': str(e)}), 500
 
 
 @bp.route('/<int:product_id>', methods=['GET'])
+@conditional(_product_validator, cache=True, coalesce=True)
 def get_product(product_id):
     """Get single product by ID (public endpoint)"""
+    serializer = product_serializer.compile(product_serializer.requested_fields())
     try:
-        product = db.session.get(Product, product_id)
+        row = db.session.execute(
+            serializer.select().where(Product.id == product_id, Product.is_active.is_(True))
+        ).first()
         
-        if not product or not product.is_active:
+        if not row:
             return jsonify({'error': 'Product not found'}), 404
         
-        return jsonify({'product': product.to_dict()}), 200
+        return jsonify({'product': serializer.from_row(row)}), 200
         
     except Exception as e:
-        logger.error(f"Get product error: {str(e)}")
+        logger.error("Get product error: %s", e)
         return jsonify({'error': 'Failed to get product', 'message': str(e)}), 500
 
 
@@ -81,7 +110,7 @@ def create_product():
         db.session.add(product)
         db.session.commit()
         
-        logger.info(f"Product created: {product.name}")
+        logger.info("Product created: %s", product.name)
         
         return jsonify({
             'message': 'Product created successfully',
@@ -90,7 +119,7 @@ def create_product():
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Create product error: {str(e)}")
+        logger.error("Create product error: %s", e)
         return jsonify({'error': 'Failed to create product', 'message': str(e)}), 500
 
 
@@ -114,7 +143,7 @@ def update_product(product_id):
         if 'price' in data:
             product.price = data['price']
         if 'stock_quantity' in data:
-            product.stock_quantity = data['stock_quantity']
+            inventory.set_stock(product, data['stock_quantity'])
         if 'category' in data:
             product.category = data['category']
         if 'image_url' in data:
@@ -124,16 +153,20 @@ def update_product(product_id):
         
         db.session.commit()
         
-        logger.info(f"Product updated: {product.name}")
+        logger.info("Product updated: %s", product.name)
         
         return jsonify({
             'message': 'Product updated successfully',
             'product': product.to_dict()
         }), 200
         
+    except inventory.StockBelowReserved as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+        
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Update product error: {str(e)}")
+        logger.error("Update product error: %s", e)
         return jsonify({'error': 'Failed to update product', 'message': str(e)}), 500
 
 
@@ -151,17 +184,18 @@ def delete_product(product_id):
         product.is_active = False
         db.session.commit()
         
-        logger.info(f"Product deleted: {product.name}")
+        logger.info("Product deleted: %s", product.name)
         
         return jsonify({'message': 'Product deleted successfully'}), 200
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Delete product error: {str(e)}")
+        logger.error("Delete product error: %s", e)
         return jsonify({'error': 'Failed to delete product', 'message': str(e)}), 500
 
 
 @bp.route('/categories', methods=['GET'])
+@conditional(_catalog_validator, cache=True, coalesce=True)
 def get_categories():
     """Get all product categories"""
     try:
@@ -175,6 +209,6 @@ def get_categories():
         }), 200
 
     except Exception as e:
-        logger.error(f"Get categories error: {str(e)}")
+        logger.error("Get categories error: %s", e)
         return jsonify({'error': 'Failed to get categories', 'message': str(e)}), 500
 
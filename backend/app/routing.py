@@ -0,0 +1,163 @@
+"""
+Read-replica routing - Send read-only requests to replica binds
+
+Replicas are configured with ``DATABASE_REPLICA_URLS`` and registered as
+``replica_<n>`` binds. ``RoutingSession`` reads from a replica when the
+current request is read-only (GET/HEAD, or a view marked ``@read_only``) and
+everything else goes to the primary:
+
+* any INSERT/UPDATE/DELETE or flush switches the rest of the request to the
+  primary, so a transaction never mixes replica reads with its own writes;
+* after a user's successful mutation their reads stay on the primary for
+  ``READ_YOUR_WRITES_SECONDS`` so they see their own changes despite lag;
+* work outside a request (background threads, CLI) always uses the primary.
+
+Pins are kept per process; with several workers behind a load balancer a
+user may briefly read from a replica on another worker after a write.
+"""
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+import sqlalchemy as sa
+
+from app.sharding import shard_engine
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def read_only(fn):
+    """Mark a non-GET view as read-only so its queries may use a replica"""
+    fn.db_read_only = True
+    return fn
+
+
+class ReplicaRouter:
+    """Replica engine selection plus per-user read-your-writes pins"""
+
+    def __init__(self, engines, selection='round_robin', pin_seconds=5.0):
+        if selection not in ('round_robin', 'least_busy'):
+            raise ValueError(f"Unknown replica selection strategy: {selection}")
+        self.engines = list(engines)
+        self.selection = selection
+        self.pin_seconds = pin_seconds
+        self._next = itertools.count()
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """Pick a replica engine, or None if there are no replicas"""
+        if not self.engines:
+            return None
+        if self.selection == 'least_busy':
+            return min(self.engines, key=_checked_out)
+        return self.engines[next(self._next) % len(self.engines)]
+
+    def pin(self, user_id):
+        """Route the user's reads to the primary for ``pin_seconds``"""
+        if self.pin_seconds <= 0 or user_id is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._pins[user_id] = now + self.pin_seconds
+            # Drop expired pins now and then so the map does not grow without bound
+            if len(self._pins) > 1024:
+                self._pins = {user: until for user, until in self._pins.items() if until > now}
+
+    def is_pinned(self, user_id):
+        until = self._pins.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+def _checked_out(engine):
+    pool = engine.pool
+    return pool.checkedout() if hasattr(pool, 'checkedout') else 0
+
+
+def _current_identity():
+    try:
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+class RoutingSession(Session):
+    """Session that routes sharded tables to their shard and reads from a replica during read-only requests"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            shard = shard_engine(sa.inspect(mapper) if mapper is not None else None, clause)
+            if shard is not None and shard is not self._db.engines.get(None):
+                return shard
+
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_request_context() or not g.get('db_replica_reads'):
+            return primary
+
+        # Only the default bind is replicated; models on other binds stay where they are
+        engines = self._db.engines
+        if primary is not engines.get(None):
+            return primary
+
+        if self._flushing or getattr(clause, 'is_dml', False):
+            g.db_replica_reads = False
+            return primary
+
+        router = current_app.extensions.get('replica_router')
+        if router is None or router.is_pinned(_current_identity()):
+            return primary
+
+        # One replica per request, so all of its reads see the same snapshot
+        replica = g.get('db_replica')
+        if replica is None:
+            replica = g.db_replica = router.choose() or primary
+        return replica
+
+
+def route_request(router):
+    """Let the current request read from a replica if it is read-only (GET/HEAD or ``@read_only``)"""
+    view = current_app.view_functions.get(request.endpoint)
+    g.db_replica = None
+    g.db_replica_reads = bool(router.engines) and (
+        request.method in READ_METHODS or getattr(view, 'db_read_only', False)
+    )
+
+
+def pin_after_write(router, response):
+    """Keep the user's reads on the primary after the current request changed something"""
+    view = current_app.view_functions.get(request.endpoint)
+    if request.method not in READ_METHODS and not getattr(view, 'db_read_only', False) \
+            and response.status_code < 400:
+        router.pin(_current_identity())
+
+
+def init_replica_routing(app):
+    """Register the replica router and the per-request routing hooks"""
+    from app import db
+
+    with app.app_context():
+        replicas = [engine for key, engine in db.engines.items()
+                    if key is not None and key.startswith(REPLICA_BIND_PREFIX)]
+
+    router = ReplicaRouter(
+        replicas,
+        selection=app.config['REPLICA_SELECTION'],
+        pin_seconds=app.config['READ_YOUR_WRITES_SECONDS']
+    )
+    app.extensions['replica_router'] = router
+
+    @app.before_request
+    def choose_database_route():
+        route_request(router)
+
+    @app.after_request
+    def pin_writer(response):
+        pin_after_write(router, response)
+        return response
+
+    return router
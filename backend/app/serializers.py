@@ -0,0 +1,215 @@
+"""
+Serializers - Compiled row-to-JSON functions for read paths
+
+Each ``Serializer`` describes a model's JSON fields as SQL expressions. For a
+given field set it compiles, once, a function that turns a plain Core row
+tuple (or an ORM object) straight into a dict, so list endpoints neither load
+identity-mapped ORM objects nor build dicts one attribute at a time.
+Clients pick the fields they need with ``?fields=a,b,c``.
+"""
+import threading
+
+from flask import request
+from werkzeug.exceptions import BadRequest
+from app import db
+from app.models.user import User
+from app.models.product import Product
+from app.models.order import Order, OrderItem
+from app.models.payment import Payment
+
+
+class InvalidFields(BadRequest):
+    """Raised when ``?fields=`` names a field the resource does not have"""
+
+
+class Field:
+    """A serialized field: its SQL expression and ORM attribute"""
+
+    __slots__ = ('name', 'expression', 'attribute', 'is_datetime')
+
+    def __init__(self, name, expression, attribute=None, is_datetime=False):
+        self.name = name
+        self.expression = expression
+        self.attribute = attribute or name
+        self.is_datetime = is_datetime
+
+
+class CompiledSerializer:
+    """Columns to select and the compiled row/object functions for one field set"""
+
+    __slots__ = ('fields', 'columns', 'from_row', 'from_object')
+
+    def __init__(self, fields, columns, from_row, from_object):
+        self.fields = fields
+        self.columns = columns
+        self.from_row = from_row
+        self.from_object = from_object
+
+    def select(self):
+        """A Core SELECT of exactly the columns this field set needs"""
+        return db.select(*self.columns)
+
+
+class Serializer:
+    """Field definitions for a model plus a cache of compiled field sets"""
+
+    def __init__(self, name, fields, extra_fields=(), default_fields=None):
+        self.name = name
+        self._fields = {field.name: field for field in fields}
+        self.field_names = tuple(self._fields) + tuple(extra_fields)
+        self.default_fields = tuple(default_fields or self.field_names)
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def parse(self, value, default=None):
+        """Validate a comma separated field list; keeps the canonical field order"""
+        if not value:
+            return default or self.default_fields
+
+        requested = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = requested.difference(self.field_names)
+        if unknown:
+            raise InvalidFields(f"Unknown {self.name} field(s): {', '.join(sorted(unknown))}")
+
+        return tuple(name for name in self.field_names if name in requested)
+
+    def requested_fields(self, default=None):
+        """Field set requested with ``?fields=`` on the current request"""
+        return self.parse(request.args.get('fields'), default=default)
+
+    def compile(self, fields=None):
+        """Return the ``CompiledSerializer`` for a field set, building it on first use"""
+        key = tuple(name for name in (fields or self.default_fields) if name in self._fields)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            with self._lock:
+                compiled = self._compiled.get(key)
+                if compiled is None:
+                    compiled = self._compiled[key] = self._build(key)
+        return compiled
+
+    def _build(self, names):
+        fields = [self._fields[name] for name in names]
+        row_items = []
+        object_items = []
+        for index, field in enumerate(fields):
+            if field.is_datetime:
+                row_items.append(f"{field.name!r}: _iso(row[{index}])")
+                object_items.append(f"{field.name!r}: _iso(obj.{field.attribute})")
+            else:
+                row_items.append(f"{field.name!r}: row[{index}]")
+                object_items.append(f"{field.name!r}: obj.{field.attribute}")
+
+        source = (
+            "def from_row(row):\n"
+            f"    return {{{', '.join(row_items)}}}\n"
+            "def from_object(obj):\n"
+            f"    return {{{', '.join(object_items)}}}\n"
+        )
+        namespace = {'_iso': _iso}
+        exec(compile(source, f'<serializer {self.name}:{",".join(names)}>', 'exec'), namespace)
+
+        columns = [field.expression.label(field.name) for field in fields]
+        return CompiledSerializer(names, columns, namespace['from_row'], namespace['from_object'])
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _model_fields(model, names, datetimes=('created_at', 'updated_at')):
+    return [Field(name, getattr(model, name), is_datetime=name in datetimes) for name in names]
+
+
+product_serializer = Serializer('product', [
+    Field(name, expression, attribute={'stock_quantity': 'total_stock'}.get(name),
+          is_datetime=name in ('created_at', 'updated_at'))
+    for name, expression in Product.sql_fields().items()
+])
+
+user_serializer = Serializer('user', _model_fields(User, (
+    'id', 'email', 'first_name', 'last_name', 'role', 'is_active', 'created_at'
+)))
+
+payment_serializer = Serializer('payment', _model_fields(Payment, (
+    'id', 'order_id', 'amount', 'payment_method', 'payment_status', 'transaction_id', 'created_at', 'updated_at'
+)))
+
+order_item_serializer = Serializer('order item', _model_fields(OrderItem, (
+    'id', 'order_id', 'product_id', 'quantity', 'price_at_purchase'
+)) + [Field('subtotal', OrderItem.price_at_purchase * OrderItem.quantity)])
+
+order_serializer = Serializer('order', _model_fields(Order, (
+    'id', 'user_id', 'total_amount', 'status', 'shipping_address', 'created_at', 'updated_at'
+)), extra_fields=('items', 'payment'))
+
+# Orders without their items and payment (dashboard, list summaries)
+ORDER_SUMMARY_FIELDS = tuple(name for name in order_serializer.field_names if name not in ('items', 'payment'))
+
+
+def load_orders(*criteria, fields=None, limit=None):
+    """
+    Serialize the orders matching ``criteria``, newest first.
+
+    Items, their products and payments are fetched with one query each
+    (``WHERE order_id IN ...``) instead of per-order lazy loads.
+    """
+    fields = fields or order_serializer.default_fields
+    compiled = order_serializer.compile(fields)
+    statement = compiled.select().add_columns(Order.id.label('_order_id')).where(*criteria).order_by(
+        Order.created_at.desc()
+    )
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    rows = db.session.execute(statement).all()
+    orders = [(row[-1], compiled.from_row(row)) for row in rows]
+    order_ids = [order_id for order_id, _ in orders]
+
+    if 'items' in fields:
+        items_by_order = {order_id: [] for order_id in order_ids}
+        if order_ids:
+            item_compiled = order_item_serializer.compile()
+            item_rows = db.session.execute(
+                item_compiled.select().where(OrderItem.order_id.in_(order_ids)).order_by(OrderItem.id)
+            ).all()
+            items = [item_compiled.from_row(row) for row in item_rows]
+
+            product_compiled = product_serializer.compile()
+            product_ids = {item['product_id'] for item in items}
+            products = {}
+            if product_ids:
+                for row in db.session.execute(product_compiled.select().where(Product.id.in_(product_ids))):
+                    product = product_compiled.from_row(row)
+                    products[product['id']] = product
+
+            for item in items:
+                item['product'] = products.get(item['product_id'])
+                items_by_order[item['order_id']].append(item)
+
+        for order_id, order in orders:
+            order['items'] = items_by_order[order_id]
+
+    if 'payment' in fields:
+        payments = {}
+        if order_ids:
+            payment_compiled = payment_serializer.compile()
+            for row in db.session.execute(
+                payment_compiled.select().where(Payment.order_id.in_(order_ids))
+            ):
+                payment = payment_compiled.from_row(row)
+                payments[payment['order_id']] = payment
+
+        for order_id, order in orders:
+            order['payment'] = payments.get(order_id)
+
+    return [order for _, order in orders]
+
+
+def load_rows(serializer, *criteria, fields=None, order_by=None):
+    """Serialize the rows of a single model matching ``criteria``"""
+    compiled = serializer.compile(fields)
+    statement = compiled.select().where(*criteria)
+    if order_by is not None:
+        statement = statement.order_by(order_by)
+    return [compiled.from_row(row) for row in db.session.execute(statement)]
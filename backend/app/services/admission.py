@@ -0,0 +1,235 @@
+"""
+Admission Control - Bounded, fair concurrency for checkout
+
+Checkout requests must pass a global gate and one gate per product in the
+cart before they touch the database. Each gate admits up to ``limit``
+requests at a time; the rest wait in a FIFO queue (bounded by ``max_queue``)
+for at most ``timeout`` seconds. Products known to be sold out are rejected
+immediately without queueing or touching the database; both rejections are
+``503`` with ``Retry-After`` (a sold-out mark lasts ``sold_out_ttl`` seconds).
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import current_app
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted (queue full or wait timed out)"""
+
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class SoldOut(Exception):
+    """Raised when a requested product is known to have no stock left"""
+
+    def __init__(self, product_id, retry_after=1):
+        super().__init__(f'Product {product_id} is sold out')
+        self.product_id = product_id
+        self.retry_after = retry_after
+
+
+class Gate:
+    """FIFO counting semaphore with a bounded waiting queue"""
+
+    def __init__(self, limit, max_queue):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_depth = 0
+        self.refs = 0  # admit() calls using this gate (product gates); it is dropped at zero
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    @property
+    def idle(self):
+        return self.active == 0 and not self._waiters
+
+    def acquire(self, timeout):
+        """Take a slot, waiting in line for up to ``timeout`` seconds"""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                self.admitted += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected('queue_full')
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+            self.max_depth = max(self.max_depth, len(self._waiters))
+
+        if waiter.wait(timeout):
+            return
+
+        with self._lock:
+            # The slot may have been handed over just as the wait timed out
+            if waiter.is_set():
+                return
+            self._waiters.remove(waiter)
+            self.timeouts += 1
+        raise AdmissionRejected('timeout')
+
+    def release(self):
+        """Free a slot, handing it straight to the longest waiter if any"""
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().set()
+                self.admitted += 1
+            else:
+                self.active -= 1
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_depth,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts
+        }
+
+
+class AdmissionController:
+    """Global and per-product checkout gates plus a short-lived sold-out cache"""
+
+    def __init__(self, global_limit=0, product_limit=0, product_limits=None,
+                 max_queue=256, timeout=5.0, sold_out_ttl=5.0):
+        self.product_limit = product_limit
+        self.product_limits = product_limits or {}
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.sold_out_ttl = sold_out_ttl
+        self.global_gate = Gate(global_limit, max_queue) if global_limit > 0 else None
+        self.sold_out_rejections = 0
+        self._product_gates = {}
+        self._sold_out = {}
+        self._lock = threading.Lock()
+
+    # Sold-out cache ---------------------------------------------------------
+
+    def mark_sold_out(self, product_id):
+        """Remember that a product has no stock left (for ``sold_out_ttl`` seconds)"""
+        self._sold_out[product_id] = time.monotonic() + self.sold_out_ttl
+
+    def clear_sold_out(self, product_id):
+        """Forget a sold-out mark, e.g. after a restock"""
+        self._sold_out.pop(product_id, None)
+
+    def is_sold_out(self, product_id):
+        expires = self._sold_out.get(product_id)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            self._sold_out.pop(product_id, None)
+            return False
+        return True
+
+    # Gates ------------------------------------------------------------------
+
+    def _product_gate(self, product_id):
+        """The product's gate with one more reference (None if the product is unlimited)"""
+        limit = self.product_limits.get(product_id, self.product_limit)
+        if limit <= 0:
+            return None
+        with self._lock:
+            gate = self._product_gates.get(product_id)
+            if gate is None:
+                gate = self._product_gates[product_id] = Gate(limit, self.max_queue)
+            gate.refs += 1
+            return gate
+
+    def _unref(self, product_id, gate):
+        # A gate is only dropped once no request can still queue on it; dropping it
+        # earlier would let a later request create a second gate for the same product
+        with self._lock:
+            gate.refs -= 1
+            if gate.refs == 0 and gate.idle and self._product_gates.get(product_id) is gate:
+                del self._product_gates[product_id]
+
+    @contextmanager
+    def admit(self, product_ids):
+        """
+        Hold a checkout slot for the given products while the block runs.
+
+        Raises ``SoldOut`` for products known to be out of stock and
+        ``AdmissionRejected`` when the queue is full or the wait times out.
+        """
+        for product_id in product_ids:
+            if self.is_sold_out(product_id):
+                self.sold_out_rejections += 1
+                raise SoldOut(product_id, retry_after=max(1, math.ceil(self.sold_out_ttl)))
+
+        deadline = time.monotonic() + self.timeout
+        gates = [(None, self.global_gate)] if self.global_gate else []
+        # Acquire product gates in a fixed order so carts never deadlock
+        gates += [(product_id, self._product_gate(product_id)) for product_id in sorted(product_ids)]
+        held = []
+        try:
+            for product_id, gate in gates:
+                if gate is None:
+                    continue
+                gate.acquire(max(deadline - time.monotonic(), 0))
+                held.append(gate)
+            yield
+        finally:
+            for gate in reversed(held):
+                gate.release()
+            for product_id, gate in gates:
+                if product_id is not None and gate is not None:
+                    self._unref(product_id, gate)
+
+    def stats(self):
+        """Queue depth and admission counters for the global and product gates"""
+        with self._lock:
+            products = {str(product_id): gate.stats() for product_id, gate in self._product_gates.items()}
+        return {
+            'global': self.global_gate.stats() if self.global_gate else None,
+            'products': products,
+            'queue_depth': (self.global_gate.queue_depth if self.global_gate else 0)
+            + sum(gate['queue_depth'] for gate in products.values()),
+            'sold_out': [product_id for product_id in list(self._sold_out) if self.is_sold_out(product_id)],
+            'sold_out_rejections': self.sold_out_rejections
+        }
+
+
+def _parse_product_limits(value):
+    """Parse ``"12:2,15:4"`` into ``{12: 2, 15: 4}``"""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        product_id, limit = entry.split(':')
+        limits[int(product_id)] = int(limit)
+    return limits
+
+
+def init_admission(app):
+    """Create the checkout admission controller and register it on the app"""
+    controller = AdmissionController(
+        global_limit=app.config['CHECKOUT_MAX_CONCURRENCY'],
+        product_limit=app.config['CHECKOUT_PRODUCT_CONCURRENCY'],
+        product_limits=_parse_product_limits(app.config['CHECKOUT_PRODUCT_LIMITS']),
+        max_queue=app.config['CHECKOUT_MAX_QUEUE'],
+        timeout=app.config['CHECKOUT_QUEUE_TIMEOUT'],
+        sold_out_ttl=app.config['SOLD_OUT_CACHE_TTL']
+    )
+    app.extensions['admission'] = controller
+    return controller
+
+
+def get_admission_controller():
+    """Return the admission controller for the current app"""
+    return current_app.extensions['admission']
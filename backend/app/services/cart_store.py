@@ -0,0 +1,494 @@
+"""
+Cart Store - Pluggable storage backends for shopping carts
+
+``SQLAlchemyCartStore`` keeps every cart line as a committed ``cart_items`` row.
+``WriteBehindCartStore`` serves carts from a key-value store and persists the
+changed carts to ``cart_items`` in batches from a background thread, so cart
+traffic stops being a stream of single-row commits against the primary DB.
+"""
+import atexit
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+
+from flask import current_app
+from app import db
+from app.dialects import bulk_insert
+from app.models.cart import CartItem
+from app.models.product import Product
+from app.serializers import product_serializer
+from app.sharding import get_shard_router, is_sharded, scatter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CartLine:
+    """A single cart line, independent of the storage backend"""
+    id: int
+    user_id: int
+    product_id: int
+    quantity: int
+    created_at: datetime
+
+    def to_dict(self):
+        """Convert cart line to dictionary (same shape as ``CartItem.to_dict()``)"""
+        product = db.session.get(Product, self.product_id)
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'product_id': self.product_id,
+            'product': product.to_dict() if product else None,
+            'quantity': self.quantity,
+            'subtotal': product.price * self.quantity if product else 0,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+@dataclass(frozen=True)
+class CartSnapshot:
+    """Point-in-time copy of a user's cart, used by checkout"""
+    user_id: int
+    lines: tuple
+    version: int = 0
+
+
+def build_cart_view(lines, product_fields=None):
+    """
+    Cart response for ``lines`` with one query for their products.
+
+    Used when cart lines do not live next to the products table (write-behind
+    store, user shards), so the view cannot be a single joined query.
+    """
+    serializer = product_serializer.compile(product_fields)
+
+    products = {}
+    prices = {}
+    if lines:
+        rows = db.session.execute(
+            serializer.select().add_columns(Product.id, Product.price)
+            .where(Product.id.in_({line.product_id for line in lines}))
+        ).all()
+        for row in rows:
+            product_id, price = row[-2:]
+            products[product_id] = serializer.from_row(row)
+            prices[product_id] = price
+
+    cart_items = []
+    total = 0
+    for line in lines:
+        product = products.get(line.product_id)
+        subtotal = prices[line.product_id] * line.quantity if product else 0
+        total += subtotal
+        cart_items.append({
+            'id': line.id,
+            'user_id': line.user_id,
+            'product_id': line.product_id,
+            'product': product,
+            'quantity': line.quantity,
+            'subtotal': subtotal,
+            'created_at': line.created_at.isoformat()
+        })
+
+    return {'cart_items': cart_items, 'total': total, 'count': len(cart_items)}
+
+
+class CartStore(ABC):
+    """Interface implemented by every cart storage backend"""
+
+    @abstractmethod
+    def get_view(self, user_id, product_fields=None):
+        """Return the cart response (lines, subtotals, total, count) with the given product fields"""
+
+    @abstractmethod
+    def get_line(self, user_id, item_id):
+        """Return a cart line by id, or None"""
+
+    @abstractmethod
+    def add(self, user_id, product_id, quantity):
+        """Add quantity of a product, merging with an existing line"""
+
+    @abstractmethod
+    def set_quantity(self, user_id, item_id, quantity):
+        """Set the quantity of a line; returns the updated line or None"""
+
+    @abstractmethod
+    def remove(self, user_id, item_id):
+        """Remove a line; returns True if it existed"""
+
+    @abstractmethod
+    def clear(self, user_id):
+        """Remove every line from the user's cart"""
+
+    @abstractmethod
+    def snapshot(self, user_id):
+        """Return a consistent ``CartSnapshot`` of the user's cart"""
+
+    @abstractmethod
+    def stage_checkout(self, user_id, snapshot):
+        """Called inside the checkout transaction, before commit"""
+
+    @abstractmethod
+    def finish_checkout(self, user_id, snapshot):
+        """Called once the checkout transaction has committed"""
+
+    def flush(self):
+        """Persist any buffered changes"""
+
+
+class SQLAlchemyCartStore(CartStore):
+    """Cart lines stored directly as ``cart_items`` rows (one commit per change)"""
+
+    @staticmethod
+    def _line(item):
+        return CartLine(item.id, item.user_id, item.product_id, item.quantity, item.created_at)
+
+    def get_view(self, user_id, product_fields=None):
+        if is_sharded():
+            # Cart rows and products are in different databases: no join
+            return build_cart_view(self.snapshot(user_id).lines, product_fields)
+        return CartItem.get_cart_view(user_id, product_fields=product_fields)
+
+    def get_line(self, user_id, item_id):
+        item = CartItem.query.filter_by(id=item_id, user_id=user_id).first()
+        return self._line(item) if item else None
+
+    def add(self, user_id, product_id, quantity):
+        cart_item = CartItem.query.filter_by(user_id=user_id, product_id=product_id).first()
+
+        if cart_item:
+            cart_item.quantity += quantity
+        else:
+            cart_item = CartItem(user_id=user_id, product_id=product_id, quantity=quantity)
+            db.session.add(cart_item)
+
+        db.session.commit()
+        return self._line(cart_item)
+
+    def set_quantity(self, user_id, item_id, quantity):
+        cart_item = CartItem.query.filter_by(id=item_id, user_id=user_id).first()
+        if not cart_item:
+            return None
+
+        cart_item.quantity = quantity
+        db.session.commit()
+        return self._line(cart_item)
+
+    def remove(self, user_id, item_id):
+        deleted = CartItem.query.filter_by(id=item_id, user_id=user_id).delete()
+        db.session.commit()
+        return deleted > 0
+
+    def clear(self, user_id):
+        CartItem.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+    def snapshot(self, user_id):
+        items = CartItem.query.filter_by(user_id=user_id).order_by(CartItem.id).all()
+        return CartSnapshot(user_id, tuple(self._line(item) for item in items))
+
+    def stage_checkout(self, user_id, snapshot):
+        # Deleting in the checkout transaction keeps order + cart atomic
+        CartItem.query.filter_by(user_id=user_id).delete()
+
+    def finish_checkout(self, user_id, snapshot):
+        pass
+
+
+class LocalKeyValueStore:
+    """
+    Process-local stand-in for a shared key-value store such as Redis.
+
+    Exposes the small hash/counter subset the write-behind cart store needs.
+    Swap in a client for a real shared store to share carts across processes.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._data.get(key, {}))
+
+    def hset(self, key, field, value):
+        with self._lock:
+            self._data.setdefault(key, {})[field] = value
+
+    def hdel(self, key, field):
+        with self._lock:
+            return self._data.get(key, {}).pop(field, None) is not None
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, value, nx=False):
+        with self._lock:
+            if nx and key in self._data:
+                return False
+            self._data[key] = value
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + amount
+            return self._data[key]
+
+
+class WriteBehindCartStore(CartStore):
+    """
+    Carts served from a key-value store, persisted to ``cart_items`` write-behind.
+
+    Mutations only touch the key-value store and mark the user's cart dirty.
+    A background thread flushes dirty carts every ``flush_interval`` seconds,
+    replacing each cart's rows in batches of ``batch_size`` users per
+    transaction. Carts not yet in the key-value store are loaded from the DB
+    on first access.
+    """
+
+    def __init__(self, app, kv=None, flush_interval=2.0, batch_size=500):
+        self.app = app
+        self.kv = kv or LocalKeyValueStore()
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._dirty = set()
+        self._wakeup = threading.Event()
+        self._flusher_pid = None
+        atexit.register(self.flush)
+
+    # Key-value layout -------------------------------------------------------
+
+    @staticmethod
+    def _cart_key(user_id):
+        return f'cart:{user_id}'
+
+    @staticmethod
+    def _loaded_key(user_id):
+        return f'cart:{user_id}:loaded'
+
+    @staticmethod
+    def _version_key(user_id):
+        return f'cart:{user_id}:version'
+
+    def _next_item_id(self):
+        if self.kv.get('cart:next_id') is None:
+            max_id = max(max_ids or 0 for max_ids in scatter(
+                lambda: db.session.query(db.func.max(CartItem.id)).scalar()
+            ))
+            self.kv.set('cart:next_id', max_id, nx=True)
+        return self.kv.incr('cart:next_id')
+
+    def _load(self, user_id):
+        """Return the user's lines keyed by product id, loading from the DB on a miss"""
+        if not self.kv.get(self._loaded_key(user_id)):
+            with self._lock:
+                if not self.kv.get(self._loaded_key(user_id)):
+                    for item in CartItem.query.filter_by(user_id=user_id).all():
+                        self.kv.hset(self._cart_key(user_id), item.product_id,
+                                     (item.id, item.quantity, item.created_at))
+                    self.kv.set(self._loaded_key(user_id), True)
+
+        return {
+            product_id: CartLine(item_id, user_id, product_id, quantity, created_at)
+            for product_id, (item_id, quantity, created_at) in self.kv.hgetall(self._cart_key(user_id)).items()
+        }
+
+    def _touch(self, user_id):
+        """Record a mutation: bump the cart version and schedule a flush"""
+        self.kv.incr(self._version_key(user_id))
+        with self._lock:
+            self._dirty.add(user_id)
+        self._ensure_flusher()
+
+    # CartStore interface ----------------------------------------------------
+
+    def get_view(self, user_id, product_fields=None):
+        return build_cart_view(sorted(self._load(user_id).values(), key=lambda line: line.id), product_fields)
+
+    def get_line(self, user_id, item_id):
+        for line in self._load(user_id).values():
+            if line.id == item_id:
+                return line
+        return None
+
+    def add(self, user_id, product_id, quantity):
+        with self._lock:
+            line = self._load(user_id).get(product_id)
+            if line:
+                line = CartLine(line.id, user_id, product_id, line.quantity + quantity, line.created_at)
+            else:
+                line = CartLine(self._next_item_id(), user_id, product_id, quantity, datetime.utcnow())
+            self.kv.hset(self._cart_key(user_id), product_id, (line.id, line.quantity, line.created_at))
+
+        self._touch(user_id)
+        return line
+
+    def set_quantity(self, user_id, item_id, quantity):
+        with self._lock:
+            line = self.get_line(user_id, item_id)
+            if not line:
+                return None
+            line = CartLine(line.id, user_id, line.product_id, quantity, line.created_at)
+            self.kv.hset(self._cart_key(user_id), line.product_id, (line.id, line.quantity, line.created_at))
+
+        self._touch(user_id)
+        return line
+
+    def remove(self, user_id, item_id):
+        with self._lock:
+            line = self.get_line(user_id, item_id)
+            if not line:
+                return False
+            self.kv.hdel(self._cart_key(user_id), line.product_id)
+
+        self._touch(user_id)
+        return True
+
+    def clear(self, user_id):
+        with self._lock:
+            self.kv.delete(self._cart_key(user_id))
+            self.kv.set(self._loaded_key(user_id), True)
+
+        self._touch(user_id)
+
+    def snapshot(self, user_id):
+        with self._lock:
+            lines = self._load(user_id)
+            version = self.kv.get(self._version_key(user_id)) or 0
+        return CartSnapshot(user_id, tuple(sorted(lines.values(), key=lambda line: line.id)), version)
+
+    def stage_checkout(self, user_id, snapshot):
+        # Drop any persisted rows in the checkout transaction; lines added
+        # concurrently are re-persisted by the next flush
+        CartItem.query.filter_by(user_id=user_id).delete()
+
+    def finish_checkout(self, user_id, snapshot):
+        with self._lock:
+            if (self.kv.get(self._version_key(user_id)) or 0) == snapshot.version:
+                self.kv.delete(self._cart_key(user_id))
+            else:
+                # The cart changed after the snapshot: only remove what was ordered
+                current = self._load(user_id)
+                for ordered in snapshot.lines:
+                    line = current.get(ordered.product_id)
+                    if not line:
+                        continue
+                    remaining = line.quantity - ordered.quantity
+                    if remaining > 0:
+                        self.kv.hset(self._cart_key(user_id), line.product_id,
+                                     (line.id, remaining, line.created_at))
+                    else:
+                        self.kv.hdel(self._cart_key(user_id), line.product_id)
+
+        self._touch(user_id)
+
+    # Write-behind persistence -----------------------------------------------
+
+    @property
+    def pending(self):
+        """Number of carts waiting to be persisted"""
+        return len(self._dirty)
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._run_flusher, name='cart-flusher', daemon=True).start()
+
+    def _run_flusher(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Cart flush error: %s", e)
+
+    def flush(self):
+        """Persist all dirty carts, ``batch_size`` users per transaction"""
+        with self._lock:
+            dirty, self._dirty = list(self._dirty), set()
+
+        if not dirty:
+            return
+
+        table = CartItem.__table__
+        with self.app.app_context():
+            router = get_shard_router()
+            by_shard = {}
+            for user_id in dirty:
+                by_shard.setdefault(router.shard_for_user(user_id), []).append(user_id)
+
+        for shard, users in by_shard.items():
+            self._flush_shard(router.engine(shard), table, users)
+
+        logger.debug("Flushed %s carts", len(dirty))
+
+    def _flush_shard(self, engine, table, users):
+        for start in range(0, len(users), self.batch_size):
+            batch = users[start:start + self.batch_size]
+            rows = []
+            now = datetime.utcnow()
+            for user_id in batch:
+                for product_id, (item_id, quantity, created_at) in self.kv.hgetall(self._cart_key(user_id)).items():
+                    rows.append({
+                        'id': item_id,
+                        'user_id': user_id,
+                        'product_id': product_id,
+                        'quantity': quantity,
+                        'created_at': created_at,
+                        'updated_at': now
+                    })
+
+            try:
+                with engine.begin() as connection:
+                    connection.execute(table.delete().where(table.c.user_id.in_(batch)))
+                    bulk_insert(connection, table, rows)
+            except Exception:
+                with self._lock:
+                    self._dirty.update(batch)
+                raise
+
+
+def init_cart_store(app):
+    """Create the configured cart store and register it on the app"""
+    backend = app.config['CART_STORE']
+
+    if backend == 'sql':
+        store = SQLAlchemyCartStore()
+    elif backend == 'memory':
+        # Each process would keep its own copy of a cart, and its flush would overwrite the rows
+        # written by the others
+        if app.config['WEB_CONCURRENCY'] > 1:
+            raise ValueError(
+                f"CART_STORE=memory keeps carts in one process; use CART_STORE=sql with "
+                f"WEB_CONCURRENCY={app.config['WEB_CONCURRENCY']}"
+            )
+        store = WriteBehindCartStore(
+            app,
+            flush_interval=app.config['CART_FLUSH_INTERVAL'],
+            batch_size=app.config['CART_FLUSH_BATCH_SIZE']
+        )
+    else:
+        raise ValueError(f'Unknown CART_STORE: {backend}')
+
+    app.extensions['cart_store'] = store
+    return store
+
+
+def get_cart_store():
+    """Return the cart store for the current app"""
+    return current_app.extensions['cart_store']
@@ -0,0 +1,474 @@
+"""
+Inventory Service - Stock reservations and stock movements
+
+Adding to the cart reserves stock for ``STOCK_RESERVATION_TTL`` seconds. The
+amount held is kept in ``products.reserved_quantity`` so availability is a
+column read (``stock_quantity - reserved_quantity``) rather than a sum over
+reservations. Every stock change is a single conditional UPDATE, so two
+requests can never both take the last unit.
+
+Hot products can be switched to sharded inventory with ``shard_product()``.
+Their stock and reservations then live in N ``product_stock_shards`` rows;
+each change picks a random shard with enough headroom, so concurrent
+checkouts of the same product update different rows. A quantity no single
+shard can cover is split over several shards (stock taken at checkout) or
+gathered onto one (a reservation, which points at a single shard), each
+part a conditional UPDATE in the same transaction. Reads sum the shards.
+"""
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from app import db
+from app.models.product import Product, ProductStockShard
+from app.models.reservation import StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class StockBelowReserved(Exception):
+    """Raised when stock on hand would be set below the units held by cart reservations"""
+
+    def __init__(self, quantity, reserved):
+        super().__init__(f'Stock cannot be set to {quantity}: {reserved} units are reserved in carts')
+        self.quantity = quantity
+        self.reserved = reserved
+
+
+def _reservations_enabled():
+    return current_app.config['STOCK_RESERVATIONS_ENABLED']
+
+
+def _shard_count(product_id):
+    return db.session.query(Product.stock_shard_count).filter_by(id=product_id).scalar() or 0
+
+
+def _adjust(product_id, stock_delta=0, reserved_delta=0, required=None):
+    """
+    Apply a stock/reservation delta to a product in one statement.
+
+    When ``required`` is given the update only happens if at least that much
+    stock is available. Returns True if the row was updated.
+    """
+    statement = db.update(Product).where(Product.id == product_id).values(
+        stock_quantity=Product.stock_quantity + stock_delta,
+        reserved_quantity=Product.reserved_quantity + reserved_delta
+    )
+    if required is not None:
+        statement = statement.where(Product.stock_quantity - Product.reserved_quantity >= required)
+
+    result = db.session.execute(statement.execution_options(synchronize_session='fetch'))
+    return result.rowcount > 0
+
+
+def _adjust_shard(product_id, shard_index, stock_delta=0, reserved_delta=0, required=None):
+    """Same as ``_adjust()`` for a single stock shard"""
+    statement = db.update(ProductStockShard).where(
+        ProductStockShard.product_id == product_id,
+        ProductStockShard.shard_index == shard_index
+    ).values(
+        quantity=ProductStockShard.quantity + stock_delta,
+        reserved_quantity=ProductStockShard.reserved_quantity + reserved_delta
+    )
+    if required is not None:
+        statement = statement.where(ProductStockShard.quantity - ProductStockShard.reserved_quantity >= required)
+
+    result = db.session.execute(statement.execution_options(synchronize_session='fetch'))
+    return result.rowcount > 0
+
+
+def _adjust_any_shard(product_id, quantity, stock_delta=0, reserved_delta=0):
+    """Apply a delta to a random shard with at least ``quantity`` headroom; returns its index or None"""
+    indexes = list(range(_shard_count(product_id)))
+    random.shuffle(indexes)
+    for shard_index in indexes:
+        if _adjust_shard(product_id, shard_index, stock_delta, reserved_delta, required=quantity):
+            return shard_index
+    return None
+
+
+def _shard_free(product_id):
+    """``[(shard_index, free units), ...]`` for a product, most free first"""
+    free = ProductStockShard.quantity - ProductStockShard.reserved_quantity
+    return db.session.execute(
+        db.select(ProductStockShard.shard_index, free).where(
+            ProductStockShard.product_id == product_id
+        ).order_by(free.desc(), ProductStockShard.shard_index)
+    ).all()
+
+
+def _take_from_shards(product_id, quantity, exclude=None):
+    """
+    Take ``quantity`` free units out of as many shards as needed.
+
+    Each shard gives what it has with its own conditional UPDATE, so a
+    concurrent change never drives one below its reservations; the shards
+    are read again once if one changed in between. Returns the units taken
+    per shard, or None if the shards together do not have enough (the
+    caller rolls back).
+    """
+    needed, taken = quantity, {}
+    for _ in range(2):
+        for shard_index, free in _shard_free(product_id):
+            if needed <= 0:
+                break
+            if shard_index == exclude or free <= 0:
+                continue
+            units = min(free, needed)
+            if _adjust_shard(product_id, shard_index, stock_delta=-units, required=units):
+                taken[shard_index] = taken.get(shard_index, 0) + units
+                needed -= units
+        if needed <= 0:
+            return taken
+    return None
+
+
+def _take_stock(product_id, quantity):
+    """Take ``quantity`` units of stock from one shard if possible, else spread over several"""
+    if _adjust_any_shard(product_id, quantity, stock_delta=-quantity) is not None:
+        return True
+    return _take_from_shards(product_id, quantity) is not None
+
+
+def _reserve_any_shard(product_id, quantity):
+    """
+    Hold ``quantity`` units on one shard and return its index (None if out of stock).
+
+    When no shard has enough free stock on its own, free units are moved from
+    the other shards onto the one with the most and held there.
+    """
+    shard_index = _adjust_any_shard(product_id, quantity, reserved_delta=quantity)
+    if shard_index is not None:
+        return shard_index
+
+    shards = _shard_free(product_id)
+    if not shards:
+        return None
+    target, free = shards[0]
+    moved = _take_from_shards(product_id, quantity - max(free, 0), exclude=target)
+    if moved is None:
+        return None
+    moved = sum(moved.values())
+    if not _adjust_shard(product_id, target, stock_delta=moved, reserved_delta=quantity, required=quantity - moved):
+        return None
+    return target
+
+
+def _release_held(product_id, shard_index, quantity):
+    """Give held units back to the product or shard holding them"""
+    if shard_index is None:
+        _adjust(product_id, reserved_delta=-quantity)
+    else:
+        _adjust_shard(product_id, shard_index, reserved_delta=-quantity)
+
+
+def _claim(user_id, product_id=None):
+    """
+    Delete the user's reservations (for one product, or all) and return what they held.
+
+    The DELETE ... RETURNING is the claim: if the sweeper (or another request)
+    already removed a row, it is simply not returned, so a hold is never
+    released twice. Returns ``(product_id, shard_index, quantity, created_at)`` rows.
+    """
+    table = StockReservation.__table__
+    statement = table.delete().where(table.c.user_id == user_id)
+    if product_id is not None:
+        statement = statement.where(table.c.product_id == product_id)
+    return db.session.execute(statement.returning(
+        table.c.product_id, table.c.shard_index, table.c.quantity, table.c.created_at
+    )).all()
+
+
+def _hold(user_id, product_id, quantity):
+    """Make the user's reservation for a product exactly ``quantity`` units"""
+    claimed = _claim(user_id, product_id)
+    _, shard_index, held, created_at = claimed[0] if claimed else (None, None, 0, None)
+    delta = quantity - held
+
+    if _shard_count(product_id):
+        # Resize in place on the current shard, otherwise move the whole hold
+        if shard_index is None or not _adjust_shard(product_id, shard_index, reserved_delta=delta, required=delta):
+            if held:
+                _release_held(product_id, shard_index, held)
+            shard_index = _reserve_any_shard(product_id, quantity)
+            if shard_index is None:
+                return False
+    else:
+        shard_index = None
+        if delta > 0 and not _adjust(product_id, reserved_delta=delta, required=delta):
+            return False
+        if delta < 0:
+            _adjust(product_id, reserved_delta=delta)
+
+    db.session.add(StockReservation(
+        user_id=user_id,
+        product_id=product_id,
+        quantity=quantity,
+        shard_index=shard_index,
+        expires_at=datetime.utcnow() + timedelta(seconds=current_app.config['STOCK_RESERVATION_TTL']),
+        created_at=created_at or datetime.utcnow()
+    ))
+
+    current_app.extensions['reservation_sweeper'].ensure_started()
+    return True
+
+
+def reserve(user_id, product_id, quantity):
+    """
+    Reserve ``quantity`` more units of a product for the user's cart.
+
+    Returns False if not enough stock is available; the caller then rolls
+    back. The caller commits.
+    """
+    if not _reservations_enabled():
+        product = db.session.get(Product, product_id)
+        return product is not None and product.available_quantity >= quantity
+
+    held = db.session.query(StockReservation.quantity).filter_by(
+        user_id=user_id, product_id=product_id
+    ).scalar() or 0
+    return _hold(user_id, product_id, held + quantity)
+
+
+def set_reservation(user_id, product_id, quantity):
+    """Set the user's reservation for a product to ``quantity`` units (0 releases it)"""
+    if quantity <= 0:
+        release(user_id, product_id)
+        return True
+
+    if not _reservations_enabled():
+        product = db.session.get(Product, product_id)
+        return product is not None and product.available_quantity >= quantity
+
+    return _hold(user_id, product_id, quantity)
+
+
+def release(user_id, product_id=None):
+    """Release the user's reservation for one product, or all of them"""
+    for product_id, shard_index, quantity, _ in _claim(user_id, product_id):
+        _release_held(product_id, shard_index, quantity)
+
+
+def consume(user_id, product_id, quantity):
+    """
+    Take ``quantity`` units out of stock for an order, using the user's reservation.
+
+    Stock held by the user's own reservation counts as available to them. The
+    reservation is removed; only the units it still held when it was claimed
+    count. Returns False if there is not enough stock; the caller must then
+    roll back.
+    """
+    claimed = _claim(user_id, product_id)
+    _, shard_index, held, _ = claimed[0] if claimed else (None, None, 0, None)
+
+    if not _shard_count(product_id):
+        if not _adjust(product_id, stock_delta=-quantity, reserved_delta=-held, required=quantity - held):
+            return False
+    else:
+        taken = 0
+        if held and shard_index is not None:
+            # Take the reserved units from the shard that holds them
+            taken = min(held, quantity)
+            if not _adjust_shard(product_id, shard_index, stock_delta=-taken,
+                                 reserved_delta=-held, required=taken - held):
+                return False
+        elif held:
+            _release_held(product_id, shard_index, held)
+
+        remaining = quantity - taken
+        if remaining > 0 and not _take_stock(product_id, remaining):
+            return False
+
+    return True
+
+
+def restock(product_id, quantity):
+    """Return ``quantity`` units to stock (e.g. a cancelled order)"""
+    shard_count = _shard_count(product_id)
+    if shard_count:
+        _adjust_shard(product_id, random.randrange(shard_count), stock_delta=quantity)
+    else:
+        _adjust(product_id, stock_delta=quantity)
+    current_app.extensions['admission'].clear_sold_out(product_id)
+
+
+def set_stock(product, quantity):
+    """
+    Set a product's total stock on hand (admin stock editor).
+
+    Raises ``StockBelowReserved`` if ``quantity`` is less than the units held
+    by reservations.
+    """
+    if product.is_sharded:
+        rebalance(product.id, total=quantity)
+    else:
+        reserved = product.reserved_quantity or 0
+        if quantity < reserved:
+            raise StockBelowReserved(quantity, reserved)
+        product.stock_quantity = quantity
+    current_app.extensions['admission'].clear_sold_out(product.id)
+
+
+def rebalance(product_id, total=None):
+    """
+    Even out the free stock across a product's shards.
+
+    Each shard keeps its reserved units (reservations point at a shard) and
+    the free stock is split evenly on top. ``total`` replaces the stock on
+    hand instead of preserving it; it cannot be less than the reserved units
+    (``StockBelowReserved``).
+    """
+    shards = ProductStockShard.query.filter_by(product_id=product_id).order_by(
+        ProductStockShard.shard_index
+    ).with_for_update().all()
+    if not shards:
+        return
+
+    reserved = sum(shard.reserved_quantity for shard in shards)
+    if total is not None and total < reserved:
+        raise StockBelowReserved(total, reserved)
+    stock = sum(shard.quantity for shard in shards) if total is None else total
+    free = stock - reserved
+    share, extra = divmod(free, len(shards))
+
+    for shard in shards:
+        shard.quantity = shard.reserved_quantity + share + (1 if shard.shard_index < extra else 0)
+
+    db.session.flush()
+
+
+def shard_product(product, shard_count):
+    """
+    Move a product's stock into ``shard_count`` counter rows (0 turns sharding off).
+
+    Existing reservations are assigned to shard 0. The caller commits.
+    """
+    if product.is_sharded:
+        _unshard(product)
+    if shard_count <= 0:
+        return
+
+    for shard_index in range(shard_count):
+        product.stock_shards.append(ProductStockShard(
+            shard_index=shard_index,
+            quantity=0,
+            reserved_quantity=product.reserved_quantity if shard_index == 0 else 0
+        ))
+    StockReservation.query.filter_by(product_id=product.id).update({'shard_index': 0})
+
+    stock = product.stock_quantity or 0
+    product.stock_quantity = 0
+    product.reserved_quantity = 0
+    product.stock_shard_count = shard_count
+    db.session.flush()
+    rebalance(product.id, total=stock)
+
+
+def _unshard(product):
+    """Fold a sharded product's counters back into the product row"""
+    product.stock_quantity = product.total_stock
+    product.reserved_quantity = product.total_reserved
+    product.stock_shard_count = 0
+    product.stock_shards.clear()
+    StockReservation.query.filter_by(product_id=product.id).update({'shard_index': None})
+    db.session.flush()
+
+
+def _row_order(key):
+    product_id, shard_index = key
+    return product_id, -1 if shard_index is None else shard_index
+
+
+def expire_reservations(now=None, batch_size=1000):
+    """
+    Release every reservation that expired before ``now``, one batch per transaction.
+
+    Each batch claims up to ``batch_size`` expired rows with ``FOR UPDATE SKIP
+    LOCKED`` (PostgreSQL; SQLite has a single writer anyway), deletes them with
+    RETURNING and gives the held quantities back with one UPDATE per product
+    (or shard). Sweepers running in several processes therefore split the work
+    instead of blocking on each other. Returns the number of reservations released.
+    """
+    now = now or datetime.utcnow()
+    table = StockReservation.__table__
+    total = 0
+
+    while True:
+        claimed = db.select(table.c.id).where(table.c.expires_at <= now).order_by(
+            table.c.expires_at
+        ).limit(batch_size).with_for_update(skip_locked=True)
+
+        expired = db.session.execute(
+            table.delete().where(table.c.id.in_(claimed.scalar_subquery())).returning(
+                table.c.product_id, table.c.shard_index, table.c.quantity
+            )
+        ).all()
+
+        released = {}
+        for product_id, shard_index, quantity in expired:
+            key = (product_id, shard_index)
+            released[key] = released.get(key, 0) + quantity
+
+        # Update rows in a fixed order so concurrent sweepers cannot deadlock
+        for product_id, shard_index in sorted(released, key=_row_order):
+            quantity = released[(product_id, shard_index)]
+            if shard_index is None:
+                _adjust(product_id, reserved_delta=-quantity)
+            else:
+                _adjust_shard(product_id, shard_index, reserved_delta=-quantity)
+
+        db.session.commit()
+        total += len(expired)
+        if len(expired) < batch_size:
+            return total
+
+
+class ReservationSweeper:
+    """Background thread that periodically expires reservations in bulk"""
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the sweeper in this process if it is not already running"""
+        # Threads do not survive fork, so each worker process starts its own
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='reservation-sweeper', daemon=True).start()
+
+    def sweep(self):
+        """Expire reservations now"""
+        with self.app.app_context():
+            try:
+                released = expire_reservations()
+                if released:
+                    logger.info("Expired %s stock reservations", released)
+                return released
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error("Reservation sweep error: %s", e)
+
+
+def init_inventory(app):
+    """Register the reservation sweeper on the app"""
+    sweeper = ReservationSweeper(app, app.config['RESERVATION_SWEEP_INTERVAL'])
+    app.extensions['reservation_sweeper'] = sweeper
+    return sweeper
@@ -0,0 +1,272 @@
+"""
+User sharding - Carts and orders partitioned by user across database binds
+
+Shard 0 is the default database; ``USER_SHARD_URLS`` adds shards 1..N-1 as
+``shard_<n>`` binds. Users, products and stock (including reservations) stay
+on the default database. Each user's ``cart_items``, ``orders``,
+``order_items`` and ``payments`` live on the shard picked for that user by a
+consistent hash ring, so adding a shard only moves ~1/N of the users
+(``rebalance_shards.py`` moves their rows).
+
+``RoutingSession`` sends statements on sharded tables to the *current*
+shard: the one selected with ``use_shard()`` / ``user_shard()``, else the
+shard of the authenticated user. Admin views use ``scatter()`` to run a
+function on every shard in parallel and merge the results.
+
+Ids on shard ``n`` start at ``n * SHARD_ID_SPAN`` so they are unique across
+shards. With a single shard all of this reduces to the default database.
+"""
+import bisect
+import hashlib
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, has_request_context
+from flask_jwt_extended import get_jwt_identity
+
+SHARD_BIND_PREFIX = 'shard_'
+
+# Tables partitioned by user; everything else lives on the default database
+SHARDED_TABLES = frozenset(('cart_items', 'orders', 'order_items', 'payments'))
+
+# Id range reserved per shard (keeps ids within a 32-bit INTEGER for up to 21 shards)
+SHARD_ID_SPAN = 100_000_000
+
+_current_shard = ContextVar('current_shard', default=None)
+
+
+class ShardNotSelected(RuntimeError):
+    """Raised when a sharded table is queried with no shard selected"""
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to shard indexes"""
+
+    def __init__(self, shard_count, virtual_nodes=64):
+        self.shard_count = shard_count
+        points = sorted(
+            (self._hash(f'shard-{shard}-{node}'), shard)
+            for shard in range(shard_count) for node in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+    def shard_for(self, key):
+        if self.shard_count == 1:
+            return 0
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._shards[index]
+
+
+class ShardRouter:
+    """Shard engines, the user -> shard ring and the scatter-gather pool"""
+
+    def __init__(self, engines, virtual_nodes=64, scatter_workers=8):
+        self.engines = engines
+        self.ring = HashRing(len(engines), virtual_nodes)
+        self._executor = None
+        self._scatter_workers = scatter_workers
+        self._lock = threading.Lock()
+
+    @property
+    def shard_count(self):
+        return len(self.engines)
+
+    def shard_for_user(self, user_id):
+        return self.ring.shard_for(int(user_id))
+
+    def engine(self, index):
+        return self.engines[index]
+
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=min(self._scatter_workers, self.shard_count), thread_name_prefix='shard-scatter'
+                    )
+        return self._executor
+
+
+def get_shard_router():
+    return current_app.extensions['shard_router']
+
+
+def is_sharded():
+    """True when carts and orders are spread over more than one database"""
+    return get_shard_router().shard_count > 1
+
+
+@contextmanager
+def use_shard(index):
+    """Route sharded tables to shard ``index`` while the block runs"""
+    token = _current_shard.set(index)
+    try:
+        yield index
+    finally:
+        _current_shard.reset(token)
+
+
+def user_shard(user_id):
+    """Route sharded tables to ``user_id``'s shard while the block runs"""
+    return use_shard(get_shard_router().shard_for_user(user_id))
+
+
+def current_shard(router):
+    """Shard index for sharded tables in the current context"""
+    index = _current_shard.get()
+    if index is not None:
+        return index
+    if router.shard_count == 1:
+        return 0
+    if has_request_context():
+        try:
+            user_id = get_jwt_identity()
+        except Exception:
+            user_id = None
+        if user_id is not None:
+            return router.shard_for_user(user_id)
+    raise ShardNotSelected('Query on a sharded table without a shard; use use_shard() or user_shard()')
+
+
+def shard_engine(mapper=None, clause=None):
+    """Engine of the current shard if the statement targets a sharded table, else None"""
+    table = None
+    if mapper is not None:
+        table = mapper.local_table
+    elif clause is not None:
+        table = getattr(clause, 'table', None)
+        if table is None:
+            froms = clause.get_final_froms() if hasattr(clause, 'get_final_froms') else ()
+            table = next(iter(froms), None)
+
+    if getattr(table, 'name', None) not in SHARDED_TABLES:
+        return None
+
+    router = current_app.extensions.get('shard_router')
+    if router is None:
+        return None
+    return router.engine(current_shard(router))
+
+
+def scatter(fn, *args, **kwargs):
+    """
+    Run ``fn`` once per shard (in parallel) and return the results in shard order.
+
+    Each call runs in its own app context with that shard selected. With a
+    single shard ``fn`` simply runs inline.
+    """
+    router = get_shard_router()
+    if router.shard_count == 1:
+        with use_shard(0):
+            return [fn(*args, **kwargs)]
+
+    app = current_app._get_current_object()
+
+    def run(index):
+        with app.app_context(), use_shard(index):
+            return fn(*args, **kwargs)
+
+    return list(router.executor().map(run, range(router.shard_count)))
+
+
+def merge_sorted(results, key, reverse=False, limit=None):
+    """Merge per-shard lists that are each sorted by ``key``"""
+    merged = heapq.merge(*results, key=key, reverse=reverse)
+    if limit is not None:
+        return [item for _, item in zip(range(limit), merged)]
+    return list(merged)
+
+
+def locate(model, object_id):
+    """Index of the shard holding ``model`` row ``object_id``, or None"""
+    from app import db
+
+    router = get_shard_router()
+    # Rows are created in their shard's id range, but rebalancing moves rows with their ids
+    likely = min(object_id // SHARD_ID_SPAN, router.shard_count - 1)
+    order = [likely] + [index for index in range(router.shard_count) if index != likely]
+    for index in order:
+        with use_shard(index):
+            if db.session.query(model.id).filter(model.id == object_id).first() is not None:
+                return index
+    return None
+
+
+def shard_tables(metadata):
+    """
+    Copies of the sharded tables for creating a shard's schema.
+
+    Foreign keys to tables that stay on the default database (users,
+    products) are left out since they cannot cross databases.
+    """
+    from sqlalchemy import Column, ForeignKey, MetaData, Table
+
+    shard_metadata = MetaData()
+    tables = []
+    for name in sorted(SHARDED_TABLES):
+        source = metadata.tables[name]
+        columns = [
+            Column(
+                column.name, column.type,
+                *(ForeignKey(fk.target_fullname) for fk in column.foreign_keys
+                  if fk.target_fullname.split('.')[0] in SHARDED_TABLES),
+                primary_key=column.primary_key, nullable=column.nullable,
+                unique=column.unique, index=column.index
+            )
+            for column in source.columns
+        ]
+        # AUTOINCREMENT keeps SQLite from reusing ids below the shard's offset
+        tables.append(Table(name, shard_metadata, *columns, sqlite_autoincrement=True))
+    return shard_metadata, tables
+
+
+def create_shard_schema(engine, index, metadata):
+    """Create the sharded tables on shard ``index`` and start its ids at the shard's offset"""
+    shard_metadata, tables = shard_tables(metadata)
+    shard_metadata.create_all(engine)
+
+    offset = index * SHARD_ID_SPAN
+    if not offset:
+        return
+    with engine.begin() as connection:
+        for table in tables:
+            if engine.dialect.name == 'sqlite':
+                connection.exec_driver_sql(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+                    (table.name, offset, table.name)
+                )
+            elif engine.dialect.name == 'postgresql':
+                connection.exec_driver_sql(
+                    "SELECT setval(pg_get_serial_sequence(%(table)s, 'id'), %(offset)s) "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM {engine.dialect.identifier_preparer.format_table(table)})",
+                    {'table': table.name, 'offset': offset}
+                )
+
+
+def init_sharding(app):
+    """Register the shard router (shard 0 is the default database)"""
+    from app import db
+
+    with app.app_context():
+        extra = sorted(
+            (int(key[len(SHARD_BIND_PREFIX):]), engine) for key, engine in db.engines.items()
+            if key is not None and key.startswith(SHARD_BIND_PREFIX)
+        )
+        engines = [db.engines[None]] + [engine for _, engine in extra]
+
+    router = ShardRouter(
+        engines,
+        virtual_nodes=app.config['SHARD_VIRTUAL_NODES'],
+        scatter_workers=app.config['SHARD_SCATTER_WORKERS']
+    )
+    app.extensions['shard_router'] = router
+    return router
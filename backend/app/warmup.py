@@ -0,0 +1,53 @@
+"""
+Warm-up - Prime process-wide caches before forking workers
+
+Run once in the WSGI master with ``preload_app`` so every forked worker
+inherits compiled serializers and cached catalog responses instead of
+building them on its first requests.
+"""
+import logging
+
+from app import db
+from app.middleware.compression import available_encodings
+from app.serializers import (
+    product_serializer, user_serializer, payment_serializer, order_item_serializer, order_serializer
+)
+
+logger = logging.getLogger(__name__)
+
+# Public catalog pages fetched during warm-up (their responses land in the response cache)
+WARM_UP_PATHS = ('/api/products', '/api/products/categories')
+
+
+def dispose_engines(app, close=True):
+    """
+    Discard the app's connection pools.
+
+    In a freshly forked worker use ``close=False``: the inherited connections
+    belong to the parent and must be dropped without being closed.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def warm_up(app):
+    """Compile the default serializers and prime the catalog response cache"""
+    for serializer in (product_serializer, user_serializer, payment_serializer,
+                       order_item_serializer, order_serializer):
+        serializer.compile()
+
+    client = app.test_client()
+    headers = {'Accept-Encoding': ', '.join(available_encodings())}
+    for path in WARM_UP_PATHS:
+        try:
+            response = client.get(path, headers=headers)
+            if response.status_code != 200:
+                logger.warning("Warm-up request %s returned %s", path, response.status_code)
+        except Exception as e:
+            logger.warning("Warm-up request %s failed: %s", path, e)
+
+    # Connections opened during warm-up must not be inherited by the workers
+    dispose_engines(app)
+    app.extensions['warmed_up'] = True
+    logger.info("Warm-up complete")
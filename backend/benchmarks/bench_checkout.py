@@ -0,0 +1,130 @@
+"""
+Checkout benchmark - SQLite default settings vs tuned pragmas
+
+Runs concurrent add-to-cart + checkout loops against a throwaway SQLite
+database, once with SQLite's defaults (rollback journal, ``synchronous=FULL``)
+and once with the configured ``SQLITE_PRAGMAS`` (WAL, ``synchronous=NORMAL``,
+``busy_timeout`` ...). Each mode runs in its own process because the settings
+are read from the environment when ``config`` is imported.
+
+Usage:
+    python benchmarks/bench_checkout.py --threads 8 --checkouts 50
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# SQLite's own defaults: no pragmas applied
+DEFAULT_PRAGMAS = {
+    'SQLITE_JOURNAL_MODE': '', 'SQLITE_SYNCHRONOUS': '', 'SQLITE_BUSY_TIMEOUT': '',
+    'SQLITE_CACHE_SIZE': '', 'SQLITE_MMAP_SIZE': '', 'SQLITE_TEMP_STORE': ''
+}
+
+
+def run(threads, checkouts):
+    """Run the checkout loop in this process and return the measurements"""
+    from app import create_app, db
+    from app.models.user import User
+    from app.models.product import Product
+    from flask_jwt_extended import create_access_token
+
+    app = create_app('production')
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Product), [{
+            'name': f'Product {i}', 'price': 10.0, 'stock_quantity': threads * checkouts * 10
+        } for i in range(10)])
+        db.session.execute(db.insert(User), [{
+            'email': f'bench{i}@example.com', 'password_hash': 'x', 'first_name': 'Bench', 'last_name': str(i)
+        } for i in range(threads)])
+        db.session.commit()
+        tokens = [create_access_token(identity=user_id) for user_id in range(1, threads + 1)]
+
+    results = {'ok': 0, 'failed': 0, 'latencies': []}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {tokens[index]}'}
+        barrier.wait()
+        for n in range(checkouts):
+            start = time.perf_counter()
+            added = client.post('/api/cart/add', headers=headers,
+                                json={'product_id': (index + n) % 10 + 1, 'quantity': 1})
+            response = client.post('/api/orders/checkout', headers=headers, json={})
+            elapsed = time.perf_counter() - start
+            with lock:
+                if added.status_code == 201 and response.status_code == 201:
+                    results['ok'] += 1
+                    results['latencies'].append(elapsed)
+                else:
+                    results['failed'] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(results['latencies']) or [0.0]
+    return {
+        'checkouts': results['ok'],
+        'failed': results['failed'],
+        'seconds': elapsed,
+        'throughput': results['ok'] / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    }
+
+
+def run_mode(name, env, threads, checkouts):
+    """Run one mode in a child process against a fresh database"""
+    db_dir = tempfile.mkdtemp(prefix='bench_checkout_')
+    child_env = {
+        **os.environ, **env,
+        'DATABASE_URL': f"sqlite:///{os.path.join(db_dir, 'bench.db')}",
+        'CHECKOUT_MAX_CONCURRENCY': '0',
+        'CHECKOUT_PRODUCT_CONCURRENCY': '0',
+        'LOG_LEVEL': 'CRITICAL'
+    }
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', '--threads', str(threads), '--checkouts', str(checkouts)],
+        env=child_env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    print(f"{name:<22} {result['throughput']:>9.1f}/s {result['p50_ms']:>9.1f} ms {result['p99_ms']:>9.1f} ms "
+          f"{result['checkouts']:>7} {result['failed']:>7}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--checkouts', type=int, default=50, help='checkouts per thread')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run(args.threads, args.checkouts)))
+        return
+
+    print(f"{'mode':<22} {'throughput':>11} {'p50':>12} {'p99':>12} {'ok':>7} {'failed':>7}")
+    before = run_mode('sqlite defaults', DEFAULT_PRAGMAS, args.threads, args.checkouts)
+    after = run_mode('tuned pragmas', {}, args.threads, args.checkouts)
+    if before['throughput']:
+        print(f"\nspeedup: {after['throughput'] / before['throughput']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
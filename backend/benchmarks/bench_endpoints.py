@@ -0,0 +1,375 @@
+"""
+Endpoint benchmark - Throughput and latency percentiles per API endpoint
+
+``run`` seeds a throwaway SQLite database (or ``--database-url``) with the
+requested volumes using the ``seed.py`` generator, then drives each scenario with ``--concurrency`` client
+threads: through the Flask test client by default, through a threaded
+Werkzeug server on a local port with ``--server``, or against an already
+running deployment with ``--url`` (seed its database with ``--database-url``
+and share its ``JWT_SECRET_KEY``). Results (requests/s, p50/p95/p99, errors
+per scenario plus the volumes, commit and Python version) are written as
+JSON.
+
+``compare`` checks a run against a baseline and exits non-zero when any
+scenario's p95 latency rose, or its throughput fell, by more than
+``--tolerance``.
+
+Usage:
+    python benchmarks/bench_endpoints.py run --products 100000 --orders 1000000 --output baseline.json
+    python benchmarks/bench_endpoints.py run --server --concurrency 16 --output current.json
+    python benchmarks/bench_endpoints.py compare baseline.json current.json --tolerance 0.10
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+ORDER_STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+
+ORDER_FIELDS = 'id,status,total_amount,created_at'
+
+SCENARIOS = (
+    'products_list', 'products_search', 'product_detail', 'cart_get', 'cart_add',
+    'checkout', 'order_history', 'admin_dashboard', 'admin_orders'
+)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def seed(products, users, orders, seed_value):
+    """An admin plus generated customers, catalog and order history (see seed.py), with unlimited stock"""
+    from app import db
+    from app.models.product import Product
+    from app.models.user import User
+    from seed import generate
+
+    admin = User(email='bench-admin@example.com', first_name='Bench', last_name='Admin', role='admin')
+    admin.set_password('password123')
+    db.session.add(admin)
+    db.session.commit()
+    generate(users=users, products=products, orders=orders, seed=seed_value)
+    # Checkouts must not start failing once popular products sell out
+    db.session.execute(db.update(Product).values(stock_quantity=10 ** 9))
+    db.session.commit()
+
+
+def bench_fixtures(concurrency):
+    """Admin id, ``concurrency`` active customer ids and the active product ids"""
+    from app import db
+    from app.models.product import Product
+    from app.models.user import User
+
+    admin_id = db.session.execute(db.select(User.id).where(User.role == 'admin').limit(1)).scalar()
+    shoppers = db.session.execute(
+        db.select(User.id).where(User.role == 'user', User.is_active.is_(True)).order_by(User.id).limit(concurrency)
+    ).scalars().all()
+    product_ids = db.session.execute(db.select(Product.id).where(Product.is_active.is_(True))).scalars().all()
+    if admin_id is None or len(shoppers) < concurrency or not product_ids:
+        raise SystemExit("Database needs an admin, one active customer per client and active products")
+    return admin_id, shoppers, product_ids
+
+
+class TestClientTransport:
+    """Requests through the Flask test client (one per thread)"""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, headers, body=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        return client.open(path, method=method, headers=headers, json=body).status_code
+
+
+class HttpTransport:
+    """Requests over HTTP/1.1 keep-alive connections (one per thread)"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.local = threading.local()
+
+    def send(self, method, path, headers, body=None, retry=True):
+        """``(status, response headers, response body)``; status 0 if the connection failed"""
+        connection = getattr(self.local, 'connection', None)
+        reused = connection is not None
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = dict(headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            connection.request(method, self.prefix + path, body=payload, headers=headers)
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.local.connection = None
+            if reused and retry:
+                # The server closed the idle keep-alive connection
+                return self.send(method, path, headers, body, retry=False)
+            return 0, {}, b''
+
+    def request(self, method, path, headers, body=None):
+        return self.send(method, path, headers, body)[0]
+
+
+def start_server(app):
+    """Serve ``app`` from a threaded Werkzeug server on a free local port"""
+    import logging
+    from werkzeug.serving import make_server
+
+    # One access log line per request would slow the clients down
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def build_scenarios(product_ids, tokens):
+    """
+    ``{name: (method, path, body, setup)}`` where ``path``/``body`` take the
+    worker index and ``setup`` (untimed, may be None) runs before each request.
+    Each worker shops as its own user; workers share the admin token.
+    """
+    from seed import CATEGORIES
+
+    nouns = [noun for _, _, category_nouns in CATEGORIES.values() for noun in category_nouns]
+
+    def pick_product(_):
+        return random.choice(product_ids)
+
+    def add_one(request, worker):
+        request('POST', '/api/cart/add', tokens[worker], {'product_id': pick_product(worker), 'quantity': 1})
+
+    return {
+        'products_list': ('GET', lambda w: f'/api/products?category={random.choice(list(CATEGORIES))}',
+                          None, None),
+        'products_search': ('GET', lambda w: f'/api/products?search={random.choice(nouns)} {random.randrange(10)}',
+                            None, None),
+        'product_detail': ('GET', lambda w: f'/api/products/{pick_product(w)}', None, None),
+        'cart_get': ('GET', lambda w: '/api/cart', None, None),
+        'cart_add': ('POST', lambda w: '/api/cart/add',
+                     lambda w: {'product_id': pick_product(w), 'quantity': 1}, None),
+        'checkout': ('POST', lambda w: '/api/orders/checkout',
+                     lambda w: {'shipping_address': '1 Bench Street'}, add_one),
+        'order_history': ('GET', lambda w: f'/api/orders?fields={ORDER_FIELDS}', None, None),
+        'admin_dashboard': ('GET', lambda w: '/api/admin/dashboard', None, None),
+        'admin_orders': ('GET', lambda w: f'/api/admin/orders?status={random.choice(ORDER_STATUSES)}'
+                                          f'&fields={ORDER_FIELDS}', None, None)
+    }
+
+
+def measure(transport, scenario, headers_for, requests, concurrency, warmup):
+    """Run ``requests`` timed requests of one scenario over ``concurrency`` threads"""
+    method, path, body, setup = scenario
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    remaining = [warmup + requests]
+
+    def send(worker):
+        status = transport.request(method, path(worker).replace(' ', '%20'), headers_for(worker),
+                                   body(worker) if body else None)
+        return 200 <= status < 300
+
+    def worker(index):
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                timed = remaining[0] < requests
+            if setup:
+                setup(transport.request, index)
+            start = time.perf_counter()
+            ok = send(index)
+            elapsed = time.perf_counter() - start
+            if timed:
+                with lock:
+                    latencies.append(elapsed)
+                    errors[0] += not ok
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput': round(len(latencies) / wall, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_endpoints_'), 'bench.db')}"
+    # Request summaries would dominate the output and the timings
+    os.environ.setdefault('LOG_REQUESTS', 'false')
+    os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+    from app import create_app, db
+    from flask_jwt_extended import create_access_token
+
+    app = create_app(args.config)
+    random.seed(args.seed)
+
+    with app.app_context():
+        if not args.skip_seed:
+            db.drop_all()
+            db.create_all()
+            started = time.perf_counter()
+            seed(args.products, max(args.users, args.concurrency), args.orders, args.seed)
+            print(f"Seeded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        admin_id, shoppers, product_ids = bench_fixtures(args.concurrency)
+        admin = {'Authorization': f'Bearer {create_access_token(identity=admin_id)}'}
+        # Each worker shops as its own user so carts never contend across workers
+        tokens = [{'Authorization': f'Bearer {create_access_token(identity=user_id)}'} for user_id in shoppers]
+
+    server = None
+    if args.url:
+        transport, target = HttpTransport(args.url), args.url
+    elif args.server:
+        server, target = start_server(app)
+        transport = HttpTransport(target)
+    else:
+        transport, target = TestClientTransport(app), 'test-client'
+
+    scenarios = build_scenarios(product_ids, tokens)
+    selected = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    results = {}
+    print(f"{'scenario':<18} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    try:
+        for name in selected:
+            headers_for = (lambda w: admin) if name.startswith('admin_') else (lambda w: tokens[w])
+            result = results[name] = measure(
+                transport, scenarios[name], headers_for, args.requests, args.concurrency, args.warmup
+            )
+            print(f"{name:<18} {result['throughput']:>9.1f} {result['p50_ms']:>9.2f} "
+                  f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['errors']:>7}")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'target': 'server' if server is not None else target,
+        'volumes': {'products': args.products, 'users': args.users, 'orders': args.orders},
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'scenarios': results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = []
+    print(f"{'scenario':<18} {'p95 base':>9} {'p95 now':>9} {'change':>8} {'req/s base':>11} {'req/s now':>10} {'change':>8}")
+    for name, before in baseline['scenarios'].items():
+        after = current['scenarios'].get(name)
+        if after is None:
+            print(f"{name:<18} missing from current run")
+            continue
+        latency_change = after['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        throughput_change = after['throughput'] / before['throughput'] - 1 if before['throughput'] else 0.0
+        print(f"{name:<18} {before['p95_ms']:>9.2f} {after['p95_ms']:>9.2f} {latency_change:>+8.1%} "
+              f"{before['throughput']:>11.1f} {after['throughput']:>10.1f} {throughput_change:>+8.1%}")
+        if latency_change > args.tolerance:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} -> {after['p95_ms']:.2f} ms")
+        if -throughput_change > args.tolerance:
+            regressions.append(f"{name}: throughput {before['throughput']:.1f} -> {after['throughput']:.1f} req/s")
+        if after['errors'] > before['errors']:
+            regressions.append(f"{name}: errors {before['errors']} -> {after['errors']}")
+
+    for key in ('volumes', 'target', 'concurrency'):
+        if baseline.get(key) != current.get(key):
+            print(f"warning: runs differ in {key}: {baseline.get(key)} vs {current.get(key)}", file=sys.stderr)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='seed, benchmark and write a JSON report')
+    run_parser.add_argument('--products', type=int, default=10000)
+    run_parser.add_argument('--users', type=int, default=1000)
+    run_parser.add_argument('--orders', type=int, default=20000)
+    run_parser.add_argument('--requests', type=int, default=500, help='timed requests per scenario')
+    run_parser.add_argument('--warmup', type=int, default=20, help='untimed requests per scenario')
+    run_parser.add_argument('--concurrency', type=int, default=4)
+    run_parser.add_argument('--scenarios', help=f"comma-separated subset of: {','.join(SCENARIOS)}")
+    run_parser.add_argument('--server', action='store_true', help='serve over HTTP from a local threaded server')
+    run_parser.add_argument('--url', help='benchmark an already running server at this base URL')
+    run_parser.add_argument('--database-url', help='database to seed (default: a throwaway SQLite file)')
+    run_parser.add_argument('--skip-seed', action='store_true', help='reuse the data already in --database-url')
+    run_parser.add_argument('--config', default='production')
+    run_parser.add_argument('--seed', type=int, default=42, help='random seed for data and request mix')
+    run_parser.add_argument('--output', default=os.path.join(BACKEND_DIR, 'benchmarks', 'results', 'latest.json'))
+
+    compare_parser = commands.add_parser('compare', help='fail if a run regressed against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=0.10,
+                                help='allowed relative p95 increase / throughput drop (default 0.10)')
+
+    args = parser.parse_args()
+    sys.exit(run(args) if args.command == 'run' else compare(args))
+
+
+if __name__ == '__main__':
+    main()
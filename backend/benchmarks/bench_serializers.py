@@ -0,0 +1,102 @@
+"""
+Serializer benchmark - ORM ``to_dict()`` vs compiled Core row serializers
+
+Seeds a throwaway SQLite database with products and orders, then measures
+wall time and peak allocated memory per serialized row for the old read path
+(ORM objects + ``to_dict()``) and the compiled serializer read path.
+
+Usage:
+    python benchmarks/bench_serializers.py --products 20000 --orders 2000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_db_dir = tempfile.mkdtemp(prefix='bench_serializers_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+from datetime import datetime  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.models.order import Order, OrderItem  # noqa: E402
+from app.models.payment import Payment  # noqa: E402
+from app.serializers import product_serializer, load_orders  # noqa: E402
+
+
+def seed(products, orders):
+    """Bulk insert products and orders (two items and a payment each)"""
+    now = datetime.utcnow()
+    db.session.execute(db.insert(User), [{
+        'email': 'bench@example.com', 'password_hash': 'x', 'first_name': 'Bench', 'last_name': 'User'
+    }])
+    db.session.execute(db.insert(Product), [{
+        'name': f'Product {i}', 'description': 'Benchmark product ' * 4, 'price': 10.0 + i % 100,
+        'stock_quantity': 100, 'category': f'Category {i % 10}', 'image_url': f'https://example.com/{i}.png',
+        'created_at': now, 'updated_at': now
+    } for i in range(products)])
+    db.session.execute(db.insert(Order), [{
+        'user_id': 1, 'total_amount': 42.0, 'status': 'processing', 'shipping_address': '1 Bench Street',
+        'created_at': now, 'updated_at': now
+    } for _ in range(orders)])
+    db.session.execute(db.insert(OrderItem), [{
+        'order_id': order_id, 'product_id': (order_id * 7 + n) % products + 1, 'quantity': 1, 'price_at_purchase': 21.0
+    } for order_id in range(1, orders + 1) for n in range(2)])
+    db.session.execute(db.insert(Payment), [{
+        'order_id': order_id, 'amount': 42.0, 'payment_method': 'credit_card', 'payment_status': 'completed',
+        'transaction_id': f'tx-{order_id}', 'created_at': now, 'updated_at': now
+    } for order_id in range(1, orders + 1)])
+    db.session.commit()
+
+
+def measure(name, rows, fn, repeat):
+    """Best wall time and peak traced memory of ``fn`` over ``repeat`` runs"""
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    db.session.expunge_all()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    print(f"{name:<38} {best * 1000:>10.1f} ms {best / rows * 1e6:>10.2f} us/row {peak / rows:>10.0f} B/row")
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app('production')
+    with app.app_context():
+        db.create_all()
+        seed(args.products, args.orders)
+
+        compiled = product_serializer.compile()
+        print(f"{'read path':<38} {'time':>13} {'per row':>16} {'peak mem':>15}")
+        measure('products: ORM + to_dict()', args.products,
+                lambda: [p.to_dict() for p in Product.query.filter_by(is_active=True).all()], args.repeat)
+        measure('products: compiled Core rows', args.products,
+                lambda: [compiled.from_row(row) for row in db.session.execute(
+                    compiled.select().where(Product.is_active.is_(True)))], args.repeat)
+        measure('orders: ORM + to_dict() (lazy loads)', args.orders,
+                lambda: [o.to_dict() for o in Order.query.order_by(Order.created_at.desc()).all()], args.repeat)
+        measure('orders: load_orders()', args.orders, lambda: load_orders(), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+"""
+Checkout stress test - Concurrent add-to-cart + checkout (+ cancel) against low stock
+
+Seeds a throwaway SQLite database (or ``--database-url``) with one customer
+per client and a few ``--products`` holding ``--stock`` units each, serves
+the app from a real server (a threaded Werkzeug server in this process, or
+``--server gunicorn`` with ``--workers`` processes) and runs ``--clients``
+concurrent clients through ``--flows`` add-to-cart + checkout flows each.
+``--cancel-rate`` of the placed orders are cancelled again, with
+``--double-cancel`` by two concurrent requests.
+
+Afterwards the database is checked:
+
+* no stock, stock shard or reservation count is negative;
+* for every product, stock consumed equals the quantity in orders that are
+  not cancelled (nothing oversold, nothing restocked twice);
+* reserved stock equals the open reservations;
+* every order has items and exactly one payment for its total, refunded iff
+  the order is cancelled.
+
+Prints throughput, status counts and latency per endpoint, SQL time spent in
+checkout/cancel (lock and busy waits included) and connection pool waits,
+and exits 1 if an invariant is violated.
+
+Usage:
+    python benchmarks/stress_checkout.py --clients 32 --flows 50 --products 5 --stock 100
+    python benchmarks/stress_checkout.py --server gunicorn --workers 4 --cancel-rate 0.3 --double-cancel
+    DATABASE_URL=postgresql://... python benchmarks/stress_checkout.py --database-url "$DATABASE_URL"
+"""
+import argparse
+import json
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_endpoints import HttpTransport, percentile, start_server  # noqa: E402
+
+# Statuses that are the system protecting stock, not failures
+EXPECTED_REJECTIONS = {400, 409, 503}
+
+_SAMPLE = re.compile(r'^(\w+)(?:\{([^}]*)\})? (\S+)$')
+
+
+def scrape(transport):
+    """``{(name, labels): value}`` from the server's ``/metrics``"""
+    status, _, body = transport.send('GET', '/metrics', {})
+    samples = {}
+    if status != 200:
+        return samples
+    for line in body.decode().splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            samples[(match.group(1), match.group(2) or '')] = float(match.group(3))
+    return samples
+
+
+def seed(clients, products, stock):
+    """Customers (one per client) and the contended products; returns (user ids, product ids)"""
+    from app import db
+    from app.models.product import Product
+    from app.models.user import User
+    from seed import generate
+
+    # A few spare users: the generator deactivates about 1 in 100
+    generate(users=clients + clients // 50 + 5, progress=False)
+    db.session.add_all([
+        Product(name=f'Limited Edition {n}', price=10.0 + n, stock_quantity=stock, category='Stress')
+        for n in range(products)
+    ])
+    db.session.commit()
+
+    user_ids = db.session.execute(
+        db.select(User.id).where(User.role == 'user', User.is_active.is_(True)).order_by(User.id).limit(clients)
+    ).scalars().all()
+    product_ids = db.session.execute(
+        db.select(Product.id).where(Product.category == 'Stress').order_by(Product.id)
+    ).scalars().all()
+    return user_ids, product_ids
+
+
+def check_invariants(product_ids, initial_stock):
+    """List of invariant violations (empty if the data is consistent)"""
+    from app import db
+    from app.models.order import Order, OrderItem
+    from app.models.payment import Payment
+    from app.models.product import Product, ProductStockShard
+    from app.models.reservation import StockReservation
+    from app.sharding import scatter
+
+    def order_facts():
+        sold = dict(db.session.execute(
+            db.select(OrderItem.product_id, db.func.sum(OrderItem.quantity))
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(Order.status != 'cancelled', OrderItem.product_id.in_(product_ids))
+            .group_by(OrderItem.product_id)
+        ).all())
+        payments = db.select(db.func.count(Payment.id)).where(Payment.order_id == Order.id).scalar_subquery()
+        items = db.select(db.func.count(OrderItem.id)).where(OrderItem.order_id == Order.id).scalar_subquery()
+        refunded = db.select(db.func.count(Payment.id)).where(
+            Payment.order_id == Order.id, Payment.payment_status == 'refunded'
+        ).scalar_subquery()
+        paid = db.select(db.func.coalesce(db.func.sum(Payment.amount), 0)).where(
+            Payment.order_id == Order.id
+        ).scalar_subquery()
+        problems = []
+        for order_id, status, total, payment_count, item_count, refund_count, amount in db.session.execute(
+            db.select(Order.id, Order.status, Order.total_amount, payments, items, refunded, paid)
+        ):
+            if payment_count != 1:
+                problems.append(f"order {order_id} has {payment_count} payments")
+            if item_count == 0:
+                problems.append(f"order {order_id} has no items")
+            if abs(amount - total) > 0.005:
+                problems.append(f"order {order_id} total {total} but paid {amount}")
+            if (status == 'cancelled') != (refund_count == payment_count > 0):
+                problems.append(f"order {order_id} is {status} with {refund_count}/{payment_count} refunded payments")
+        return sold, problems
+
+    violations = []
+    sold = Counter()
+    for shard_sold, problems in scatter(order_facts):
+        sold.update(shard_sold)
+        violations.extend(problems)
+
+    reserved = dict(db.session.execute(
+        db.select(StockReservation.product_id, db.func.sum(StockReservation.quantity))
+        .group_by(StockReservation.product_id)
+    ).all())
+    for product in Product.query.filter(Product.id.in_(product_ids)).order_by(Product.id):
+        if product.stock_quantity < 0 or product.reserved_quantity < 0:
+            violations.append(f"product {product.id} stock {product.stock_quantity} reserved {product.reserved_quantity}")
+        consumed = initial_stock - product.total_stock
+        if consumed != sold[product.id]:
+            violations.append(f"product {product.id}: {consumed} units left stock but orders hold {sold[product.id]}")
+        if not product.is_sharded and product.reserved_quantity != reserved.get(product.id, 0):
+            violations.append(f"product {product.id} reserved {product.reserved_quantity} "
+                              f"but reservations hold {reserved.get(product.id, 0)}")
+    for shard in ProductStockShard.query.filter(
+        db.or_(ProductStockShard.quantity < 0, ProductStockShard.reserved_quantity < 0)
+    ):
+        violations.append(f"product {shard.product_id} shard {shard.shard_index} quantity {shard.quantity} "
+                          f"reserved {shard.reserved_quantity}")
+    return violations, dict(sold)
+
+
+def start_gunicorn(workers, env):
+    """Run gunicorn with the production config on a free port; returns (process, base URL)"""
+    import socket
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), 'run:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    health = HttpTransport(url)
+    deadline = time.monotonic() + 60
+    while health.request('GET', '/health', {}) != 200:
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise SystemExit("gunicorn did not start")
+        time.sleep(0.2)
+    return process, url
+
+
+def run_flows(transport, tokens, product_ids, flows, max_quantity, cancel_rate, double_cancel):
+    """Drive every client through its flows; returns status counts, latencies and the wall time"""
+    statuses = defaultdict(Counter)
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(tokens))
+
+    def call(name, method, path, headers, body=None):
+        start = time.perf_counter()
+        status, _, payload = transport.send(method, path, headers, body)
+        elapsed = time.perf_counter() - start
+        with lock:
+            statuses[name][status] += 1
+            latencies[name].append(elapsed)
+        return status, payload
+
+    def cancel(order_id, headers):
+        call('cancel', 'POST', f'/api/orders/{order_id}/cancel', headers)
+
+    def client(headers):
+        barrier.wait()
+        for _ in range(flows):
+            status, _ = call('cart_add', 'POST', '/api/cart/add', headers, {
+                'product_id': random.choice(product_ids), 'quantity': random.randint(1, max_quantity)
+            })
+            if status != 201:
+                continue
+            status, payload = call('checkout', 'POST', '/api/orders/checkout', headers,
+                                   {'shipping_address': '1 Stress Street'})
+            if status != 201:
+                # Drop the line (and its reservation) so the next flow starts from an empty cart
+                call('cart_clear', 'DELETE', '/api/cart/clear', headers)
+                continue
+            if random.random() < cancel_rate:
+                order_id = json.loads(payload)['order']['id']
+                if double_cancel:
+                    racer = threading.Thread(target=cancel, args=(order_id, headers))
+                    racer.start()
+                    cancel(order_id, headers)
+                    racer.join()
+                else:
+                    cancel(order_id, headers)
+
+    threads = [threading.Thread(target=client, args=(headers,)) for headers in tokens]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses, latencies, time.perf_counter() - started
+
+
+def metric_delta(before, after, name, labels=''):
+    return after.get((name, labels), 0.0) - before.get((name, labels), 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32, help='concurrent clients, each its own user')
+    parser.add_argument('--flows', type=int, default=50, help='add-to-cart + checkout flows per client')
+    parser.add_argument('--products', type=int, default=5, help='contended products')
+    parser.add_argument('--stock', type=int, default=100, help='initial stock per product')
+    parser.add_argument('--max-quantity', type=int, default=2, help='units per add-to-cart (1..N)')
+    parser.add_argument('--cancel-rate', type=float, default=0.2, help='fraction of placed orders cancelled')
+    parser.add_argument('--double-cancel', action='store_true', help='cancel with two concurrent requests')
+    parser.add_argument('--server', choices=('threaded', 'gunicorn'), default='threaded')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--database-url', help='database to seed (default: a throwaway SQLite file)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='also write the report as JSON')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='stress_checkout_'), 'stress.db')}"
+    os.environ.setdefault('LOG_REQUESTS', 'false')
+    os.environ.setdefault('LOG_LEVEL', 'ERROR')
+    os.environ['FLASK_ENV'] = 'production'
+    os.environ['RESERVATION_SWEEP_INTERVAL'] = '0'  # reservations must not expire mid-run
+    random.seed(args.seed)
+
+    from app import create_app, db
+    from flask_jwt_extended import create_access_token
+
+    app = create_app('production')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_ids, product_ids = seed(args.clients, args.products, args.stock)
+        tokens = [{'Authorization': f'Bearer {create_access_token(identity=user_id)}'} for user_id in user_ids]
+        db.session.remove()
+
+    process = server = None
+    if args.server == 'gunicorn':
+        process, url = start_gunicorn(args.workers, dict(os.environ))
+    else:
+        server, url = start_server(app)
+    transport = HttpTransport(url)
+
+    try:
+        before = scrape(transport)
+        statuses, latencies, wall = run_flows(
+            transport, tokens, product_ids, args.flows, args.max_quantity, args.cancel_rate, args.double_cancel
+        )
+        after = scrape(transport)
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+        if server is not None:
+            server.shutdown()
+
+    with app.app_context():
+        violations, sold = check_invariants(product_ids, args.stock)
+
+    flows = args.clients * args.flows
+    print(f"{flows} flows by {args.clients} clients in {wall:.1f}s ({flows / wall:.1f} flows/s), "
+          f"server: {args.server}{f' x{args.workers}' if process else ''}")
+    print(f"\n{'endpoint':<11} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+    endpoints = {}
+    for name in ('cart_add', 'checkout', 'cart_clear', 'cancel'):
+        if name not in statuses:
+            continue
+        ordered = sorted(latencies[name])
+        counts = statuses[name]
+        errors = sum(count for status, count in counts.items()
+                     if not 200 <= status < 300 and status not in EXPECTED_REJECTIONS)
+        endpoints[name] = {
+            'requests': len(ordered),
+            'statuses': {str(status): count for status, count in sorted(counts.items())},
+            'error_rate': round(errors / len(ordered), 4),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 3)
+        }
+        result = endpoints[name]
+        print(f"{name:<11} {result['requests']:>9} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+              f"{result['p99_ms']:>9.1f}  " + ' '.join(f"{s}:{c}" for s, c in result['statuses'].items()))
+
+    sql_seconds = {
+        endpoint: metric_delta(before, after, 'db_query_seconds_per_request_sum', f'endpoint="{endpoint}"')
+        for endpoint in ('orders.checkout', 'orders.cancel_order')
+    }
+    pool_wait = metric_delta(before, after, 'db_pool_checkout_seconds_sum')
+    pool_checkouts = metric_delta(before, after, 'db_pool_checkout_seconds_count')
+    print(f"\nSQL time (incl. lock waits): checkout {sql_seconds['orders.checkout']:.2f}s, "
+          f"cancel {sql_seconds['orders.cancel_order']:.2f}s")
+    print(f"Pool checkout wait: {pool_wait:.3f}s over {int(pool_checkouts)} checkouts")
+    print(f"Units sold: {sum(sold.values())} of {args.products * args.stock}")
+
+    if violations:
+        print(f"\n{len(violations)} INVARIANT VIOLATIONS")
+        for violation in violations[:50]:
+            print(f"  {violation}")
+    else:
+        print("\nInvariants hold: no negative stock, no oversold or double-restocked units, one payment per order")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'server': args.server, 'workers': args.workers if process else None,
+                'clients': args.clients, 'flows': flows, 'seconds': round(wall, 3),
+                'flows_per_second': round(flows / wall, 2), 'endpoints': endpoints,
+                'sql_seconds': sql_seconds, 'pool_wait_seconds': pool_wait, 'units_sold': sum(sold.values()),
+                'violations': violations
+            }, f, indent=2)
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Gunicorn configuration - production serving
+
+Usage:
+    gunicorn -c gunicorn.conf.py run:app
+
+The app is imported and warmed up once in the master (``preload_app``) and
+then forked, so workers share the imported code and primed catalog caches.
+Database connections are never shared across the fork: the master disposes
+of its engine after warm-up and every worker drops any inherited pool.
+
+Every setting can be overridden from the environment.
+"""
+import glob
+import math
+import os
+import tempfile
+
+
+def _cpu_count():
+    """CPUs available to this process, honouring cgroup (container) CPU quotas"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not available on macOS
+        count = os.cpu_count() or 1
+
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return count
+
+
+# Workers write metrics to per-process files here so /metrics covers all of them.
+# Set before the app is imported (preload_app) so its config picks it up.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', tempfile.mkdtemp(prefix='orders-metrics-'))
+
+# Server socket
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+
+# Workers: 'gthread' (default) or 'gevent' (requires the gevent package)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', _cpu_count() * 2 + 1))
+# The app refuses per-process backends (CART_STORE=memory) with more than one worker
+os.environ['WEB_CONCURRENCY'] = str(workers)
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Import the app once in the master so it is shared copy-on-write by the workers
+preload_app = True
+
+# Timeouts
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers periodically to bound memory growth; jitter avoids restarting them all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Logging
+# The app logs its own per-request records (with request id, latency and query count)
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+
+def on_starting(server):
+    """Discard metric files left by a previous master"""
+    for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(path)
+
+
+def when_ready(server):
+    """Warm up caches in the master before the first worker is forked"""
+    from app.warmup import warm_up
+    warm_up(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    """Drop any pooled connections inherited from the master"""
+    from app.warmup import dispose_engines
+    dispose_engines(server.app.wsgi(), close=False)
+
+
+def child_exit(server, worker):
+    """Drop an exited worker's gauges (its counters keep counting towards the totals)"""
+    from app.prometheus import mark_process_dead
+    mark_process_dead(worker.pid, os.environ['PROMETHEUS_MULTIPROC_DIR'])
@@ -1,6 +1,18 @@
 """
 Database initialization and seeding script
+
+    python init_db.py               # drop, recreate and seed (development)
+    python init_db.py --if-missing  # create and seed only if the schema does not exist yet
+
+For larger or custom volumes use ``seed.py``.
+
+Run ``--if-missing`` once before starting the server processes; the server
+itself never creates tables, so multiple workers cannot race on it. On an
+existing database it upgrades the schema in place: tables, columns and
+indexes added since the database was created are added (see
+``upgrade_schema``); nothing is dropped or altered.
 """
+import argparse
 import os
 import sys
 
@@ -9,11 +21,80 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app, db
 from app.models.user import User
-from app.models.product import Product
-from app.models.cart import CartItem
-from app.models.order import Order, OrderItem
-from app.models.payment import Payment
+from app.dialects import advisory_lock
+from app.sharding import create_shard_schema, get_shard_router, shard_tables
 from config import Config
+from sqlalchemy import inspect
+
+# Advisory lock id serializing --if-missing runs from several pods (PostgreSQL)
+INIT_LOCK_KEY = 7201
+
+# Generated data for a development reset; first starts of a deployment only get a catalog
+DEVELOPMENT_DATA = {'users': 50, 'products': 100, 'orders': 500, 'carts': 10}
+CATALOG_DATA = {'products': 100}
+
+
+def upgrade_schema(engine, metadata):
+    """
+    Add the tables, columns and indexes of ``metadata`` that ``engine``'s database lacks.
+
+    New columns are added with their scalar default so existing rows get a
+    value (e.g. ``products.reserved_quantity = 0``). Returns the added
+    ``table.column`` names.
+    """
+    metadata.create_all(engine)
+    
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as connection:
+        preparer = engine.dialect.identifier_preparer
+        for table in metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if default is None and not column.nullable:
+                    raise RuntimeError(f'Cannot add {table.name}.{column.name}: NOT NULL without a default')
+                ddl = 'ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    preparer.format_table(table), preparer.quote(column.name),
+                    column.type.compile(dialect=engine.dialect)
+                )
+                if default is not None:
+                    ddl += ' DEFAULT ' + column.type.literal_processor(engine.dialect)(default)
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+                connection.exec_driver_sql(ddl)
+                added.append(f'{table.name}.{column.name}')
+            
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+    return added
+
+
+def create_shard_schemas():
+    """Create the sharded tables on every extra user shard (shard 0 is the default database)"""
+    router = get_shard_router()
+    for index in range(1, router.shard_count):
+        create_shard_schema(router.engine(index), index, db.metadata)
+        upgrade_schema(router.engine(index), shard_tables(db.metadata)[0])
+
+
+def reset_database():
+    """Drop and recreate every table, shards included (current app context)"""
+    print("Dropping existing tables...")
+    db.drop_all()
+    router = get_shard_router()
+    for index in range(1, router.shard_count):
+        shard_tables(db.metadata)[0].drop_all(router.engine(index))
+    
+    print("Creating database tables...")
+    db.create_all()
+    create_shard_schemas()
+    
+    print("Database tables created successfully!")
 
 
 def init_database():
@@ -22,99 +103,72 @@ def init_database():
     
     with app.app_context():
         # Drop all tables and recreate (for development)
-        print("Dropping existing tables...")
-        db.drop_all()
-        
-        print("Creating database tables...")
-        db.create_all()
-        
-        print("Database tables created successfully!")
-        
-        # Create admin user
-        print("Creating admin user...")
-        admin = User(
-            email=Config.ADMIN_EMAIL,
-            first_name='Admin',
-            last_name='User',
-            role='admin'
-        )
-        admin.set_password(Config.ADMIN_PASSWORD)
-        db.session.add(admin)
-        
-        # Create test user
-        print("Creating test user...")
-        test_user = User(
-            email='user@orders.com',
-            first_name='Test',
-            last_name='User',
-            role='user'
-        )
-        test_user.set_password('user123')
-        db.session.add(test_user)
-        
-        # Create sample products
-        print("Creating sample products...")
-        products = [
-            Product(
-                name='Laptop',
-                description='High-performance laptop for professionals',
-                price=999.99,
-                stock_quantity=50,
-                category='Electronics',
-                image_url='https://via.placeholder.com/300x300?text=Laptop'
-            ),
-            Product(
-                name='Wireless Mouse',
-                description='Ergonomic wireless mouse with precision tracking',
-                price=29.99,
-                stock_quantity=200,
-                category='Electronics',
-                image_url='https://via.placeholder.com/300x300?text=Mouse'
-            ),
-            Product(
-                name='Mechanical Keyboard',
-                description='RGB mechanical keyboard with blue switches',
-                price=89.99,
-                stock_quantity=100,
-                category='Electronics',
-                image_url='https://via.placeholder.com/300x300?text=Keyboard'
-            ),
-            Product(
-                name='USB-C Hub',
-                description='7-in-1 USB-C hub with HDMI and card reader',
-                price=49.99,
-                stock_quantity=150,
-                category='Accessories',
-                image_url='https://via.placeholder.com/300x300?text=USB-Hub'
-            ),
-            Product(
-                name='Webcam HD',
-                description='1080p HD webcam with auto-focus',
-                price=79.99,
-                stock_quantity=75,
-                category='Electronics',
-                image_url='https://via.placeholder.com/300x300?text=Webcam'
-            ),
-            Product(
-                name='Desk Lamp',
-                description='LED desk lamp with adjustable brightness',
-                price=34.99,
-                stock_quantity=120,
-                category='Office',
-                image_url='https://via.placeholder.com/300x300?text=Lamp'
-            )
-        ]
+        reset_database()
+        seed_database(DEVELOPMENT_DATA)
+
+
+def ensure_database(config_name=None):
+    """Create and seed the database if it has no tables yet, else upgrade its schema. Returns True if it seeded."""
+    app = create_app(config_name or os.getenv('FLASK_ENV', 'development'))
+    
+    with app.app_context(), advisory_lock(db.engine, INIT_LOCK_KEY):
+        # Shards added since the last run get their schema even if the database exists
+        create_shard_schemas()
         
-        for product in products:
-            db.session.add(product)
+        if inspect(db.engine).get_table_names():
+            added = upgrade_schema(db.engine, db.metadata)
+            print("Database already initialized." + (f" Added columns: {', '.join(added)}" if added else ""))
+            return False
         
-        # Commit all changes
-        db.session.commit()
-        print("Sample data created successfully!")
-        print(f"\nAdmin credentials: {Config.ADMIN_EMAIL} / {Config.ADMIN_PASSWORD}")
-        print(f"Test user credentials: user@orders.com / user123")
-        print("\nDatabase initialization complete!")
+        print("Database tables not found. Creating database tables...")
+        db.create_all()
+        seed_database(CATALOG_DATA)
+        return True
+
+
+def seed_database(volumes, **options):
+    """Create the admin user and a test user, then generate ``volumes`` of data (see seed.py)"""
+    from seed import generate
+    
+    # Create admin user
+    print("Creating admin user...")
+    admin = User(
+        email=Config.ADMIN_EMAIL,
+        first_name='Admin',
+        last_name='User',
+        role='admin'
+    )
+    admin.set_password(Config.ADMIN_PASSWORD)
+    db.session.add(admin)
+    
+    # Create test user
+    print("Creating test user...")
+    test_user = User(
+        email='user@orders.com',
+        first_name='Test',
+        last_name='User',
+        role='user'
+    )
+    test_user.set_password('user123')
+    db.session.add(test_user)
+    db.session.commit()
+    
+    print("Generating data: " + ', '.join(f"{count} {name}" for name, count in volumes.items()))
+    generate(**volumes, **options)
+    
+    print("Sample data created successfully!")
+    print(f"\nAdmin credentials: {Config.ADMIN_EMAIL} / {Config.ADMIN_PASSWORD}")
+    print(f"Test user credentials: user@orders.com / user123")
+    print("\nDatabase initialization complete!")
 
 
 if __name__ == '__main__':
-    init_database()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--if-missing', action='store_true',
+                        help='only create and seed the database if it has no tables')
+    args = parser.parse_args()
+    
+    if args.if_missing:
+        ensure_database()
+    else:
+        init_database()
@@ -0,0 +1,131 @@
+"""
+Move carts and orders to the user shard the hash ring now picks
+
+Run after adding shards to ``USER_SHARD_URLS`` (and ``python init_db.py
+--if-missing`` to create their schema). The consistent hash ring only moves
+users onto the new shards, ~1/N of them. For each moved user the orders (with
+their items and payments) and cart items are copied to the new shard and then
+deleted from the old one, a batch of users at a time. Rows keep their ids, and
+copies replace rows with the same ids, so an interrupted run can be repeated.
+
+Only moves to a higher shard are supported: rows copied into a lower shard
+would push its id sequence into the source shard's id range.
+
+Usage:
+    python rebalance_shards.py --dry-run
+    python rebalance_shards.py --batch-size 500
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.dialects import bulk_insert
+from app.sharding import get_shard_router
+from sqlalchemy import select
+
+# Parents before children, so foreign keys within a shard are satisfied on insert
+TABLE_ORDER = ('orders', 'order_items', 'payments', 'cart_items')
+
+
+def misplaced_users(router, index):
+    """Users with rows on shard ``index`` that the ring now maps elsewhere, grouped by target shard"""
+    orders = db.metadata.tables['orders']
+    cart_items = db.metadata.tables['cart_items']
+    with router.engine(index).connect() as connection:
+        users = set(connection.execute(select(orders.c.user_id).distinct()).scalars())
+        users |= set(connection.execute(select(cart_items.c.user_id).distinct()).scalars())
+
+    targets = {}
+    for user_id in sorted(users):
+        target = router.shard_for_user(user_id)
+        if target != index:
+            targets.setdefault(target, []).append(user_id)
+    return targets
+
+
+def user_rows(connection, user_ids):
+    """Rows of every sharded table belonging to ``user_ids``, keyed by table name"""
+    tables = db.metadata.tables
+    rows = {
+        'orders': connection.execute(
+            select(tables['orders']).where(tables['orders'].c.user_id.in_(user_ids))
+        ).mappings().all(),
+        'cart_items': connection.execute(
+            select(tables['cart_items']).where(tables['cart_items'].c.user_id.in_(user_ids))
+        ).mappings().all()
+    }
+    order_ids = [row['id'] for row in rows['orders']]
+    for name in ('order_items', 'payments'):
+        rows[name] = connection.execute(
+            select(tables[name]).where(tables[name].c.order_id.in_(order_ids))
+        ).mappings().all() if order_ids else []
+    return {name: [dict(row) for row in rows[name]] for name in TABLE_ORDER}
+
+
+def _delete_rows(connection, rows):
+    for name in reversed(TABLE_ORDER):
+        if rows[name]:
+            table = db.metadata.tables[name]
+            connection.execute(table.delete().where(table.c.id.in_([row['id'] for row in rows[name]])))
+
+
+def move_users(source, target, user_ids):
+    """Copy the users' rows from ``source`` to ``target``, then delete them from ``source``"""
+    with source.connect() as connection:
+        rows = user_rows(connection, user_ids)
+
+    with target.begin() as connection:
+        _delete_rows(connection, rows)
+        for name in TABLE_ORDER:
+            bulk_insert(connection, db.metadata.tables[name], rows[name])
+
+    with source.begin() as connection:
+        _delete_rows(connection, rows)
+
+    return {name: len(rows[name]) for name in TABLE_ORDER}
+
+
+def rebalance(batch_size=500, dry_run=False):
+    """Move every misplaced user's rows to its shard. Returns the number of users moved."""
+    router = get_shard_router()
+    plan = [
+        (source, target, user_ids)
+        for source in range(router.shard_count)
+        for target, user_ids in misplaced_users(router, source).items()
+    ]
+
+    backwards = [(source, target) for source, target, _ in plan if target < source]
+    if backwards:
+        raise SystemExit(f"Refusing to move users to a lower shard (source, target): {backwards}")
+
+    moved = 0
+    for source, target, user_ids in plan:
+        print(f"shard {source} -> shard {target}: {len(user_ids)} users")
+        if dry_run:
+            continue
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            counts = move_users(router.engine(source), router.engine(target), batch)
+            moved += len(batch)
+            print(f"  moved {len(batch)} users: " + ', '.join(f"{count} {name}" for name, count in counts.items()))
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=500, help='users moved per transaction')
+    parser.add_argument('--dry-run', action='store_true', help='only print how many users would move')
+    args = parser.parse_args()
+
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+    with app.app_context():
+        moved = rebalance(batch_size=args.batch_size, dry_run=args.dry_run)
+    if not args.dry_run:
+        print(f"Rebalance complete: {moved} users moved")
+
+
+if __name__ == '__main__':
+    main()
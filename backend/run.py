@@ -1,5 +1,10 @@
 """
 Application entry point
+
+Development:  python run.py  (Werkzeug dev server)
+Production:   gunicorn -c gunicorn.conf.py run:app
+
+Create the database first with ``python init_db.py`` (or ``--if-missing``).
 """
 import os
 from app import create_app
@@ -11,21 +16,6 @@ env = os.getenv('FLASK_ENV', 'development')
 app = create_app(env)
 
 if __name__ == '__main__':
-    # Auto-initialize database if needed
-    with app.app_context():
-        try:
-            from app import db
-            from sqlalchemy import inspect
-            from init_db import init_database
-            
-            inspector = inspect(db.engine)
-            if not inspector.get_table_names():
-                print("Database tables not found. Initializing...")
-                init_database()
-                print("Database initialized successfully.")
-        except Exception as e:
-            print(f"Database check/initialization failed: {e}")
-
     app.run(
         host=app.config['HOST'],
         port=app.config['PORT'],
@@ -0,0 +1,340 @@
+"""
+Synthetic data generator - Reproducible users, products, carts, orders and payments at scale
+
+The same ``--seed`` always produces the same data. Products get a category
+mix with per-category price ranges; order lines pick products with Zipf-skewed
+popularity (a few best sellers, a long tail) and order statuses follow their
+age. Rows are generated in chunks of ``--chunk-size`` and written with bulk
+Core inserts (``COPY`` on PostgreSQL, executemany elsewhere), one transaction
+per chunk, with carts and orders going to each user's shard. Cart lines
+reserve their stock one line at a time, as when added through the API.
+
+By default the database is reset first (like ``init_db.py``, with the admin
+and test users); ``--append`` adds to the existing data instead, continuing
+after the highest ids (pass a different ``--seed`` to get different rows).
+Generated users log in with ``password123``.
+
+Usage:
+    python seed.py --users 100000 --products 50000 --orders 2000000 --carts 20000
+    python seed.py --orders 500000 --append
+    python seed.py --seed 7 --chunk-size 50000
+"""
+import argparse
+import math
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from random import Random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.dialects import bulk_insert
+from app.sharding import SHARD_ID_SPAN, get_shard_router
+from flask import current_app
+from sqlalchemy import func, select
+from werkzeug.security import generate_password_hash
+
+DEFAULT_PASSWORD = 'password123'
+
+# category -> (share of the catalog, price range, product nouns)
+CATEGORIES = {
+    'Electronics': (0.25, (20, 1500), ['Laptop', 'Monitor', 'Headphones', 'Speaker', 'Webcam', 'Tablet']),
+    'Accessories': (0.20, (5, 120), ['Cable', 'Hub', 'Charger', 'Case', 'Stand', 'Adapter']),
+    'Office': (0.15, (3, 400), ['Desk', 'Chair', 'Lamp', 'Notebook', 'Pen', 'Organizer']),
+    'Home': (0.15, (8, 600), ['Mug', 'Kettle', 'Blanket', 'Vase', 'Clock', 'Shelf']),
+    'Clothing': (0.15, (10, 250), ['Jacket', 'Shirt', 'Shoes', 'Hat', 'Scarf', 'Backpack']),
+    'Books': (0.10, (5, 80), ['Novel', 'Cookbook', 'Guide', 'Atlas', 'Journal', 'Anthology'])
+}
+
+ADJECTIVES = ['Classic', 'Compact', 'Deluxe', 'Ergonomic', 'Lightweight', 'Modern', 'Portable', 'Premium',
+              'Rugged', 'Smart', 'Vintage', 'Wireless']
+
+FIRST_NAMES = ['Alex', 'Blair', 'Casey', 'Dana', 'Emery', 'Finley', 'Harper', 'Jordan', 'Kai', 'Morgan',
+               'Quinn', 'Riley', 'Sage', 'Taylor']
+
+LAST_NAMES = ['Adams', 'Brown', 'Chen', 'Diaz', 'Evans', 'Garcia', 'Kim', 'Lee', 'Miller', 'Nguyen',
+              'Patel', 'Smith', 'Wong', 'Young']
+
+STREETS = ['Main St', 'Oak Ave', 'Pine Rd', 'Maple Dr', 'Cedar Ln', 'Elm St', 'Lake Rd', 'Hill St']
+
+PAYMENT_METHODS = ['credit_card', 'debit_card', 'paypal']
+
+# Lines per order and their relative frequency
+ORDER_SIZES = ([1, 2, 3, 4, 5], [40, 30, 15, 10, 5])
+
+PAYMENT_STATUS = {'pending': 'pending', 'cancelled': 'refunded'}
+
+
+class Progress:
+    """Rows written per table, reported on stderr at most once per second"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self._last = 0.0
+
+    def report(self, table, done, total, force=False):
+        now = time.perf_counter()
+        if not self.enabled or (not force and now - self._last < 1):
+            return
+        self._last = now
+        elapsed = now - self.started
+        print(f"  {table}: {done}/{total} ({done / total:.0%}) {elapsed:.0f}s", file=sys.stderr)
+
+
+class Popularity:
+    """Zipf-distributed picks from a list of ids (rank order shuffled, so not by id)"""
+
+    def __init__(self, ids, rng, exponent=1.1):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        total = 0.0
+        self.cum_weights = []
+        for rank in range(1, len(self.ids) + 1):
+            total += 1 / rank ** exponent
+            self.cum_weights.append(total)
+
+    def pick(self, rng, k=1):
+        return rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+
+def next_id(connection, table, floor=0):
+    """First id after the table's highest (and after ``floor``)"""
+    highest = connection.execute(select(func.max(table.c.id))).scalar()
+    return max(highest or 0, floor) + 1
+
+
+def _chunks(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def generate_users(count, rng, chunk_size, progress):
+    """Insert ``count`` customers with one shared password hash"""
+    table = db.metadata.tables['users']
+    password_hash = generate_password_hash(DEFAULT_PASSWORD, current_app.config['PASSWORD_HASH_METHOD'])
+    now = datetime.utcnow()
+
+    with db.engine.connect() as connection:
+        first = next_id(connection, table)
+    for start, size in _chunks(count, chunk_size):
+        rows = []
+        for user_id in range(first + start, first + start + size):
+            created = now - timedelta(seconds=rng.randrange(2 * 365 * 86400))
+            rows.append({
+                'id': user_id, 'email': f'customer{user_id}@example.com', 'password_hash': password_hash,
+                'first_name': rng.choice(FIRST_NAMES), 'last_name': rng.choice(LAST_NAMES), 'role': 'user',
+                'is_active': rng.random() > 0.01, 'created_at': created, 'updated_at': created
+            })
+        with db.engine.begin() as connection:
+            bulk_insert(connection, table, rows)
+        progress.report('users', start + size, count, force=start + size == count)
+
+
+def generate_products(count, rng, chunk_size, progress):
+    """Insert ``count`` products spread over ``CATEGORIES``"""
+    table = db.metadata.tables['products']
+    names = list(CATEGORIES)
+    shares = [share for share, _, _ in CATEGORIES.values()]
+    now = datetime.utcnow()
+
+    with db.engine.connect() as connection:
+        first = next_id(connection, table)
+    for start, size in _chunks(count, chunk_size):
+        rows = []
+        for product_id, category in zip(range(first + start, first + start + size),
+                                        rng.choices(names, weights=shares, k=size)):
+            _, (low, high), nouns = CATEGORIES[category]
+            noun = rng.choice(nouns)
+            # Log-uniform: cheap items are more common than expensive ones
+            price = round(math.exp(rng.uniform(math.log(low), math.log(high))), 2)
+            rows.append({
+                'id': product_id, 'name': f'{rng.choice(ADJECTIVES)} {noun} {product_id}',
+                'description': f'{category} {noun.lower()} from the synthetic catalog', 'price': price,
+                'stock_quantity': rng.randrange(0, 1000), 'reserved_quantity': 0, 'stock_shard_count': 0,
+                'category': category, 'image_url': f'https://via.placeholder.com/300x300?text={noun}',
+                'is_active': rng.random() > 0.02, 'created_at': now, 'updated_at': now
+            })
+        with db.engine.begin() as connection:
+            bulk_insert(connection, table, rows)
+        progress.report('products', start + size, count, force=start + size == count)
+
+
+def _order_status(rng, age):
+    if rng.random() < 0.05:
+        return 'cancelled'
+    if age < timedelta(days=1):
+        return rng.choice(['pending', 'processing'])
+    if age < timedelta(days=5):
+        return rng.choice(['processing', 'shipped'])
+    return 'delivered'
+
+
+def generate_orders(count, user_ids, prices, popularity, rng, chunk_size, days, progress):
+    """
+    Insert ``count`` orders spread evenly over the last ``days`` days, each with
+    its lines and payment, on the shard of the ordering user.
+    """
+    router = get_shard_router()
+    tables = db.metadata.tables
+    now = datetime.utcnow()
+    step = timedelta(days=days) / count
+    order_ids = {}
+
+    for start, size in _chunks(count, chunk_size):
+        shards = {}
+        for n in range(start, start + size):
+            created = now - timedelta(days=days) + step * (n + rng.random())
+            user_id = rng.choice(user_ids)
+            index = router.shard_for_user(user_id)
+            if index not in order_ids:
+                with router.engine(index).connect() as connection:
+                    order_ids[index] = next_id(connection, tables['orders'], index * SHARD_ID_SPAN)
+            order_id = order_ids[index]
+            order_ids[index] += 1
+
+            status = _order_status(rng, now - created)
+            lines = rng.choices(*ORDER_SIZES)[0]
+            items = [{
+                'order_id': order_id, 'product_id': product_id, 'quantity': rng.choice((1, 1, 1, 2, 3)),
+                'price_at_purchase': prices[product_id]
+            } for product_id in popularity.pick(rng, lines)]
+            total = round(sum(item['price_at_purchase'] * item['quantity'] for item in items), 2)
+            rows = shards.setdefault(index, {'orders': [], 'order_items': [], 'payments': []})
+            rows['orders'].append({
+                'id': order_id, 'user_id': user_id, 'total_amount': total, 'status': status,
+                'shipping_address': f'{rng.randrange(1, 9999)} {rng.choice(STREETS)}',
+                'created_at': created, 'updated_at': created
+            })
+            rows['order_items'].extend(items)
+            rows['payments'].append({
+                'order_id': order_id, 'amount': total, 'payment_method': rng.choice(PAYMENT_METHODS),
+                'payment_status': PAYMENT_STATUS.get(status, 'completed'),
+                'transaction_id': f'seed-{order_id}', 'created_at': created, 'updated_at': created
+            })
+
+        for index, rows in shards.items():
+            with router.engine(index).begin() as connection:
+                for name in ('orders', 'order_items', 'payments'):
+                    bulk_insert(connection, tables[name], rows[name])
+        progress.report('orders', start + size, count, force=start + size == count)
+
+
+def generate_carts(count, user_ids, popularity, rng, chunk_size, progress):
+    """
+    Give ``count`` distinct users a cart of one to five products.
+
+    Every line reserves its stock like a cart added through the API; lines
+    without enough stock left, and products already in the user's cart
+    (``--append``), are skipped.
+    """
+    from app.services import inventory
+
+    router = get_shard_router()
+    table = db.metadata.tables['cart_items']
+    now = datetime.utcnow()
+    shoppers = rng.sample(user_ids, min(count, len(user_ids)))
+
+    for start, size in _chunks(len(shoppers), chunk_size):
+        shards = {}
+        for user_id in shoppers[start:start + size]:
+            shards.setdefault(router.shard_for_user(user_id), []).append(user_id)
+
+        for index, users in shards.items():
+            with router.engine(index).connect() as connection:
+                existing = set(connection.execute(
+                    select(table.c.user_id, table.c.product_id).where(table.c.user_id.in_(users))
+                ).all())
+
+            rows = []
+            for user_id in users:
+                added = now - timedelta(seconds=rng.randrange(3 * 86400))
+                for product_id in dict.fromkeys(popularity.pick(rng, rng.randint(1, 5))):
+                    quantity = rng.randint(1, 3)
+                    if (user_id, product_id) in existing:
+                        continue
+                    # One transaction per line, as when adding to a cart: a failed reserve rolls back
+                    if not inventory.reserve(user_id, product_id, quantity):
+                        db.session.rollback()
+                        continue
+                    db.session.commit()
+                    rows.append({
+                        'user_id': user_id, 'product_id': product_id, 'quantity': quantity,
+                        'created_at': added, 'updated_at': added
+                    })
+            if rows:
+                with router.engine(index).begin() as connection:
+                    bulk_insert(connection, table, rows)
+        progress.report('carts', start + size, len(shoppers), force=start + size == len(shoppers))
+
+
+def generate(users=0, products=0, orders=0, carts=0, seed=42, chunk_size=10000, days=365, zipf=1.1,
+             progress=True):
+    """
+    Append generated data to the current app's database. Carts and orders
+    are drawn over all active customers and products, existing ones included.
+    """
+    rng = Random(seed)
+    reporter = Progress(progress)
+
+    if users:
+        generate_users(users, rng, chunk_size, reporter)
+    if products:
+        generate_products(products, rng, chunk_size, reporter)
+    if not (orders or carts):
+        return
+
+    tables = db.metadata.tables
+    with db.engine.connect() as connection:
+        user_ids = list(connection.execute(
+            select(tables['users'].c.id).where(tables['users'].c.role == 'user').order_by(tables['users'].c.id)
+        ).scalars())
+        prices = dict(connection.execute(
+            select(tables['products'].c.id, tables['products'].c.price)
+            .where(tables['products'].c.is_active.is_(True)).order_by(tables['products'].c.id)
+        ).all())
+    if not user_ids or not prices:
+        raise SystemExit("Orders and carts need at least one customer and one active product")
+
+    popularity = Popularity(prices, rng, zipf)
+    if orders:
+        generate_orders(orders, user_ids, prices, popularity, rng, chunk_size, days, reporter)
+    if carts:
+        generate_carts(carts, user_ids, popularity, rng, chunk_size, reporter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--carts', type=int, default=100, help='users given a non-empty cart')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (same seed, same data)')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='rows generated per insert batch')
+    parser.add_argument('--days', type=int, default=365, help='orders are spread over this many past days')
+    parser.add_argument('--zipf', type=float, default=1.1, help='product popularity skew (Zipf exponent)')
+    parser.add_argument('--append', action='store_true', help='keep existing data and add to it')
+    parser.add_argument('--quiet', action='store_true', help='no progress output')
+    args = parser.parse_args()
+
+    from init_db import reset_database, seed_database
+
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+    volumes = dict(users=args.users, products=args.products, orders=args.orders, carts=args.carts)
+    options = dict(seed=args.seed, chunk_size=args.chunk_size, days=args.days, zipf=args.zipf,
+                   progress=not args.quiet)
+
+    started = time.perf_counter()
+    with app.app_context():
+        if args.append:
+            generate(**volumes, **options)
+        else:
+            reset_database()
+            seed_database(volumes, **options)
+    print(f"Seeding complete in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,13 @@
 """
 Test Configuration
+
+The schema is created once per test process (each pytest-xdist worker has
+its own database, see ``TestingConfig``) and emptied after every test.
+Emptying rather than rolling back a per-test transaction also covers rows
+committed on other connections: the write-behind cart flusher, shard
+engines and background sweepers.
+
+    python -m pytest -q -n auto
 """
 import pytest
 import sys
@@ -11,18 +19,60 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app import create_app, db
 from app.models.user import User
 from app.models.product import Product
+from app.querytrace import record_queries
+from config import TestingConfig
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+
+def create_worker_database(url):
+    """Create a pytest-xdist worker's PostgreSQL database if it does not exist yet"""
+    url = make_url(url)
+    if url.get_backend_name() != 'postgresql' or not os.getenv('PYTEST_XDIST_WORKER'):
+        return
+    engine = create_engine(url.set(database='postgres'), isolation_level='AUTOCOMMIT')
+    try:
+        with engine.connect() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM pg_database WHERE datname = :name"), {'name': url.database}
+            ).scalar()
+            if not exists:
+                connection.exec_driver_sql(f'CREATE DATABASE "{url.database}"')
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture(scope='session')
+def reset_database():
+    """Create the schema once per test process; returns a function emptying every table"""
+    create_worker_database(TestingConfig.SQLALCHEMY_DATABASE_URI)
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    
+    def reset():
+        # Children before parents
+        with db.engine.begin() as connection:
+            for table in reversed(db.metadata.sorted_tables):
+                connection.execute(table.delete())
+    
+    yield reset
+    
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
 
 
 @pytest.fixture
-def app():
+def app(reset_database):
     """Create application for testing"""
     app = create_app('testing')
     
     with app.app_context():
-        db.create_all()
         yield app
         db.session.remove()
-        db.drop_all()
+        reset_database()
 
 
 @pytest.fixture
@@ -92,3 +142,34 @@ def sample_product():
     db.session.add(product)
     db.session.commit()
     return product
+
+
+@pytest.fixture
+def query_budget(app):
+    """
+    Fail the test if a block runs more SQL statements than its budget.
+    
+        with query_budget(3):
+            client.get('/api/orders', headers=auth_headers)
+    
+    Statement shapes repeated ``N_PLUS_ONE_THRESHOLD`` times (N+1 candidates)
+    also fail unless ``allow_repeats=True``.
+    """
+    from contextlib import contextmanager
+    
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    
+    @contextmanager
+    def budget(max_queries, allow_repeats=False):
+        with record_queries() as recorder:
+            yield recorder
+        
+        statements = '\n'.join(f'  {shape}' for shape, _ in recorder.statements)
+        assert recorder.count <= max_queries, (
+            f"{recorder.count} queries over a budget of {max_queries}:\n{statements}"
+        )
+        if not allow_repeats:
+            repeated = recorder.repeated(threshold)
+            assert not repeated, f"N+1 query candidates: {repeated}"
+    
+    return budget
@@ -0,0 +1,91 @@
+"""
+Batch Tests
+"""
+
+
+def test_batch_runs_requests_in_order(client, auth_headers, sample_product):
+    """Test a batch returns every item's status and body, and later items see earlier writes"""
+    response = client.post('/api/batch', headers=auth_headers, json={'requests': [
+        {'path': '/api/auth/profile'},
+        {'method': 'POST', 'path': '/api/cart/add', 'body': {'product_id': sample_product.id, 'quantity': 2}},
+        {'path': '/api/cart?view=slim', 'id': 'cart'},
+        {'path': '/api/products/999999'}
+    ]})
+    
+    assert response.status_code == 200
+    profile, added, cart, missing = response.json['responses']
+    assert profile['status'] == 200
+    assert profile['body']['user']['email'] == 'test@example.com'
+    assert added['status'] in (200, 201)
+    assert cart['id'] == 'cart'
+    assert cart['status'] == 200
+    assert cart['body']['cart_items'][0]['quantity'] == 2
+    assert missing['id'] == 3
+    assert missing['status'] == 404
+
+
+def test_batch_parallel_reads(client, auth_headers, sample_product):
+    """Test independent GETs run concurrently and come back in request order"""
+    response = client.post('/api/batch', headers=auth_headers, json={'parallel': True, 'requests': [
+        {'path': f'/api/products/{sample_product.id}'},
+        {'path': '/api/products'},
+        {'path': '/api/cart'},
+        {'path': '/api/orders'}
+    ]})
+    
+    assert response.status_code == 200
+    statuses = [item['status'] for item in response.json['responses']]
+    assert statuses == [200, 200, 200, 200]
+    assert response.json['responses'][0]['body']['product']['id'] == sample_product.id
+    assert 'ETag' in response.json['responses'][1]['headers']
+
+
+def test_batch_items_keep_their_own_auth(client, sample_product):
+    """Test protected items fail on their own while public ones succeed"""
+    response = client.post('/api/batch', json={'requests': [
+        {'path': '/api/products'},
+        {'path': '/api/cart'}
+    ]})
+    
+    assert response.status_code == 200
+    assert [item['status'] for item in response.json['responses']] == [200, 401]
+
+
+def test_batch_validation(client, auth_headers):
+    """Test malformed batches are rejected as a whole"""
+    assert client.post('/api/batch', json={'requests': []}).status_code == 400
+    assert client.post('/api/batch', json={'requests': [{'path': '/api/batch'}]}).status_code == 400
+    assert client.post('/api/batch', json={'requests': [{'path': '/metrics'}]}).status_code == 400
+    assert client.post('/api/batch', json={'requests': [{'path': '/api/products'}] * 21}).status_code == 400
+    
+    bad_token = {'Authorization': 'Bearer not-a-token'}
+    assert client.post('/api/batch', headers=bad_token, json={'requests': [{'path': '/api/products'}]}).status_code == 401
+
+
+def test_batch_verifies_token_once(client, auth_headers, sample_product, monkeypatch):
+    """Test items run as the batch's user without decoding the token again"""
+    from flask_jwt_extended import view_decorators
+    
+    decoded = []
+    decode = view_decorators._decode_jwt_from_request
+    
+    def counting_decode(*args, **kwargs):
+        decoded.append(1)
+        return decode(*args, **kwargs)
+    
+    monkeypatch.setattr(view_decorators, '_decode_jwt_from_request', counting_decode)
+    client.post('/api/batch', headers=auth_headers, json={'requests': [{'path': '/api/cart'}]})
+    single = len(decoded)
+    
+    response = client.post('/api/batch', headers=auth_headers, json={'parallel': True, 'requests': [
+        {'path': '/api/auth/profile'},
+        {'path': '/api/cart'},
+        {'path': '/api/orders'},
+        {'method': 'POST', 'path': '/api/cart/add', 'body': {'product_id': sample_product.id, 'quantity': 1}}
+    ]})
+    
+    assert [item['status'] for item in response.json['responses']][:3] == [200, 200, 200]
+    assert response.json['responses'][3]['status'] in (200, 201)
+    assert response.json['responses'][0]['body']['user']['email'] == 'test@example.com'
+    # The batch's own check only, however many items it has
+    assert len(decoded) == 2 * single
@@ -0,0 +1,223 @@
+"""
+Cart Tests
+"""
+import pytest
+
+
+def test_get_empty_cart(client, auth_headers):
+    """Test getting an empty cart"""
+    response = client.get('/api/cart', headers=auth_headers)
+    
+    assert response.status_code == 200
+    assert response.json['cart_items'] == []
+    assert response.json['total'] == 0
+    assert response.json['count'] == 0
+
+
+def test_add_to_cart(client, auth_headers, sample_product):
+    """Test adding item to cart"""
+    response = client.post('/api/cart/add',
+        headers=auth_headers,
+        json={'product_id': sample_product.id, 'quantity': 2}
+    )
+    
+    assert response.status_code == 201
+    assert response.json['cart_item']['quantity'] == 2
+
+
+def test_get_cart_totals(client, auth_headers, sample_product):
+    """Test cart subtotals and total are computed"""
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 3})
+    
+    response = client.get('/api/cart', headers=auth_headers)
+    
+    assert response.status_code == 200
+    item = response.json['cart_items'][0]
+    assert item['subtotal'] == pytest.approx(99.99 * 3)
+    assert item['product']['name'] == 'Test Product'
+    assert 'description' in item['product']
+    assert response.json['total'] == pytest.approx(99.99 * 3)
+    assert response.json['count'] == 1
+
+
+def test_get_cart_slim(client, auth_headers, sample_product):
+    """Test slim cart view only returns the product fields the UI needs"""
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 1})
+    
+    response = client.get('/api/cart?view=slim', headers=auth_headers)
+    
+    assert response.status_code == 200
+    product = response.json['cart_items'][0]['product']
+    assert set(product) == {'id', 'name', 'price', 'image_url', 'stock_quantity'}
+
+
+def test_add_to_cart_insufficient_stock(client, auth_headers, sample_product):
+    """Test adding more than available stock"""
+    response = client.post('/api/cart/add',
+        headers=auth_headers,
+        json={'product_id': sample_product.id, 'quantity': 100}
+    )
+    
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def write_behind_store(app):
+    """Swap in the write-behind cart store (flushed manually by the tests)"""
+    from app.services.cart_store import WriteBehindCartStore
+    
+    store = WriteBehindCartStore(app, flush_interval=3600)
+    app.extensions['cart_store'] = store
+    return store
+
+
+def test_memory_cart_store_refused_with_several_workers(monkeypatch):
+    """Test CART_STORE=memory is refused when more than one worker process serves the app"""
+    from app import create_app
+    from config import TestingConfig
+    
+    monkeypatch.setattr(TestingConfig, 'CART_STORE', 'memory')
+    monkeypatch.setattr(TestingConfig, 'WEB_CONCURRENCY', 3)
+    
+    with pytest.raises(ValueError, match='CART_STORE=memory'):
+        create_app('testing')
+
+
+def test_write_behind_buffers_until_flush(client, auth_headers, sample_product, write_behind_store):
+    """Test write-behind store serves carts from memory and persists on flush"""
+    from app import db
+    from app.models.cart import CartItem
+    
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 2})
+    
+    response = client.get('/api/cart', headers=auth_headers)
+    assert response.json['count'] == 1
+    assert response.json['total'] == pytest.approx(99.99 * 2)
+    assert CartItem.query.count() == 0
+    assert write_behind_store.pending == 1
+    
+    write_behind_store.flush()
+    db.session.expire_all()
+    
+    assert CartItem.query.count() == 1
+    assert CartItem.query.first().quantity == 2
+    assert write_behind_store.pending == 0
+
+
+def test_write_behind_checkout(client, auth_headers, sample_product, write_behind_store):
+    """Test checkout reads the buffered cart and clears it"""
+    from app.models.cart import CartItem
+    
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 1})
+    
+    response = client.post('/api/orders/checkout', headers=auth_headers, json={})
+    assert response.status_code == 201
+    assert len(response.json['order']['items']) == 1
+    
+    write_behind_store.flush()
+    assert client.get('/api/cart', headers=auth_headers).json['count'] == 0
+    assert CartItem.query.count() == 0
+
+
+def test_add_to_cart_reserves_stock(client, auth_headers, admin_headers, sample_product):
+    """Test stock held by one cart is unavailable to other carts"""
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 8})
+    
+    product = client.get(f'/api/products/{sample_product.id}').json['product']
+    assert product['stock_quantity'] == 10
+    assert product['available_quantity'] == 2
+    
+    response = client.post('/api/cart/add', headers=admin_headers,
+                           json={'product_id': sample_product.id, 'quantity': 3})
+    assert response.status_code == 400
+
+
+def test_remove_from_cart_releases_reservation(client, auth_headers, sample_product):
+    """Test removing a cart line releases its reservation"""
+    cart_item = client.post('/api/cart/add', headers=auth_headers,
+                            json={'product_id': sample_product.id, 'quantity': 4}).json['cart_item']
+    
+    response = client.delete(f"/api/cart/{cart_item['id']}", headers=auth_headers)
+    
+    assert response.status_code == 200
+    product = client.get(f'/api/products/{sample_product.id}').json['product']
+    assert product['available_quantity'] == 10
+
+
+def test_expired_reservations_are_swept(app, client, auth_headers, sample_product):
+    """Test the sweeper releases expired reservations in bulk"""
+    from datetime import datetime, timedelta
+    from app.models.reservation import StockReservation
+    from app.services.inventory import expire_reservations
+    
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 5})
+    assert StockReservation.query.count() == 1
+    
+    released = expire_reservations(now=datetime.utcnow() + timedelta(seconds=app.config['STOCK_RESERVATION_TTL'] + 1))
+    
+    assert released == 1
+    assert StockReservation.query.count() == 0
+    product = client.get(f'/api/products/{sample_product.id}').json['product']
+    assert product['available_quantity'] == 10
+
+
+def test_get_cart_query_budget(client, auth_headers, query_budget):
+    """Test the cart view does not load products line by line"""
+    from app import db
+    from app.models.product import Product
+    
+    products = [Product(name=f'Budget {n}', price=5.0, stock_quantity=10) for n in range(6)]
+    db.session.add_all(products)
+    db.session.commit()
+    for product in products:
+        client.post('/api/cart/add', headers=auth_headers, json={'product_id': product.id, 'quantity': 1})
+    
+    with query_budget(3):
+        response = client.get('/api/cart', headers=auth_headers)
+    
+    assert response.json['count'] == 6
+
+
+def test_checkout_racing_reservation_sweep_releases_once(app, client, auth_headers, sample_product, monkeypatch):
+    """Test a hold the sweeper expires while checkout is consuming it is only released once"""
+    import threading
+    from datetime import datetime, timedelta
+    from app import db
+    from app.models.product import Product
+    from app.models.reservation import StockReservation
+    from app.services import inventory
+    
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 2})
+    reservation = StockReservation.query.one()
+    user_id, product_id = reservation.user_id, reservation.product_id
+    reservation.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    
+    swept = threading.Event()
+    sweeper = threading.Thread(target=lambda: (app.extensions['reservation_sweeper'].sweep(), swept.set()))
+    shard_count = inventory._shard_count
+    
+    def sweep_midway(product_id):
+        # The sweeper runs while consume() is between finding the hold and updating stock
+        if sweeper.ident is None:
+            sweeper.start()
+            swept.wait(0.5)
+        return shard_count(product_id)
+    
+    monkeypatch.setattr(inventory, '_shard_count', sweep_midway)
+    assert inventory.consume(user_id, product_id, 2)
+    db.session.commit()
+    sweeper.join()
+    
+    product = db.session.get(Product, product_id)
+    db.session.refresh(product)
+    assert product.stock_quantity == 8
+    assert product.reserved_quantity == 0
+    assert StockReservation.query.count() == 0
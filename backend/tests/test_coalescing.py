@@ -0,0 +1,120 @@
+"""
+Request Coalescing Tests
+"""
+import threading
+import time
+
+import pytest
+
+from app.middleware.coalescing import SingleFlight
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_identical_reads_run_the_view_once(app, sample_product, monkeypatch):
+    """Test a request arriving while an identical one is in flight shares its response"""
+    from app.routes import products
+    
+    release = threading.Event()
+    calls = []
+    compile_serializer = products.product_serializer.compile
+    
+    def slow_compile(*args, **kwargs):
+        calls.append(1)
+        release.wait(5)
+        return compile_serializer(*args, **kwargs)
+    
+    monkeypatch.setattr(products.product_serializer, 'compile', slow_compile)
+    app.extensions['response_cache'].clear()
+    flight = app.extensions['single_flight']
+    responses = []
+    
+    def fetch():
+        responses.append(app.test_client().get('/api/products?category=Electronics'))
+    
+    leader = threading.Thread(target=fetch)
+    leader.start()
+    _wait_for(lambda: flight.in_flight == 1)
+    follower = threading.Thread(target=fetch)
+    follower.start()
+    _wait_for(lambda: flight.stats()['followers'] == 1)
+    release.set()
+    leader.join()
+    follower.join()
+    
+    assert len(calls) == 1
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].get_data() == responses[1].get_data()
+    assert responses[0].headers['ETag'] == responses[1].headers['ETag']
+    stats = flight.stats()['keys']['/api/products?category=Electronics']
+    assert stats['leaders'] == 1 and stats['followers'] == 1
+
+
+def test_single_flight_propagates_errors():
+    """Test waiters see the leader's exception"""
+    flight = SingleFlight(timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+    
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('database unavailable')
+    
+    def call():
+        try:
+            flight.do('key', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+    
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    _wait_for(lambda: flight.stats()['followers'] == 1)
+    release.set()
+    leader.join()
+    follower.join()
+    
+    assert errors == ['database unavailable'] * 2
+    assert flight.stats()['errors'] == 1
+    assert flight.in_flight == 0
+
+
+def test_single_flight_waiter_times_out_and_runs_itself():
+    """Test a waiter stops waiting for a stuck leader and computes the result on its own"""
+    flight = SingleFlight(timeout=0.05)
+    started = threading.Event()
+    release = threading.Event()
+    
+    def stuck():
+        started.set()
+        release.wait(5)
+        return 'leader'
+    
+    leader = threading.Thread(target=flight.do, args=('key', stuck))
+    leader.start()
+    started.wait(5)
+    
+    assert flight.do('key', lambda: 'own') == 'own'
+    assert flight.stats()['timeouts'] == 1
+    release.set()
+    leader.join()
+
+
+def test_single_flight_stats_are_bounded():
+    """Test per-key stats keep only the most recent keys"""
+    flight = SingleFlight(max_stats_keys=2)
+    for key in ('a', 'b', 'c'):
+        assert flight.do(key, lambda: key) == key
+    
+    assert list(flight.stats()['keys']) == ['b', 'c']
+    with pytest.raises(ValueError):
+        flight.do('d', lambda: int('x'))
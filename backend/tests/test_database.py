@@ -0,0 +1,144 @@
+"""
+Database Engine Tests
+"""
+import sqlite3
+
+import pytest
+from app import create_app, db
+from app.models.product import Product
+from config import TestingConfig
+
+sqlite_only = pytest.mark.skipif(
+    not TestingConfig.SQLALCHEMY_DATABASE_URI.startswith('sqlite'), reason='SQLite-specific behaviour'
+)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, reset_database):
+    """Application with one file-based SQLite replica"""
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_BINDS', {'replica_0': f"sqlite:///{tmp_path / 'replica.db'}"})
+    
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        reset_database()
+    # Flask-SQLAlchemy keeps a metadata per configured bind on the shared ``db``
+    db.metadatas.pop('replica_0', None)
+
+
+def replicate():
+    """Bring the replica up to date with a copy of the primary"""
+    source = db.engine.raw_connection()
+    target = sqlite3.connect(db.engines['replica_0'].url.database)
+    try:
+        source.driver_connection.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+@sqlite_only
+def test_sqlite_pragmas_applied(app):
+    """Test new SQLite connections get the configured pragmas"""
+    assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+    assert db.session.execute(db.text('PRAGMA busy_timeout')).scalar() == 5000
+    assert db.session.execute(db.text('PRAGMA synchronous')).scalar() == 1
+
+
+def test_memory_sqlite_drops_queue_pool_options():
+    """Test pool sizing options are not passed to an in-memory SQLite engine"""
+    from flask import Flask
+    from app.database import prepare_engine_options
+    
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 5, 'max_overflow': 2, 'pool_pre_ping': True}
+    prepare_engine_options(app)
+    
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {'pool_pre_ping': True}
+
+
+def test_invalid_pragma_value_rejected():
+    """Test pragma values are validated before being interpolated"""
+    import sqlite3
+    from app.database import apply_sqlite_pragmas
+    
+    with pytest.raises(ValueError):
+        apply_sqlite_pragmas(sqlite3.connect(':memory:'), {'journal_mode': 'WAL; DROP TABLE users'})
+
+
+@sqlite_only
+def test_get_reads_from_replica(client, sample_product):
+    """Test GET requests are served from the replica, writes go to the primary"""
+    replicate()
+    db.session.execute(db.update(Product).where(Product.id == sample_product.id).values(name='Primary only'))
+    db.session.commit()
+    
+    response = client.get(f'/api/products/{sample_product.id}')
+    
+    assert response.json['product']['name'] == 'Test Product'
+
+
+@sqlite_only
+def test_read_your_writes_pins_to_primary(app, client, auth_headers, sample_product):
+    """Test a user's reads go to the primary right after their own write"""
+    replicate()
+    client.post('/api/cart/add', headers=auth_headers, json={'product_id': sample_product.id, 'quantity': 1})
+    
+    assert len(client.get('/api/cart', headers=auth_headers).json['cart_items']) == 1
+    
+    app.extensions['replica_router'].pin_seconds = 0
+    app.extensions['replica_router']._pins.clear()
+    assert client.get('/api/cart', headers=auth_headers).json['cart_items'] == []
+
+
+@sqlite_only
+def test_replica_rejects_writes(app):
+    """Test replica connections are opened read-only"""
+    with db.engines['replica_0'].connect() as connection:
+        with pytest.raises(Exception):
+            connection.execute(db.text("CREATE TABLE t (id INTEGER)"))
+
+
+def test_least_busy_replica_selection():
+    """Test least-busy selection prefers the replica with fewer checked out connections"""
+    from unittest.mock import Mock
+    from app.routing import ReplicaRouter
+    
+    busy, idle = Mock(), Mock()
+    busy.pool.checkedout.return_value = 3
+    idle.pool.checkedout.return_value = 0
+    router = ReplicaRouter([busy, idle], selection='least_busy')
+    
+    assert router.choose() is idle
+
+
+def test_database_url_normalized():
+    """Test PostgreSQL URLs are pinned to the psycopg2 driver"""
+    from config import database_url
+    
+    assert database_url('postgres://u:p@db/orders') == 'postgresql+psycopg2://u:p@db/orders'
+    assert database_url('postgresql://u:p@db/orders') == 'postgresql+psycopg2://u:p@db/orders'
+    assert database_url('sqlite:///orders.db') == 'sqlite:///orders.db'
+
+
+def test_bulk_insert_fills_defaults(app, sample_product):
+    """Test bulk_insert inserts all rows with the model's column defaults"""
+    from app.dialects import bulk_insert
+    from app.models.cart import CartItem
+    from app.models.user import User
+    
+    user = User(email='bulk@example.com', first_name='Bulk', last_name='User')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    
+    with db.engine.begin() as connection:
+        inserted = bulk_insert(connection, CartItem.__table__, [
+            {'user_id': user.id, 'product_id': sample_product.id, 'quantity': 2}
+        ])
+    
+    assert inserted == 1
+    assert CartItem.query.filter_by(user_id=user.id).one().created_at is not None
@@ -0,0 +1,57 @@
+"""
+Health Check Tests
+"""
+import os
+import time
+
+
+def test_livez(client):
+    """Test the liveness probe answers without checking dependencies"""
+    response = client.get('/livez')
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'alive'}
+
+
+def test_readyz_reports_checks(client):
+    """Test the readiness probe reports each check and is ready on a healthy app"""
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['status'] == 'ready'
+    assert data['failing'] == []
+    assert data['checks']['database']['ok'] is True
+    assert 'latency_ms' in data['checks']['database']
+    assert 'admission_queue' in data['checks']
+
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert response.get_json()['database'] == 'connected'
+
+
+def test_readyz_fails_over_threshold(app, client):
+    """Test a required check over its threshold makes the worker not ready"""
+    app.extensions['readiness'].queue_depth = 0
+
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    data = response.get_json()
+    assert data['status'] == 'not_ready'
+    assert data['failing'] == ['admission_queue']
+
+    response = client.get('/health')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'unhealthy'
+
+
+def test_readyz_not_ready_when_status_is_stale(app, client):
+    """Test a checker that stopped refreshing makes the worker not ready"""
+    monitor = app.extensions['readiness']
+    monitor.refresh()
+    monitor.interval = 5
+    # Pretend this process' checker thread is running but stuck
+    monitor._thread_pid = os.getpid()
+    monitor._status['monotonic'] = time.monotonic() - 60
+
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()['failing'] == ['stale']
@@ -0,0 +1,80 @@
+"""
+Database Initialization and Seeding Tests
+"""
+import sqlite3
+
+import pytest
+from app import create_app, db
+from app.models.product import Product
+from app.models.reservation import StockReservation
+from config import TestingConfig
+
+sqlite_only = pytest.mark.skipif(
+    not TestingConfig.SQLALCHEMY_DATABASE_URI.startswith('sqlite'), reason='SQLite database file'
+)
+
+# ``products`` as created before stock reservations and stock shards existed
+BASELINE_PRODUCTS = """
+CREATE TABLE products (
+    id INTEGER NOT NULL PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    description TEXT,
+    price FLOAT NOT NULL,
+    stock_quantity INTEGER,
+    category VARCHAR(50),
+    image_url VARCHAR(500),
+    is_active BOOLEAN,
+    created_at DATETIME,
+    updated_at DATETIME
+)
+"""
+
+
+@sqlite_only
+def test_if_missing_upgrades_existing_schema(tmp_path, monkeypatch):
+    """Test --if-missing adds new tables and columns to a database created by an older release"""
+    from init_db import ensure_database
+    
+    path = tmp_path / 'baseline.db'
+    connection = sqlite3.connect(path)
+    connection.execute(BASELINE_PRODUCTS)
+    connection.execute("INSERT INTO products (id, name, price, stock_quantity, is_active) VALUES (1, 'Old', 5, 7, 1)")
+    connection.commit()
+    connection.close()
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{path}')
+    
+    assert ensure_database('testing') is False
+    
+    app = create_app('testing')
+    with app.app_context():
+        product = db.session.get(Product, 1)
+        assert (product.stock_quantity, product.reserved_quantity, product.stock_shard_count) == (7, 0, 0)
+        assert product.available_quantity == 7
+        assert StockReservation.query.count() == 0
+        db.session.remove()
+        db.engine.dispose()
+    
+    # Running it again is a no-op
+    assert ensure_database('testing') is False
+
+
+def test_seeded_carts_reserve_stock(app, sample_product):
+    """Test generated cart lines hold their stock and appending never repeats a product in a cart"""
+    from seed import generate
+    from app.models.cart import CartItem
+    from app.models.user import User
+    
+    user = User(email='shopper@example.com', first_name='Shop', last_name='Per', role='user')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    
+    generate(carts=1, progress=False)
+    generate(carts=1, progress=False)
+    
+    lines = CartItem.query.filter_by(user_id=user.id).all()
+    reservations = StockReservation.query.filter_by(user_id=user.id).all()
+    assert len(lines) == 1
+    assert [(r.product_id, r.quantity) for r in reservations] == [(lines[0].product_id, lines[0].quantity)]
+    db.session.expire_all()
+    assert db.session.get(Product, sample_product.id).total_reserved == lines[0].quantity
@@ -0,0 +1,76 @@
+"""
+Load Shedding Tests
+"""
+import time
+
+from app.middleware.load_shedding import LoadShedder
+from app.prometheus import registry
+
+
+def test_low_priority_shed_first(app, client, auth_headers, sample_product):
+    """Test catalog reads are shed at half the limit while other requests and checkout pass"""
+    shedder = LoadShedder(max_in_flight=4, min_in_flight=4, retry_after=3)
+    app.extensions['load_shedder'] = shedder
+    shedder.in_flight = 2
+    
+    response = client.get('/api/products')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert response.json['reason'] == 'concurrency'
+    
+    assert client.get('/api/orders', headers=auth_headers).status_code == 200
+    
+    shedder.in_flight = 10
+    assert client.get('/api/orders', headers=auth_headers).status_code == 503
+    # Checkout and probes are never shed
+    assert client.post('/api/orders/checkout', headers=auth_headers, json={}).status_code == 400
+    assert client.get('/livez').status_code == 200
+    
+    assert shedder.in_flight == 10
+    assert shedder.stats()['shed'] == {'low:concurrency': 1, 'normal:concurrency': 1}
+    assert 'requests_shed_total{priority="low",reason="concurrency"}' in registry.render()
+
+
+def test_shed_on_queue_time(app, client, sample_product):
+    """Test requests that waited too long in the proxy are shed"""
+    app.extensions['load_shedder'] = LoadShedder(queue_time_ms=100)
+    
+    waited = {'X-Request-Start': f't={time.time() - 0.15:.3f}'}
+    response = client.get('/api/products', headers=waited)
+    assert response.status_code == 503
+    assert response.json['reason'] == 'queue_time'
+    
+    # Normal priority tolerates twice the queue time
+    assert client.get('/api/status', headers=waited).status_code == 200
+    assert client.get('/api/products', headers={'X-Request-Start': f't={time.time():.3f}'}).status_code == 200
+
+
+def test_per_client_in_flight_cap():
+    """Test one client cannot hold more than its share of in-flight requests"""
+    shedder = LoadShedder(user_max_in_flight=2)
+    
+    assert shedder.admit('normal', 'user:1') is None
+    assert shedder.admit('low', 'user:1') is None
+    assert shedder.admit('normal', 'user:1') == 'user_limit'
+    assert shedder.admit('normal', 'user:2') is None
+    assert shedder.admit('critical', None) is None
+    
+    shedder.release('normal', 'user:1', 0.01)
+    assert shedder.admit('normal', 'user:1') is None
+    assert shedder.stats()['clients'] == 2
+
+
+def test_limit_adapts_to_latency():
+    """Test slow requests shrink the limit down to the minimum and fast ones grow it back"""
+    shedder = LoadShedder(max_in_flight=20, min_in_flight=5, latency_target_ms=100)
+    
+    for _ in range(50):
+        shedder.admit('normal', 'user:1')
+        shedder.release('normal', 'user:1', 0.5)
+    assert shedder.limit == 5
+    
+    for _ in range(500):
+        shedder.admit('normal', 'user:1')
+        shedder.release('normal', 'user:1', 0.01)
+    assert shedder.limit == 20
+    assert shedder.in_flight == 0
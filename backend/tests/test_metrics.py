@@ -0,0 +1,200 @@
+"""
+Metrics Tests
+"""
+from app.prometheus import MmapDict, MultiprocessValues, PrometheusRegistry, registry
+
+
+def test_metrics_endpoint_exposes_request_metrics(client, sample_product):
+    """Test /metrics reports per-endpoint request counts, latency and query counts"""
+    client.get('/api/products')
+    client.get('/api/products')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert 'http_requests_total{endpoint="products.get_products",method="GET",status="200"}' in text
+    assert 'http_request_duration_seconds_bucket{endpoint="products.get_products",method="GET",status="200",le="+Inf"}' in text
+    assert 'db_queries_per_request_count{endpoint="products.get_products"}' in text
+    assert 'response_cache_requests_total{result="hit"}' in text
+    assert 'http_requests_in_flight 1' in text
+
+
+def test_compression_time_exposed(client, admin_headers, sample_product):
+    """Test compression time of whole and streamed bodies is recorded on /metrics"""
+    from app import db
+    from app.models.product import Product
+    
+    # Enough products for the listing to pass COMPRESSION_MIN_SIZE
+    db.session.add_all(Product(name=f'Product {n}', description='x' * 200, price=1, category='Test') for n in range(5))
+    db.session.commit()
+    response = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    response = client.get('/api/admin/orders/export', headers={**admin_headers, 'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    response.get_data()  # Runs the streamed body through the compressor
+    response.close()
+    
+    text = client.get('/metrics').get_data(as_text=True)
+    
+    assert '# TYPE compression_seconds histogram' in text
+    assert 'compression_seconds_count{encoding="gzip",streamed="false"}' in text
+    assert 'compression_seconds_count{encoding="gzip",streamed="true"}' in text
+
+
+def test_metrics_admin(client, admin_headers):
+    """Test the admin metrics report the response cache and coalescing stats"""
+    response = client.get('/api/admin/metrics', headers=admin_headers)
+    
+    assert response.status_code == 200
+    assert 'response_cache' in response.json
+    assert 'single_flight' in response.json
+
+
+def test_multiprocess_values_sum_worker_files(tmp_path):
+    """Test samples written by several processes are summed on collect"""
+    test_registry = PrometheusRegistry()
+    counter = test_registry.counter('orders', 'Orders placed', ('status',))
+    test_registry.configure(str(tmp_path))
+
+    counter.inc(status='ok')
+    own_file = next(tmp_path.glob('counter_*.db'))
+    # A second worker's file
+    other = MmapDict(str(tmp_path / 'counter_999999.db'))
+    for key, value in MmapDict.read_all(own_file):
+        other.set(key, value * 2)
+    other.close()
+
+    assert isinstance(test_registry.values, MultiprocessValues)
+    assert 'orders_total{status="ok"} 3\n' in test_registry.render()
+
+
+def test_mmap_dict_grows_and_reopens(tmp_path):
+    """Test values survive the file growing and being reopened"""
+    path = str(tmp_path / 'counter_1.db')
+    values = MmapDict(path)
+    for n in range(3000):
+        values.set(f'key-{n}', float(n))
+    values.close()
+
+    reopened = MmapDict(path)
+    assert reopened.get('key-2999') == 2999.0
+    assert len(MmapDict.read_all(path)) == 3000
+    assert registry.metrics['http_requests'].labelnames == ('endpoint', 'method', 'status')
+
+
+def test_repeated_statement_shapes_flagged(app, sample_product):
+    """Test per-row lookups of the same shape are reported as N+1 candidates"""
+    from app import db
+    from app.models.product import Product
+    from app.querytrace import normalize, record_queries
+
+    with record_queries() as recorder:
+        for _ in range(5):
+            db.session.expire_all()
+            db.session.get(Product, sample_product.id)
+
+    shape = normalize("SELECT * FROM products WHERE id IN (?, ?, ?) AND name = 'x' LIMIT 10")
+    assert shape == 'SELECT * FROM products WHERE id IN (?) AND name = ? LIMIT ?'
+    assert list(recorder.repeated(5).values()) == [5]
+
+
+def test_admin_profile_header(app, client, admin_headers, auth_headers, tmp_path):
+    """Test admins can profile a request and download the pstats file; others are ignored"""
+    import pstats
+    from app.profiling import ProfileStore, get_profiler
+
+    get_profiler().store = ProfileStore(str(tmp_path))
+
+    response = client.get('/api/products', headers={**auth_headers, 'X-Profile': '1'})
+    assert 'X-Profile-Id' not in response.headers
+
+    response = client.get('/api/products', headers={**admin_headers, 'X-Profile': '1'})
+    name = response.headers['X-Profile-Id']
+    assert name.endswith('.pstats')
+
+    listed = client.get('/api/admin/profiles', headers=admin_headers).json['profiles']
+    assert [profile['name'] for profile in listed] == [name]
+
+    download = client.get(f'/api/admin/profiles/{name}', headers=admin_headers)
+    assert download.status_code == 200
+    (tmp_path / 'copy.pstats').write_bytes(download.data)
+    assert pstats.Stats(str(tmp_path / 'copy.pstats')).total_calls > 0
+
+    assert client.get('/api/admin/profiles/..%2Fsecret.pstats', headers=admin_headers).status_code == 404
+
+
+def test_stack_sampler_and_ring_buffer(tmp_path):
+    """Test sampled stacks are saved as collapsed stacks and old profiles are pruned"""
+    import threading
+    from app.profiling import ProfileStore, StackSampler
+
+    sampler = StackSampler(interval=60, grace=0)
+    sampler.track(threading.get_ident())
+    sampler.sample()
+    stacks = sampler.untrack(threading.get_ident())
+    assert any('test_stack_sampler_and_ring_buffer' in stack for stack in stacks)
+
+    store = ProfileStore(str(tmp_path), max_files=2)
+    names = [store.save_collapsed(stacks, 'orders.checkout', 1.5) for _ in range(3)]
+    assert len(store.list()) == 2
+    assert (tmp_path / names[-1]).read_text().endswith(' 1\n')
+
+
+def test_request_id_header(client):
+    """Test request ids are echoed back, or generated when missing"""
+    assert client.get('/api/status', headers={'X-Request-ID': 'abc123'}).headers['X-Request-ID'] == 'abc123'
+    assert len(client.get('/api/status').headers['X-Request-ID']) == 32
+
+
+def test_log_queue_drops_when_full():
+    """Test a full log queue drops and counts records instead of blocking"""
+    import logging
+    import threading
+    from app.logs import DroppingQueueHandler
+
+    release = threading.Event()
+    written = []
+
+    class SlowHandler(logging.Handler):
+        def emit(self, record):
+            release.wait(5)
+            written.append(record.getMessage())
+
+    handler = DroppingQueueHandler([SlowHandler()], maxsize=1)
+    logger = logging.getLogger('test.log_queue')
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for n in range(5):
+            logger.warning("record %s", n)
+        assert handler.dropped >= 3
+    finally:
+        release.set()
+        handler.stop()
+        logger.removeHandler(handler)
+
+    assert written[0] == 'record 0'
+    assert len(written) + handler.dropped == 5
+
+
+def test_json_log_records_and_sampling():
+    """Test JSON records carry extra fields and sampling only drops INFO records"""
+    import json
+    import logging
+    from app.logs import JsonFormatter, SamplingFilter
+
+    sampler = SamplingFilter({'app.routes.cart': 0.0})
+    info = logging.LogRecord('app.routes.cart', logging.INFO, __file__, 1, "Item added: %s", (7,), None)
+    warning = logging.LogRecord('app.routes.cart', logging.WARNING, __file__, 1, "Stock low", (), None)
+    other = logging.LogRecord('app.routes.orders', logging.INFO, __file__, 1, "Order created", (), None)
+    assert not sampler.filter(info)
+    assert sampler.filter(warning) and sampler.filter(other)
+
+    info.request_id = 'abc'
+    info.latency_ms = 1.5
+    entry = json.loads(JsonFormatter().format(info))
+    assert entry['message'] == 'Item added: 7'
+    assert entry['request_id'] == 'abc' and entry['latency_ms'] == 1.5
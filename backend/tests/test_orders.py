@@ -0,0 +1,229 @@
+"""
+Order Tests
+"""
+import pytest
+
+
+def test_checkout_empty_cart(client, auth_headers):
+    """Test checkout with an empty cart"""
+    response = client.post('/api/orders/checkout', headers=auth_headers, json={})
+    
+    assert response.status_code == 400
+
+
+def test_checkout_success(client, auth_headers, sample_product):
+    """Test checkout creates an order, payment and decrements stock"""
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 2})
+    
+    response = client.post('/api/orders/checkout',
+        headers=auth_headers,
+        json={'shipping_address': '1 Test Street', 'payment_method': 'credit_card'}
+    )
+    
+    assert response.status_code == 201
+    order = response.json['order']
+    assert order['status'] == 'processing'
+    assert order['total_amount'] == pytest.approx(99.99 * 2)
+    assert order['payment']['payment_status'] == 'completed'
+    assert client.get('/api/cart', headers=auth_headers).json['count'] == 0
+    
+    product = client.get(f'/api/products/{sample_product.id}').json['product']
+    assert product['stock_quantity'] == 8
+    assert product['available_quantity'] == 8
+
+
+def test_cancel_order_restores_stock(client, auth_headers, sample_product):
+    """Test cancelling an order restores stock and refunds payment"""
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 3})
+    order_id = client.post('/api/orders/checkout', headers=auth_headers, json={}).json['order']['id']
+    
+    response = client.post(f'/api/orders/{order_id}/cancel', headers=auth_headers)
+    
+    assert response.status_code == 200
+    order = client.get(f'/api/orders/{order_id}', headers=auth_headers).json['order']
+    assert order['status'] == 'cancelled'
+    assert order['payment']['payment_status'] == 'refunded'
+    product = client.get(f'/api/products/{sample_product.id}').json['product']
+    assert product['stock_quantity'] == 10
+
+
+def test_concurrent_cancels_restock_once(app, auth_headers, sample_product):
+    """Test two simultaneous cancels of one order restore its stock only once"""
+    import threading
+    
+    client = app.test_client()
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 3})
+    order_id = client.post('/api/orders/checkout', headers=auth_headers, json={}).json['order']['id']
+    
+    barrier = threading.Barrier(2)
+    statuses = []
+    
+    def cancel():
+        racer = app.test_client()
+        barrier.wait()
+        statuses.append(racer.post(f'/api/orders/{order_id}/cancel', headers=auth_headers).status_code)
+    
+    threads = [threading.Thread(target=cancel) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert sorted(statuses) == [200, 400]
+    product = client.get(f'/api/products/{sample_product.id}').json['product']
+    assert product['stock_quantity'] == 10
+
+
+def test_checkout_sold_out_short_circuit(app, client, auth_headers, sample_product):
+    """Test checkout of a product known to be sold out is rejected immediately"""
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 1})
+    app.extensions['admission'].mark_sold_out(sample_product.id)
+    
+    response = client.post('/api/orders/checkout', headers=auth_headers, json={})
+    
+    assert response.status_code == 503
+    assert response.json['reason'] == 'sold_out'
+    assert response.headers['Retry-After'] == '5'
+    assert 'sold out' in response.json['error']
+
+
+def test_checkout_admission_rejects_when_busy(app, client, auth_headers, sample_product):
+    """Test checkout returns 503 with Retry-After when no slot frees up in time"""
+    from app.services.admission import AdmissionController
+    
+    controller = AdmissionController(global_limit=1, max_queue=1, timeout=0.01)
+    app.extensions['admission'] = controller
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 1})
+    
+    with controller.admit({sample_product.id}):
+        response = client.post('/api/orders/checkout', headers=auth_headers, json={})
+    
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    assert controller.stats()['global']['timeouts'] == 1
+
+
+def test_admission_gate_is_fifo():
+    """Test waiting requests are admitted in arrival order"""
+    import threading
+    import time
+    from app.services.admission import Gate
+    
+    gate = Gate(limit=1, max_queue=10)
+    gate.acquire(timeout=1)
+    order = []
+    
+    def waiter(name):
+        gate.acquire(timeout=5)
+        order.append(name)
+        gate.release()
+    
+    threads = []
+    for name in range(3):
+        thread = threading.Thread(target=waiter, args=(name,))
+        thread.start()
+        threads.append(thread)
+        while gate.queue_depth <= name:
+            time.sleep(0.001)
+    
+    gate.release()
+    for thread in threads:
+        thread.join()
+    
+    assert order == [0, 1, 2]
+    assert gate.stats()['active'] == 0
+
+
+def test_admission_product_gate_outlives_pending_requests():
+    """Test a product gate is not replaced while a request that looked it up has yet to queue on it"""
+    from app.services.admission import AdmissionController, AdmissionRejected
+    
+    controller = AdmissionController(global_limit=2, product_limit=1, timeout=0.05)
+    with controller.admit({1}):
+        # A second checkout has looked the gate up but not queued on it yet
+        gate = controller._product_gate(1)
+    
+    gate.acquire(timeout=1)
+    with pytest.raises(AdmissionRejected):
+        with controller.admit({1}):
+            pass
+    
+    gate.release()
+    controller._unref(1, gate)
+    assert controller.stats()['products'] == {}
+
+
+def test_admission_stats_admin(client, admin_headers):
+    """Test admission metrics endpoint"""
+    response = client.get('/api/admin/admission', headers=admin_headers)
+    
+    assert response.status_code == 200
+    assert response.json['queue_depth'] == 0
+
+
+def test_get_orders_sparse_fields(client, auth_headers, sample_product):
+    """Test ?fields= on order history, including the items relation"""
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 1})
+    client.post('/api/orders/checkout', headers=auth_headers, json={})
+    
+    summary = client.get('/api/orders?fields=id,status', headers=auth_headers).json['orders'][0]
+    assert set(summary) == {'id', 'status'}
+    
+    with_items = client.get('/api/orders?fields=id,items', headers=auth_headers).json['orders'][0]
+    assert with_items['items'][0]['product']['name'] == 'Test Product'
+    assert with_items['items'][0]['subtotal'] == pytest.approx(99.99)
+
+
+def test_get_orders_conditional(client, auth_headers, sample_product):
+    """Test order list ETags are per user and change after checkout"""
+    response = client.get('/api/orders', headers=auth_headers)
+    etag = response.headers['ETag']
+    assert 'Authorization' in response.headers['Vary']
+    
+    assert client.get('/api/orders', headers={**auth_headers, 'If-None-Match': etag}).status_code == 304
+    
+    client.post('/api/cart/add', headers=auth_headers, json={'product_id': sample_product.id, 'quantity': 1})
+    client.post('/api/orders/checkout', headers=auth_headers, json={})
+    
+    response = client.get('/api/orders', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.json['orders']) == 1
+
+
+def test_export_orders_csv(client, auth_headers, admin_headers, sample_product):
+    """Test the admin CSV export streams one row per order"""
+    for _ in range(2):
+        client.post('/api/cart/add', headers=auth_headers, json={'product_id': sample_product.id, 'quantity': 1})
+        client.post('/api/orders/checkout', headers=auth_headers, json={})
+    
+    response = client.get('/api/admin/orders/export?fields=id,status,total_amount', headers=admin_headers)
+    
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'id,total_amount,status'
+    assert len(lines) == 3
+
+
+def test_get_orders_query_budget(client, auth_headers, query_budget):
+    """Test listing orders with items and payments costs the same queries for 1 or many orders"""
+    from app import db
+    from app.models.product import Product
+    
+    products = [Product(name=f'Budget {n}', price=5.0, stock_quantity=10) for n in range(6)]
+    db.session.add_all(products)
+    db.session.commit()
+    for product in products:
+        client.post('/api/cart/add', headers=auth_headers, json={'product_id': product.id, 'quantity': 1})
+        client.post('/api/orders/checkout', headers=auth_headers, json={})
+    
+    with query_budget(7):
+        response = client.get('/api/orders', headers=auth_headers)
+    
+    assert len(response.json['orders']) == 6
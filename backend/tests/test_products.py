@@ -71,3 +71,195 @@ def test_delete_product_admin(client, admin_headers, sample_product):
     )
     
     assert response.status_code == 200
+
+
+def test_enable_stock_shards(client, admin_headers, sample_product):
+    """Test splitting a product's stock across shard counters"""
+    response = client.put(f'/api/admin/products/{sample_product.id}/stock-shards',
+        headers=admin_headers,
+        json={'shards': 3}
+    )
+    
+    assert response.status_code == 200
+    assert sorted(shard['quantity'] for shard in response.json['shards']) == [3, 3, 4]
+    assert response.json['product']['stock_quantity'] == 10
+    assert client.get(f'/api/products/{sample_product.id}').json['product']['stock_quantity'] == 10
+
+
+def test_sharded_stock_checkout_and_admin_edit(client, admin_headers, auth_headers, sample_product):
+    """Test cart, checkout and the admin stock editor on sharded stock"""
+    client.put(f'/api/admin/products/{sample_product.id}/stock-shards',
+               headers=admin_headers, json={'shards': 4})
+    
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 2})
+    assert client.get('/api/cart', headers=auth_headers).json['cart_items'][0]['product']['available_quantity'] == 8
+    assert client.post('/api/orders/checkout', headers=auth_headers, json={}).status_code == 201
+    
+    product = client.get(f'/api/products/{sample_product.id}').json['product']
+    assert product['stock_quantity'] == 8
+    assert product['available_quantity'] == 8
+    
+    response = client.put(f'/api/products/{sample_product.id}',
+                          headers=admin_headers, json={'stock_quantity': 21})
+    assert response.json['product']['stock_quantity'] == 21
+
+
+def test_rebalance_stock_shards(client, admin_headers, sample_product):
+    """Test the rebalancer evens out skewed shards"""
+    from app import db
+    from app.models.product import ProductStockShard
+    
+    client.put(f'/api/admin/products/{sample_product.id}/stock-shards',
+               headers=admin_headers, json={'shards': 2})
+    shards = ProductStockShard.query.filter_by(product_id=sample_product.id).all()
+    shards[0].quantity, shards[1].quantity = 10, 0
+    db.session.commit()
+    
+    response = client.post(f'/api/admin/products/{sample_product.id}/stock-shards/rebalance',
+                           headers=admin_headers)
+    
+    assert response.status_code == 200
+    assert [shard['quantity'] for shard in response.json['shards']] == [5, 5]
+
+
+def test_disable_stock_shards(client, admin_headers, sample_product):
+    """Test folding shard counters back into the product row"""
+    client.put(f'/api/admin/products/{sample_product.id}/stock-shards',
+               headers=admin_headers, json={'shards': 3})
+    
+    response = client.put(f'/api/admin/products/{sample_product.id}/stock-shards',
+                          headers=admin_headers, json={'shards': 0})
+    
+    assert response.status_code == 200
+    assert response.json['shards'] == []
+    assert response.json['product']['stock_quantity'] == 10
+
+
+def test_get_products_sparse_fields(client, sample_product):
+    """Test ?fields= limits the serialized product fields"""
+    response = client.get('/api/products?fields=id,name,price')
+    
+    assert response.status_code == 200
+    assert response.json['products'] == [{'id': sample_product.id, 'name': 'Test Product', 'price': 99.99}]
+
+
+def test_get_products_unknown_field(client, sample_product):
+    """Test ?fields= with an unknown field is rejected"""
+    response = client.get('/api/products?fields=id,password_hash')
+    
+    assert response.status_code == 400
+    assert 'password_hash' in response.json['error']
+
+
+def test_get_products_conditional(client, admin_headers, sample_product):
+    """Test ETag revalidation returns 304 until the catalog changes"""
+    response = client.get('/api/products')
+    etag = response.headers['ETag']
+    
+    assert etag.startswith('W/')
+    assert response.headers['Cache-Control'] == 'public, no-cache'
+    
+    response = client.get('/api/products', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    
+    client.put(f'/api/products/{sample_product.id}', headers=admin_headers, json={'price': 10.0})
+    
+    response = client.get('/api/products', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_get_product_conditional_after_stock_change(client, auth_headers, sample_product):
+    """Test a reservation changes the product's ETag"""
+    etag = client.get(f'/api/products/{sample_product.id}').headers['ETag']
+    
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 1})
+    
+    response = client.get(f'/api/products/{sample_product.id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['product']['available_quantity'] == 9
+
+
+def test_get_products_compressed(client, sample_product):
+    """Test large catalog responses are gzipped and served from the compressed cache"""
+    import gzip
+    from app import db
+    from app.models.product import Product
+    
+    db.session.add_all([Product(name=f'Product {i}', description='x' * 100, price=1.0, stock_quantity=5)
+                        for i in range(20)])
+    db.session.commit()
+    
+    plain = client.get('/api/products')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    
+    for _ in range(2):
+        response = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data) == plain.data
+    
+    entry = client.application.extensions['response_cache'].peek(plain.get_etag()[0])
+    assert 'gzip' in entry.variants
+
+
+def test_small_responses_not_compressed(client, sample_product):
+    """Test responses under the size threshold are sent as is"""
+    response = client.get('/api/products/categories', headers={'Accept-Encoding': 'gzip'})
+    
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_warm_up_primes_catalog_cache(app, sample_product):
+    """Test the pre-fork warm-up caches the catalog responses"""
+    from app.warmup import warm_up
+    
+    warm_up(app)
+    
+    assert app.extensions['response_cache'].stats()['entries'] == 2
+
+
+def test_sharded_stock_splits_quantities_across_shards(app, client, admin_headers, auth_headers, sample_product):
+    """Test orders and holds larger than any one shard's share still succeed"""
+    from app import db
+    from app.models.product import Product
+    from app.models.user import User
+    from app.services import inventory
+    
+    client.put(f'/api/admin/products/{sample_product.id}/stock-shards',
+               headers=admin_headers, json={'shards': 4})
+    user = User.query.filter_by(email='test@example.com').one()
+    
+    assert inventory.consume(user.id, sample_product.id, 5)
+    db.session.commit()
+    assert inventory.reserve(user.id, sample_product.id, 4)
+    db.session.commit()
+    
+    product = db.session.get(Product, sample_product.id)
+    db.session.refresh(product)
+    assert product.total_stock == 5
+    assert product.total_reserved == 4
+    assert all(0 <= shard.reserved_quantity <= shard.quantity for shard in product.stock_shards)
+    
+    # Not more than the stock left over all shards
+    assert not inventory.consume(user.id, sample_product.id, 6)
+    db.session.rollback()
+
+
+def test_stock_cannot_be_set_below_reserved(client, admin_headers, auth_headers, sample_product):
+    """Test the stock editor rejects a stock level below the units held in carts"""
+    client.post('/api/cart/add', headers=auth_headers,
+                json={'product_id': sample_product.id, 'quantity': 2})
+    
+    response = client.put(f'/api/products/{sample_product.id}', headers=admin_headers, json={'stock_quantity': 1})
+    assert response.status_code == 400
+    
+    client.put(f'/api/admin/products/{sample_product.id}/stock-shards',
+               headers=admin_headers, json={'shards': 2})
+    response = client.put(f'/api/products/{sample_product.id}', headers=admin_headers, json={'stock_quantity': 1})
+    assert response.status_code == 400
+    assert client.get(f'/api/products/{sample_product.id}').json['product']['stock_quantity'] == 10
@@ -0,0 +1,184 @@
+"""
+User Sharding Tests
+"""
+import pytest
+from app import create_app, db
+from app.models.order import Order
+from app.models.user import User
+from app.sharding import HashRing, SHARD_ID_SPAN, create_shard_schema, get_shard_router, use_shard
+from config import TestingConfig
+
+sqlite_only = pytest.mark.skipif(
+    not TestingConfig.SQLALCHEMY_DATABASE_URI.startswith('sqlite'), reason='SQLite shard files'
+)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, reset_database):
+    """Application with a second user shard in its own SQLite file"""
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_BINDS', {'shard_1': f"sqlite:///{tmp_path / 'shard_1.db'}"})
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        create_shard_schema(get_shard_router().engine(1), 1, db.metadata)
+        yield app
+        db.session.remove()
+        reset_database()
+    db.metadatas.pop('shard_1', None)
+
+
+def login_user_on_shard(client, shard):
+    """Create users until one lands on ``shard`` and return its auth headers"""
+    router = get_shard_router()
+    for n in range(100):
+        user = User(email=f'shard{shard}-{n}@example.com', first_name='Shard', last_name=str(n), role='user')
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+        if router.shard_for_user(user.id) == shard:
+            break
+
+    response = client.post('/api/auth/login', json={'email': user.email, 'password': 'password123'})
+    return user.id, {'Authorization': f"Bearer {response.json['access_token']}"}
+
+
+def place_order(client, headers, product_id):
+    client.post('/api/cart/add', headers=headers, json={'product_id': product_id, 'quantity': 1})
+    response = client.post('/api/orders/checkout', headers=headers, json={'shipping_address': '1 Main St'})
+    assert response.status_code == 201
+    return response.json['order']['id']
+
+
+def test_hash_ring_moves_few_keys():
+    """Test adding a shard only moves keys onto the new shard"""
+    before, after = HashRing(2), HashRing(3)
+    moved = [key for key in range(3000) if before.shard_for(key) != after.shard_for(key)]
+
+    assert all(after.shard_for(key) == 2 for key in moved)
+    assert 500 < len(moved) < 1500
+
+
+@sqlite_only
+def test_orders_stored_on_user_shard(client, sample_product):
+    """Test each user's cart and orders live on their shard, with shard-ranged ids"""
+    user_0, headers_0 = login_user_on_shard(client, 0)
+    user_1, headers_1 = login_user_on_shard(client, 1)
+
+    order_0 = place_order(client, headers_0, sample_product.id)
+    order_1 = place_order(client, headers_1, sample_product.id)
+
+    assert order_0 < SHARD_ID_SPAN <= order_1
+    with use_shard(0):
+        assert [order.user_id for order in Order.query.all()] == [user_0]
+    with use_shard(1):
+        assert [order.user_id for order in Order.query.all()] == [user_1]
+
+    response = client.get(f'/api/orders/{order_1}', headers=headers_1)
+    assert response.status_code == 200
+    assert response.json['order']['items'][0]['product']['name'] == 'Test Product'
+
+
+@sqlite_only
+def test_admin_views_gather_all_shards(client, admin_headers, sample_product):
+    """Test admin order views and status updates cover every shard"""
+    _, headers_0 = login_user_on_shard(client, 0)
+    _, headers_1 = login_user_on_shard(client, 1)
+    first = place_order(client, headers_0, sample_product.id)
+    second = place_order(client, headers_1, sample_product.id)
+
+    response = client.get('/api/admin/orders?fields=id,status', headers=admin_headers)
+    assert [order['id'] for order in response.json['orders']] == [second, first]
+    assert 'created_at' not in response.json['orders'][0]
+
+    response = client.get('/api/admin/dashboard', headers=admin_headers)
+    assert response.json['statistics']['total_orders'] == 2
+
+    response = client.put(f'/api/admin/orders/{second}/status', headers=admin_headers, json={'status': 'shipped'})
+    assert response.status_code == 200
+    assert response.json['order']['status'] == 'shipped'
+
+
+@sqlite_only
+def test_move_users_between_shards(client, sample_product):
+    """Test rebalancing copies a user's orders to the new shard and removes them from the old one"""
+    from rebalance_shards import move_users
+
+    user_id, headers = login_user_on_shard(client, 0)
+    order_id = place_order(client, headers, sample_product.id)
+    router = get_shard_router()
+
+    counts = move_users(router.engine(0), router.engine(1), [user_id])
+
+    assert counts == {'orders': 1, 'order_items': 1, 'payments': 1, 'cart_items': 0}
+    db.session.expire_all()
+    with use_shard(0):
+        assert db.session.get(Order, order_id) is None
+    with use_shard(1):
+        assert len(db.session.get(Order, order_id).order_items) == 1
+
+
+@sqlite_only
+def test_checkout_keeps_stock_when_shard_commit_fails(client, sample_product):
+    """Test a failed commit on the order's shard leaves the stock and reservation untouched"""
+    from sqlalchemy import event
+    
+    from app.models.product import Product
+    
+    product_id = sample_product.id
+    user_id, headers = login_user_on_shard(client, 1)
+    client.post('/api/cart/add', headers=headers, json={'product_id': product_id, 'quantity': 2})
+    engine = get_shard_router().engine(1)
+    
+    def fail_commit(connection):
+        raise RuntimeError('shard unavailable')
+    
+    event.listen(engine, 'commit', fail_commit)
+    try:
+        response = client.post('/api/orders/checkout', headers=headers, json={'shipping_address': '1 Main St'})
+    finally:
+        event.remove(engine, 'commit', fail_commit)
+    
+    assert response.status_code == 500
+    product = db.session.get(Product, product_id)
+    assert (product.total_stock, product.total_reserved) == (10, 2)
+    with use_shard(1):
+        assert Order.query.count() == 0
+    
+    response = client.post('/api/orders/checkout', headers=headers, json={'shipping_address': '1 Main St'})
+    assert response.status_code == 201
+    db.session.expire_all()
+    assert (product.total_stock, product.total_reserved) == (8, 0)
+
+
+@sqlite_only
+def test_cancel_can_be_retried_when_restock_fails(client, sample_product):
+    """Test a cancel whose stock cannot be returned puts the order back so it can be retried"""
+    from sqlalchemy import event
+    from app.models.product import Product
+    
+    product_id = sample_product.id
+    _, headers = login_user_on_shard(client, 1)
+    order_id = place_order(client, headers, product_id)
+    
+    def fail_commit(connection):
+        raise RuntimeError('stock database unavailable')
+    
+    # Stock is on the default database
+    event.listen(db.engine, 'commit', fail_commit)
+    try:
+        response = client.post(f'/api/orders/{order_id}/cancel', headers=headers)
+    finally:
+        event.remove(db.engine, 'commit', fail_commit)
+    
+    assert response.status_code == 500
+    db.session.expire_all()
+    with use_shard(1):
+        order = db.session.get(Order, order_id)
+        assert (order.status, order.payment.payment_status) == ('processing', 'completed')
+    assert db.session.get(Product, product_id).total_stock == 9
+    
+    response = client.post(f'/api/orders/{order_id}/cancel', headers=headers)
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert db.session.get(Product, product_id).total_stock == 10
@@ -73,6 +73,16 @@ async function apiRequest(endpoint, options = {}) {
     }
 }
 
+// Several API calls in one round trip. Each request is {method, path, body}; returns
+// [{status, body}, ...] in the same order. Independent GETs run concurrently on the server.
+async function apiBatch(requests) {
+    const data = await apiRequest('/batch', {
+        method: 'POST',
+        body: JSON.stringify({ parallel: true, requests })
+    });
+    return data.responses;
+}
+
 // Authentication Functions
 async function login(email, password) {
     try {
@@ -183,7 +193,7 @@ async function deleteProduct(productId) {
 // Cart Functions
 async function getCart() {
     try {
-        const data = await apiRequest('/cart');
+        const data = await apiRequest('/cart?view=slim');
         state.cart = data.cart_items;
         updateCartBadge();
         return data;
@@ -394,6 +404,7 @@ function formatDate(dateString) {
 // Export for use in other files
 window.app = {
     state,
+    apiBatch,
     login,
     register,
     logout,